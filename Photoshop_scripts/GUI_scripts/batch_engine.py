@@ -0,0 +1,198 @@
+"""
+Batch Engine
+-----------
+Spreads headless compositing across a pool of worker processes.
+- Each worker opens its own backend once and reuses it for every image
+- State the backend can share (the decoded template) is set up once in
+  shared memory rather than loaded again by every worker
+- Only a bounded number of images are in flight at a time, so memory
+  stays flat no matter how large the folder is
+- Results and log lines are reported in the original file order,
+  through the same status callback process_images uses
+
+Run this file directly to benchmark images/sec against worker count:
+    python batch_engine.py [image_count]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from log_sink import INFO, StatusLog
+from mask_cache import MaskCache
+from preset_registry import PresetRegistry
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+
+def _init_worker(backend_cls, backend_options: Dict, template_path: str, watermark_path: str,
+                 operations: Set[str], presets: PresetRegistry,
+                 log_level: int = INFO, shared=None, jpeg_profile=None, mask_cache_dir=None):
+    """Open one backend per worker process"""
+    from image_processor import ImageProcessor
+
+    processor = ImageProcessor(template_path, watermark_path)
+    backend = backend_cls(template_path, watermark_path, **backend_options)
+    if jpeg_profile:
+        backend.jpeg_profile = jpeg_profile
+    if shared is not None:
+        backend.attach_shared(shared)
+    if mask_cache_dir:
+        # Read-only here; headless workers apply masks but never add them
+        backend.mask_cache = MaskCache(mask_cache_dir, read_only=True)
+    backend.open(log=StatusLog(level=log_level, echo=False))
+
+    _worker.update(
+        processor=processor,
+        backend=backend,
+        operations=operations,
+        presets=presets,
+        log_level=log_level
+    )
+
+
+def _process_in_worker(root: str, file: str) -> Tuple[Optional[str], List[str], Optional[str]]:
+    """Process one image, returning (output_path, log lines, error)"""
+    lines = []
+    log = StatusLog(lines.append, level=_worker['log_level'], echo=False)
+    _worker['backend'].log = log
+    try:
+        output_path = _worker['processor']._process_file(
+            _worker['backend'], root, file,
+            _worker['operations'], _worker['presets'], log
+        )
+        return output_path, lines, None
+    except Exception as e:
+        try:
+            _worker['backend'].reset_document()
+        except:
+            pass
+        return None, lines, str(e)
+
+
+class BatchEngine:
+    """Runs ImageProcessor._process_file for many images on a process pool"""
+
+    def __init__(self, workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        # Two images per worker keeps every worker busy without queueing the whole folder
+        self.max_in_flight = max_in_flight or self.workers * 2
+
+    def run(self,
+            processor,
+            backend,
+            files_to_process: List[Tuple[str, str]],
+            operations: Set[str],
+            presets: PresetRegistry,
+            log: StatusLog,
+            control=None,
+            on_result: Optional[Callable[[int, Optional[str], Optional[str]], None]] = None) -> List[Optional[str]]:
+        """
+        Process every (root, file) pair and return the output paths in input order
+        (None for images that failed). control (a RunControl) can pause the run,
+        which stops new images being handed out, or cancel it. on_result is
+        called with (index, output_path, error) as each image is reported.
+        """
+        total_files = len(files_to_process)
+        results: List[Optional[str]] = [None] * total_files
+        finished = {}
+        next_to_report = 0
+
+        initargs = (
+            type(backend), backend.worker_options(), backend.template_path, backend.watermark_path,
+            operations, presets, log.level,
+            backend.export_shared(log), backend.jpeg_profile,
+            backend.mask_cache.cache_dir if backend.mask_cache else None
+        )
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=initargs) as pool:
+            pending = {}
+            queued = iter(enumerate(files_to_process))
+
+            def submit_next() -> bool:
+                if control:
+                    control.checkpoint()
+                for index, (root, file) in queued:
+                    pending[pool.submit(_process_in_worker, root, file)] = index
+                    return True
+                return False
+
+            while len(pending) < self.max_in_flight and submit_next():
+                pass
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future.result()
+                    submit_next()
+
+                # Report in file order so the status pane reads the same as a serial run
+                while next_to_report in finished:
+                    output_path, lines, error = finished.pop(next_to_report)
+                    file = files_to_process[next_to_report][1]
+                    log(f"Processing {next_to_report + 1}/{total_files}: {file}")
+                    for line in lines:
+                        log(line)
+                    if error:
+                        log(f"Error processing {file}: {error}")
+                    results[next_to_report] = output_path
+                    if on_result:
+                        on_result(next_to_report, output_path, error)
+                    next_to_report += 1
+                    if control:
+                        control.progress(next_to_report, total_files)
+
+        return results
+
+
+def run_benchmark(image_count: int = 1000, worker_counts: Optional[List[int]] = None):
+    """Print images/sec for each worker count on a synthetic folder"""
+    import contextlib
+    import io
+    import tempfile
+
+    import numpy as np
+    from PIL import Image
+
+    from headless_backend import HeadlessBackend
+    from image_processor import ImageProcessor
+
+    worker_counts = worker_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+    with tempfile.TemporaryDirectory() as tmp:
+        template_path = os.path.join(tmp, "template.png")
+        watermark_path = os.path.join(tmp, "watermark.png")
+        folder = os.path.join(tmp, "mockups")
+        os.makedirs(folder)
+
+        Image.new("RGB", (1200, 1200), (240, 236, 230)).save(template_path)
+        watermark = np.zeros((200, 600, 4), dtype=np.uint8)
+        watermark[40:160, 40:560] = (255, 255, 255, 255)
+        Image.fromarray(watermark).save(watermark_path)
+
+        rng = np.random.default_rng(0)
+        contexts = ["front", "context-1-front", "context-2-front"]
+        for i in range(image_count):
+            pixels = rng.integers(0, 255, (800, 800, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(os.path.join(folder, f"mockup-{i}_label={contexts[i % 3]}.jpg"))
+
+        processor = ImageProcessor(template_path, watermark_path)
+        processor.set_watermark_settings({'size': [600, 200], 'position': [300, 950], 'opacity': 30})
+        operations = {"Add Watermark ONLY"}
+
+        print(f"{image_count} images, 800x800 onto 1200x1200")
+        for workers in worker_counts:
+            backend = HeadlessBackend(template_path, watermark_path)
+            start = time.perf_counter()
+            # process_images prints every log line, keep the table readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                processor.process_images(folder, False, operations, {},
+                                         backend=backend, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"workers={workers:<3} {image_count / elapsed:8.1f} images/sec  ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
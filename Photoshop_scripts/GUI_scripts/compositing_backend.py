@@ -0,0 +1,143 @@
+"""
+Compositing Backend
+-----------------
+Defines the interface ImageProcessor uses to build an output image:
+- Place a mockup image on the template
+- Remove its background, or place it with a cached background mask
+- Resize, move and fade the placed layer
+- Place the watermark
+- Save the result as a JPEG and reset to the clean template
+
+Each engine (Photoshop, headless Pillow/NumPy) implements these steps,
+so process_images does not need to know which one is doing the work.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+from jpeg_encoder import JpegEncoder, JpegProfile, get_profile
+from log_sink import StatusLog, as_status_log
+from mask_cache import DEFAULT_METHOD, MaskCache
+
+
+class CompositingBackend:
+    """Base class for the engines that compose images onto the template"""
+
+    name = "base"
+    # Whether the engine can run the "remove_bg" step on its own
+    supports_background_removal = False
+    # Whether independent copies can run in worker processes at the same time
+    supports_parallel = False
+    # Whether save_jpeg can hand its pixels to a JpegEncoder and return before they are written
+    supports_async_encode = False
+    # Whether calls go to an external application that can hang, so they run under a PhotoshopWatchdog
+    needs_watchdog = False
+    # mask_cache method of the masks remove_background makes
+    mask_method = DEFAULT_METHOD
+
+    def __init__(self, template_path: str, watermark_path: str):
+        self.template_path = template_path
+        self.watermark_path = watermark_path
+        self.log: StatusLog = as_status_log()
+        self.jpeg_profile: JpegProfile = get_profile(None)
+        # Set by process_images for backends that support async encoding
+        self.encoder: Optional[JpegEncoder] = None
+        # Set by process_images when background masks are cached
+        self.mask_cache: Optional[MaskCache] = None
+
+    def open(self, log: Optional[Callable[[str], None]] = None):
+        """Prepare the template document for a processing run"""
+        if log:
+            self.log = as_status_log(log)
+
+    def close(self):
+        """Release the template document"""
+        pass
+
+    def export_shared(self, log):
+        """
+        Picklable state (e.g. the decoded template) for worker processes to
+        attach to instead of loading it themselves; None if there is none
+        """
+        return None
+
+    def attach_shared(self, shared):
+        """In a worker process, before open(): use state from export_shared"""
+        pass
+
+    def abandon_session(self, thread_id: int):
+        """
+        After a call hung on thread thread_id and was abandoned: drop the
+        session it used, so the next open() starts a new one
+        """
+        pass
+
+    def worker_options(self) -> Dict:
+        """Picklable keyword arguments to construct the same backend in a worker process"""
+        return {}
+
+    def cache_settings(self) -> Dict:
+        """Engine options that change the output pixels, for result cache keys and run journals"""
+        return {}
+
+    def place_image(self, image_path: str):
+        """Place an image on the template and return its layer"""
+        raise NotImplementedError
+
+    def place_masked(self, image_path: str, mask_key: str):
+        """
+        Place an image with its cached background mask already applied, in
+        place of place_image + remove_background, and return its layer
+        """
+        return self.place_image(self.mask_cache.masked_source(mask_key, image_path))
+
+    def remove_background(self, layer):
+        """Remove the background from a placed layer"""
+        raise NotImplementedError(
+            f"The {self.name} backend cannot remove backgrounds"
+        )
+
+    def mask_keys(self, image_path: str) -> List[str]:
+        """
+        mask_cache keys to look up for an image, best first: Photoshop's mask,
+        then one made by this engine. capture_mask stores under the last one.
+        """
+        keys = [self.mask_cache.key_for(image_path)]
+        if self.mask_method != DEFAULT_METHOD:
+            keys.append(self.mask_cache.key_for(image_path, self.mask_method))
+        return keys
+
+    def capture_mask(self, layer, image_path: str, mask_key: str):
+        """After remove_background: store the layer's mask in mask_cache under mask_key"""
+        pass
+
+    def transform_layer(self, layer, size: List[float], position: List[float], opacity: float = 100,
+                        rotate: float = 0):
+        """
+        Resize, move, rotate and fade a placed layer
+
+        Args:
+            layer: Layer returned by place_image
+            size: [width %, height %] relative to the layer's current bounds
+            position: [x, y] target for the top-left corner of the layer bounds
+            opacity: Layer opacity from 0 to 100
+            rotate: Degrees clockwise about the layer's centre, after the move
+        """
+        raise NotImplementedError
+
+    def place_watermark(self, settings: Dict):
+        """
+        Place the watermark using settings with 'size' ([width, height] in
+        pixels), 'position' ([x, y]) and 'opacity'
+        """
+        raise NotImplementedError
+
+    def save_jpeg(self, output_path: str):
+        """Save the current composition as a JPEG"""
+        raise NotImplementedError
+
+    def reset_document(self):
+        """
+        Return the document to the clean template in one operation, so the
+        cost does not depend on how many layers the last image added
+        """
+        raise NotImplementedError
@@ -0,0 +1,43 @@
+"""
+Context Parser
+------------
+Reads the image context from Printify mockup file names, e.g.
+    be-abstract-1-camera_label=context-1-front.jpg -> context-1-front
+
+Shared by the GUI, ImageProcessor and the mass scripts. Unlike slicing
+filename[find('label=') + 6:-4], it handles .jpeg and other extension
+lengths, and returns no context for names without 'label='.
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+# <product>_label=<context>.<ext>; the product part and separator are optional
+_NAME_PATTERN = re.compile(
+    r"^(?P<product>.*?)[_-]?label=(?P<context>[^\\/]+?)\.(?P<extension>jpe?g|png)$",
+    re.IGNORECASE
+)
+_IMAGE_PATTERN = re.compile(r"\.(jpe?g|png)$", re.IGNORECASE)
+
+
+class ParsedName(NamedTuple):
+    product: str
+    context: Optional[str]
+    extension: str
+
+
+def parse_filename(filename: str) -> Optional[ParsedName]:
+    """Split a mockup file name into product, context and extension; None if not an image"""
+    match = _NAME_PATTERN.match(filename)
+    if match:
+        return ParsedName(match.group('product'), match.group('context'), match.group('extension').lower())
+    image = _IMAGE_PATTERN.search(filename)
+    if not image:
+        return None
+    return ParsedName(filename[:image.start()], None, image.group(1).lower())
+
+
+def extract_context(filename: str) -> Optional[str]:
+    """Context of a mockup file name, or None if it has no label"""
+    parsed = parse_filename(filename)
+    return parsed.context if parsed else None
@@ -3,68 +3,133 @@ Context Placement Handler
 -----------------------
 Handles the interactive placement of images in Photoshop,
 allowing users to set and save placement settings for each context.
+Placements can also be set on a low-resolution proxy in the GUI
+(placement_preview) without opening Photoshop.
 """
 
+import copy
 import os
-import json
-from photoshop import Session
-import time
 from typing import Dict, Optional, Tuple
+from ps_wait import PhotoshopWaiter
+from jsx_executor import restore_snapshot_script
+from ps_session import SessionPool
+from placement_preview import PlacementProxy
+from mask_cache import MaskCache
+from settings_store import SettingsStore
+from preset_registry import image_size
+from bg_removal import BackgroundTooComplex, FlatBackgroundRemover
 
 class ContextPlacementHandler:
-    def __init__(self, template_path: str, watermark_path: str = None, settings_path: str = None):
+    def __init__(self,
+                 template_path: str,
+                 watermark_path: str = None,
+                 settings_path: str = None,
+                 session_pool: Optional[SessionPool] = None,
+                 mask_cache: Optional[MaskCache] = None):
         self.template_path = template_path
         self.watermark_path = watermark_path
         self.settings_path = settings_path or os.path.join(
             os.getcwd(), 
             "Photoshop_scripts/settings/context_placements.json"
         )
-        self._ensure_settings_file()
+        # Read once; saves are written through atomically
+        self.settings = SettingsStore(self.settings_path)
         self.current_settings = None  # Store current unconfirmed settings
         self.current_image_path = None  # Store path of current image being processed
+        self.waiter = PhotoshopWaiter()  # Polls Photoshop state instead of fixed sleeps
+        self.session_pool = session_pool or SessionPool()  # Keeps the template open between placements
+        self.mask_cache = mask_cache  # Skips remove_bg for samples whose background was removed before
+        self.preview_remover = FlatBackgroundRemover()  # For proxy previews of samples without a cached mask
+        self._template_sizes: Dict[str, Tuple[int, int]] = {}  # The template can be swapped while open
         
-    def _ensure_settings_file(self):
-        """Ensure settings directory and file exist"""
-        os.makedirs(os.path.dirname(self.settings_path), exist_ok=True)
-        if not os.path.exists(self.settings_path):
-            with open(self.settings_path, 'w') as f:
-                json.dump({}, f)
-    
     def get_placement_settings(self, context: str) -> Optional[Dict]:
         """Get saved placement settings for a context"""
-        try:
-            with open(self.settings_path, 'r') as f:
-                settings = json.load(f)
-                return settings.get(context)
-        except:
-            return None
+        return self.settings.get(context)
     
-    def save_placement_settings(self, context: str, settings: Dict):
-        """Save placement settings for a context"""
-        try:
-            with open(self.settings_path, 'r') as f:
-                all_settings = json.load(f)
-        except:
-            all_settings = {}
-            
-        all_settings[context] = settings
+    def template_size(self) -> Tuple[int, int]:
+        """Pixel size of the template placements are set on, read from its header once"""
+        size = self._template_sizes.get(self.template_path)
+        if size is None:
+            size = self._template_sizes[self.template_path] = image_size(self.template_path)
+        return size
+    
+    def save_placement_settings(self, context: str, settings: Dict) -> Dict:
+        """
+        Save placement settings for a context and return the saved copy. Inside
+        `with handler.settings.batch():` several saves are written to disk once.
+        
+        Settings without a 'template_size' are stamped with this template's,
+        so they can be rendered onto templates of other sizes. The caller's
+        dict (and its watermark, which "Copy Settings To All" shares) is left
+        as it is.
+        """
+        settings = copy.deepcopy(settings)
+        if 'template_size' not in settings:
+            settings['template_size'] = list(self.template_size())
+        if isinstance(settings.get('watermark'), dict) and 'template_size' not in settings['watermark']:
+            settings['watermark']['template_size'] = settings['template_size']
+        self.settings.set(context, settings)
+        return settings
+    
+    def _output_path(self, image_path: str) -> str:
+        """Where processing will write the sample's output"""
+        output_dir = os.path.join(os.path.dirname(image_path), "processed_output")
+        os.makedirs(output_dir, exist_ok=True)
+        return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(image_path))[0]}-processed.jpg")
+    
+    def create_preview(self, image_path: str, with_watermark: bool = False,
+                       watermark_settings: Optional[Dict] = None) -> PlacementProxy:
+        """
+        Place the sample (and the watermark, if positioned per context) on a
+        proxy of the template, for PlacementPreviewWindow. The sample's
+        background is removed first, as in a real run: with its cached mask
+        if there is one, else with preview_remover. A sample whose
+        background neither can remove is refused (ValueError), since sizes
+        measured against the whole image would be wrong.
+        
+        Args:
+            image_path: Path to the sample image
+            with_watermark: Also place the watermark for individual positioning
+            watermark_settings: Starting watermark position, e.g. the default one
+        """
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Sample image not found: {image_path}")
+        if not os.path.exists(self.template_path):
+            raise FileNotFoundError(f"Template file not found: {self.template_path}")
         
-        with open(self.settings_path, 'w') as f:
-            json.dump(all_settings, f, indent=2)
+        proxy = PlacementProxy(self.template_path)
+        mask_key = self.mask_cache.key_for(image_path) if self.mask_cache else None
+        if mask_key and self.mask_cache.lookup(mask_key):
+            proxy.place_image(self.mask_cache.masked_source(mask_key, image_path))
+            self.mask_cache.save()
+        else:
+            try:
+                proxy.place_image(image_path, bg_remover=self.preview_remover)
+            except BackgroundTooComplex as e:
+                raise ValueError(f"{str(e)}; set this placement in Photoshop (without the proxy preview) "
+                                 f"so its background can be removed there")
+        if with_watermark:
+            proxy.place_watermark(self.watermark_path, watermark_settings)
+        return proxy
+    
+    def save_preview_placement(self, context: str, image_path: str, proxy: PlacementProxy) -> Dict:
+        """Store a proxy placement, in template pixels, like a confirmed Photoshop placement"""
+        settings = proxy.placement_settings()
+        settings['output_path'] = self._output_path(image_path)
+        return self.save_placement_settings(context, settings)
     
     def capture_placement_settings(self, context: str, sample_image_path: str) -> Dict:
         """
         Open Photoshop with template and sample image to capture placement settings.
         Returns the captured settings.
         """
-        with Session(self.template_path, action="open") as ps:
-            ps.app.displayDialogs = ps.DialogModes.DisplayNoDialogs
-            
+        with self.session_pool.session(self.template_path) as ps:
             # Import sample image
+            layers_before = len(ps.active_document.artLayers)
             desc = ps.ActionDescriptor
             desc.putPath(ps.app.charIDToTypeID("null"), sample_image_path)
             ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
-            time.sleep(1.5)
+            self.waiter.for_layer_count(ps.active_document, layers_before + 1)
             
             # Get the active layer (the imported image)
             img_layer = ps.active_document.activeLayer
@@ -122,9 +187,6 @@ class ContextPlacementHandler:
             image_path: Path to the sample image
             context: Context identifier (e.g., 'front', 'back')
         """
-        # Add delay before starting new session
-        time.sleep(2)
-        
         # Store current image path
         self.current_image_path = image_path
         
@@ -139,24 +201,39 @@ class ContextPlacementHandler:
         template_path = os.path.normpath(self.template_path)
         
         try:
-            with Session(self.template_path, action="open") as ps:
-                ps.app.displayDialogs = ps.DialogModes.DisplayNoDialogs
-                
-                # 1. Import image and remove background
+            # The pool hands out the clean template, already snapshotted for confirm_placement
+            with self.session_pool.session(self.template_path) as ps:
+                # 1. Import image and remove background (or place it with its cached mask)
+                mask_key = self.mask_cache.key_for(image_path) if self.mask_cache else None
+                cached_mask = bool(mask_key and self.mask_cache.lookup(mask_key))
                 desc = ps.ActionDescriptor
-                desc.putPath(ps.app.charIDToTypeID("null"), image_path)
+                desc.putPath(
+                    ps.app.charIDToTypeID("null"),
+                    self.mask_cache.masked_source(mask_key, image_path) if cached_mask else image_path
+                )
                 ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
-                time.sleep(1.5)  # Wait for import
                 
-                # Get the imported layer
-                if len(ps.active_document.artLayers) < 2:
+                # Wait for the imported layer
+                try:
+                    self.waiter.for_layer_count(ps.active_document, 2)
+                except Exception:
                     raise Exception("Failed to import image layer")
                     
                 img_layer = ps.active_document.artLayers[0]
                 
-                # Remove background
-                ps.app.doAction("remove_bg", "Default Actions")
-                time.sleep(1.5)  # Wait for background removal
+                if not cached_mask:
+                    placed_bounds = list(img_layer.bounds) if mask_key else None
+                    
+                    # Remove background
+                    ps.app.doAction("remove_bg", "Default Actions")
+                    self.waiter.for_stable_bounds(img_layer, "remove_bg")  # Wait for background removal
+                    
+                    if mask_key:
+                        try:
+                            self.mask_cache.capture(ps.app, mask_key, image_path, placed_bounds)
+                            self.mask_cache.save()
+                        except Exception as e:
+                            print(f"Could not cache the background mask: {str(e)}")
                 
                 # Store initial state after background removal
                 initial_bounds = img_layer.bounds
@@ -174,6 +251,7 @@ class ContextPlacementHandler:
                     'layer': img_layer,
                     'initial_bounds': initial_bounds,
                     'ps_session': ps,
+                    'has_snapshot': self.session_pool.has_snapshot(self.template_path),
                     'has_watermark': False  # Track if watermark has been added
                 }
                 
@@ -183,8 +261,6 @@ class ContextPlacementHandler:
             print(f"Image path: {image_path}")
             print(f"Template path: {self.template_path}")
             self.current_settings = None
-            # Add delay on error
-            time.sleep(2)
             raise
     
     def start_watermark_placement(self):
@@ -194,10 +270,12 @@ class ContextPlacementHandler:
             
         try:
             # Add watermark to the session
-            desc = self.current_settings['ps_session'].ActionDescriptor
-            desc.putPath(self.current_settings['ps_session'].app.charIDToTypeID("null"), self.watermark_path)
-            self.current_settings['ps_session'].app.executeAction(self.current_settings['ps_session'].app.charIDToTypeID("Plc "), desc)
-            time.sleep(1.5)
+            ps = self.current_settings['ps_session']
+            layers_before = len(ps.active_document.artLayers)
+            desc = ps.ActionDescriptor
+            desc.putPath(ps.app.charIDToTypeID("null"), self.watermark_path)
+            ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
+            self.waiter.for_layer_count(ps.active_document, layers_before + 1, "place watermark")
             
             # Mark that watermark has been added to the session
             self.current_settings['has_watermark'] = True
@@ -263,18 +341,8 @@ class ContextPlacementHandler:
                         'opacity': watermark_layer.opacity
                     }
                     
-                    # Create output directory and prepare path
-                    output_dir = os.path.join(os.path.dirname(self.current_image_path), "processed_output")
-                    os.makedirs(output_dir, exist_ok=True)
-                    output_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(self.current_image_path))[0]}-processed.jpg")
-                    
                     # Store output path in settings for UI feedback
-                    settings['output_path'] = output_path
-                    
-                    # Clean up
-                    while len(ps.active_document.artLayers) > 1:  # Keep template layer
-                        ps.active_document.artLayers[0].remove()
-                        time.sleep(0.5)  # Small delay between layer removals
+                    settings['output_path'] = self._output_path(self.current_image_path)
                 
             except Exception as e:
                 print(f"Warning during layer property access: {str(e)}")
@@ -287,6 +355,10 @@ class ContextPlacementHandler:
             
             # Only clear current settings if we're done with both image and watermark
             if self.current_settings.get('has_watermark'):
+                try:
+                    self._reset_template(ps, self.current_settings.get('has_snapshot'))
+                except Exception as e:
+                    print(f"Warning: could not clear the placement layers: {str(e)}")
                 self.current_settings = None
                 self.current_image_path = None
             
@@ -299,6 +371,17 @@ class ContextPlacementHandler:
                 self.current_image_path = None
             raise
     
+    def _reset_template(self, ps, has_snapshot: bool):
+        """Return the template to its snapshot, or remove the placed layers if it has none"""
+        if has_snapshot:
+            ps.app.doJavaScript(restore_snapshot_script())
+            return
+        document = ps.active_document
+        while len(document.artLayers) > 1:
+            count_before = len(document.artLayers)
+            document.artLayers[0].remove()
+            self.waiter.for_layer_removed(document, count_before)
+    
     def has_active_session(self) -> bool:
         """Check if there's an active placement session"""
         if not self.current_settings:
@@ -0,0 +1,500 @@
+"""
+Fake Photoshop
+-------------
+In-process stand-in for the parts of photoshop-python-api we use, so the
+processor and the mass scripts can be run and timed without Photoshop
+(e.g. on Linux).
+
+- FakeApplication holds an in-memory document model: documents, art
+  layers with bounds and opacity, history snapshots
+- Place ("Plc " executeAction), the "remove_bg" action, resize, translate,
+  rotate, layer removal, saveAs and property reads each charge a
+  configurable latency. It is slept for real and also added up, so
+  wall time minus simulated time is the orchestration overhead
+- FakeSession mirrors Session(file_path, action="open"); use it as a
+  SessionPool factory, or install() it as the photoshop module for scripts
+  that import Session themselves
+- doJavaScript understands the template snapshot/restore scripts only;
+  full JSX batches (PhotoshopJsxBackend) are run against a stub DOM
+  under node by tests/test_jsx_executor.py
+
+Run this file directly to benchmark orchestration overhead:
+    python fake_photoshop.py [image_count] [latency_scale]
+"""
+
+import collections
+import functools
+import json
+import os
+import re
+import sys
+import time
+import types
+from typing import Dict, List, Optional
+
+# Seconds charged per operation, roughly what a mid-size template costs in Photoshop
+DEFAULT_LATENCIES = {
+    'attach': 0.5,  # Dispatch("Photoshop.Application")
+    'open': 2.0,  # Opening the template
+    'place': 0.35,
+    'remove_bg': 1.5,
+    'resize': 0.08,
+    'translate': 0.05,
+    'rotate': 0.08,
+    'remove_layer': 0.05,
+    'get': 0.003,  # Reading a property over COM
+    'set': 0.01,  # Setting a property over COM
+    'save': 0.4,
+    'javascript': 0.05,
+}
+
+# Canvas and placed-image size when a file cannot be read
+DEFAULT_SIZE = (2000, 2000)
+
+
+class FakeScriptError(Exception):
+    """Raised for ExtendScript the fake cannot run"""
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def _image_size(path: str):
+    try:
+        from PIL import Image
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return DEFAULT_SIZE
+
+
+def char_id(code: str) -> int:
+    """charIDToTypeID for a four-character code"""
+    return int.from_bytes(code.encode("ascii"), "big")
+
+
+class FakeApplication:
+    """The Photoshop application: open documents and the latency clock"""
+
+    def __init__(self, latencies: Optional[Dict[str, float]] = None, realtime: bool = True):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.realtime = realtime
+        self.documents: List["FakeDocument"] = []
+        self.activeDocument: Optional["FakeDocument"] = None
+        self.displayDialogs = None
+        self.preferences = types.SimpleNamespace(rulerUnits=None)
+        self.calls = collections.Counter()
+        self.simulated_seconds = 0.0
+
+    def spend(self, operation: str):
+        """Charge one operation's latency"""
+        seconds = self.latencies.get(operation, 0.0)
+        self.calls[operation] += 1
+        self.simulated_seconds += seconds
+        if self.realtime and seconds:
+            time.sleep(seconds)
+
+    def reset_clock(self):
+        self.calls.clear()
+        self.simulated_seconds = 0.0
+
+    def charIDToTypeID(self, code: str) -> int:
+        return char_id(code)
+
+    def stringIDToTypeID(self, name: str) -> int:
+        return hash(name) & 0xFFFFFFFF
+
+    def open(self, path: str) -> "FakeDocument":
+        self.spend('open')
+        for document in self.documents:
+            if os.path.normcase(document.fullName) == os.path.normcase(path):
+                self.activeDocument = document
+                return document
+        document = FakeDocument(self, path, *_image_size(path))
+        self.documents.append(document)
+        self.activeDocument = document
+        return document
+
+    def executeAction(self, type_id: int, descriptor=None, mode=None):
+        if type_id != char_id("Plc "):
+            raise FakeScriptError(f"Unsupported action {type_id}")
+        self.spend('place')
+        self.activeDocument.place(descriptor.path)
+
+    def doAction(self, action: str, action_set: str):
+        if action != "remove_bg":
+            raise FakeScriptError(f"Unknown action {action} in {action_set}")
+        self.spend('remove_bg')
+        self.activeDocument.activeLayer.remove_background()
+
+    def doJavaScript(self, script: str, arguments=None, mode=None) -> str:
+        self.spend('javascript')
+        document = self.activeDocument
+        if "result.step" not in script:
+            name = re.search(r'putString\(charIDToTypeID\("Nm  "\), ("[^"]*")\)', script)
+            if name and 'SnpS' in script:
+                document.snapshots[json.loads(name.group(1))] = document.save_state()
+                return "ok"
+            name = re.search(r'historyStates\.getByName\(("[^"]*")\)', script)
+            if name:
+                document.restore_state(json.loads(name.group(1)))
+                return ""
+        raise FakeScriptError("The fake Photoshop only runs the template snapshot scripts")
+
+
+class FakeLayer:
+    """An art layer: bounds [left, top, right, bottom], opacity and name"""
+
+    def __init__(self, document: "FakeDocument", name: str, bounds: List[float]):
+        self._document = document
+        self._name = name
+        self._bounds = [float(b) for b in bounds]
+        self._opacity = 100.0
+        self.removed = False
+
+    @property
+    def _app(self) -> FakeApplication:
+        return self._document.app
+
+    @property
+    def name(self) -> str:
+        self._app.spend('get')
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        self._app.spend('set')
+        self._name = value
+
+    @property
+    def bounds(self) -> List[float]:
+        self._app.spend('get')
+        return list(self._bounds)
+
+    @property
+    def opacity(self) -> float:
+        self._app.spend('get')
+        return self._opacity
+
+    @opacity.setter
+    def opacity(self, value: float):
+        self._app.spend('set')
+        self._opacity = float(value)
+
+    def resize(self, width_percent: float, height_percent: float, anchor=None):
+        """Scale about the layer centre (Photoshop's default anchor)"""
+        self._app.spend('resize')
+        left, top, right, bottom = self._bounds
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        half_w = (right - left) * width_percent / 200
+        half_h = (bottom - top) * height_percent / 200
+        self._bounds = [cx - half_w, cy - half_h, cx + half_w, cy + half_h]
+
+    def translate(self, dx: float, dy: float):
+        self._app.spend('translate')
+        left, top, right, bottom = self._bounds
+        self._bounds = [left + dx, top + dy, right + dx, bottom + dy]
+
+    def rotate(self, angle: float, anchor=None):
+        """Rotate about the centre; bounds become the rotated box's bounding box"""
+        import math
+        self._app.spend('rotate')
+        left, top, right, bottom = self._bounds
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        w, h = right - left, bottom - top
+        cos, sin = abs(math.cos(math.radians(angle))), abs(math.sin(math.radians(angle)))
+        half_w, half_h = (w * cos + h * sin) / 2, (w * sin + h * cos) / 2
+        self._bounds = [cx - half_w, cy - half_h, cx + half_w, cy + half_h]
+
+    def remove_background(self):
+        """Trim 10% off each side, as if the background around the product was cleared"""
+        left, top, right, bottom = self._bounds
+        dx, dy = (right - left) * 0.1, (bottom - top) * 0.1
+        self._bounds = [left + dx, top + dy, right - dx, bottom - dy]
+
+    def remove(self):
+        self._app.spend('remove_layer')
+        self._document.remove_layer(self)
+
+
+class FakeArtLayers:
+    """document.artLayers: index 0 is the top layer"""
+
+    def __init__(self, document: "FakeDocument"):
+        self._document = document
+
+    def __len__(self) -> int:
+        self._document.app.spend('get')
+        return len(self._document.layers)
+
+    def __getitem__(self, index: int) -> FakeLayer:
+        self._document.app.spend('get')
+        return self._document.layers[index]
+
+    def __iter__(self):
+        return iter(list(self._document.layers))
+
+    def getByName(self, name: str) -> FakeLayer:
+        self._document.app.spend('get')
+        for layer in self._document.layers:
+            if layer._name == name:
+                return layer
+        raise KeyError(name)
+
+
+class FakeDocument:
+    def __init__(self, app: FakeApplication, path: str, width: int, height: int):
+        self.app = app
+        self.fullName = path
+        self.width = width
+        self.height = height
+        self.layers: List[FakeLayer] = [FakeLayer(self, "Background", [0, 0, width, height])]
+        self.snapshots: Dict[str, List] = {}
+        self.saved: List[str] = []
+        self.closed = False
+
+    @property
+    def name(self) -> str:
+        if self.closed:
+            raise RuntimeError("The document has been closed")
+        self.app.spend('get')
+        return os.path.basename(self.fullName)
+
+    @property
+    def artLayers(self) -> FakeArtLayers:
+        return FakeArtLayers(self)
+
+    @property
+    def activeLayer(self) -> FakeLayer:
+        self.app.spend('get')
+        return self.layers[0]
+
+    def place(self, path: str):
+        """Add a layer centred on the canvas, scaled down to fit like Photoshop's place"""
+        width, height = _image_size(path)
+        scale = min(1.0, self.width / width, self.height / height)
+        width, height = width * scale, height * scale
+        left, top = (self.width - width) / 2, (self.height - height) / 2
+        name = os.path.splitext(os.path.basename(path))[0]
+        self.layers.insert(0, FakeLayer(self, name, [left, top, left + width, top + height]))
+
+    def remove_layer(self, layer: FakeLayer):
+        self.layers.remove(layer)
+        layer.removed = True
+
+    def save_state(self) -> List:
+        return [(layer, list(layer._bounds), layer._opacity, layer._name) for layer in self.layers]
+
+    def restore_state(self, snapshot: str):
+        if snapshot not in self.snapshots:
+            raise FakeScriptError(f"No snapshot named {snapshot}")
+        self.layers = []
+        for layer, bounds, opacity, name in self.snapshots[snapshot]:
+            layer._bounds, layer._opacity, layer._name = list(bounds), opacity, name
+            self.layers.append(layer)
+
+    def saveAs(self, path: str, options=None, asCopy: bool = True):
+        """Write a JSON description of the layers instead of a JPEG"""
+        self.app.spend('save')
+        with open(path, 'w') as f:
+            json.dump({
+                'quality': getattr(options, 'quality', None),
+                'layers': [[layer._name, layer._bounds, layer._opacity] for layer in self.layers]
+            }, f)
+        self.saved.append(path)
+
+    def close(self, saving=None):
+        self.closed = True
+        if self in self.app.documents:
+            self.app.documents.remove(self)
+        if self.app.activeDocument is self:
+            self.app.activeDocument = self.app.documents[-1] if self.app.documents else None
+
+
+class FakeActionDescriptor:
+    def __init__(self):
+        self.path = None
+
+    def putPath(self, key: int, path: str):
+        self.path = path
+
+
+class FakeJPEGSaveOptions:
+    def __init__(self, quality: int = 12, **kwargs):
+        self.quality = quality
+
+
+class FakeDialogModes:
+    DisplayNoDialogs = 3
+    DisplayErrorDialogs = 2
+    DisplayAllDialogs = 1
+
+
+class FakeAnchorPosition:
+    TopLeft = 1
+    MiddleCenter = 5
+
+
+# Shared like the single Photoshop process; pass app= for an isolated one
+_default_app: Optional[FakeApplication] = None
+
+
+def default_app() -> FakeApplication:
+    global _default_app
+    if _default_app is None:
+        _default_app = FakeApplication()
+    return _default_app
+
+
+class FakeSession:
+    """Stand-in for photoshop.Session"""
+
+    JPEGSaveOptions = FakeJPEGSaveOptions
+    DialogModes = FakeDialogModes
+    AnchorPosition = FakeAnchorPosition
+
+    def __init__(self, file_path: str = None, action: str = None, callback=None,
+                 auto_close: bool = False, app: Optional[FakeApplication] = None):
+        self.path = file_path
+        self._action = action
+        self._callback = callback
+        self._auto_close = auto_close
+        self.app = app or default_app()
+        self.app.spend('attach')
+
+    @property
+    def ActionDescriptor(self) -> FakeActionDescriptor:
+        # The scripts use ps.ActionDescriptor as an instance, a new one per access
+        return FakeActionDescriptor()
+
+    @property
+    def active_document(self) -> FakeDocument:
+        if self.app.activeDocument is None:
+            raise RuntimeError("No active document available")
+        return self.app.activeDocument
+
+    @active_document.setter
+    def active_document(self, document: FakeDocument):
+        self.app.spend('set')
+        self.app.activeDocument = document
+
+    def __enter__(self):
+        if self._action == "open":
+            self.app.open(self.path)
+        if self._callback:
+            self._callback(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._auto_close and self.app.activeDocument:
+            self.app.activeDocument.close()
+
+
+def install(app: Optional[FakeApplication] = None) -> types.ModuleType:
+    """Register a fake photoshop module so `from photoshop import Session` gets FakeSession"""
+    if app is not None:
+        global _default_app
+        _default_app = app
+    module = types.ModuleType("photoshop")
+    module.Session = FakeSession
+    module.FakeApplication = FakeApplication
+    sys.modules["photoshop"] = module
+    return module
+
+
+def run_benchmark(image_count: int = 50, latency_scale: float = 0.1):
+    """
+    Time ImageProcessor (step-by-step Photoshop backend) and the v2 mass
+    script against the fake, and split wall time into simulated Photoshop
+    time and orchestration overhead.
+    """
+    import contextlib
+    import importlib.util
+    import io
+    import tempfile
+
+    from PIL import Image
+
+    latencies = {name: seconds * latency_scale for name, seconds in DEFAULT_LATENCIES.items()}
+    app = FakeApplication(latencies)
+
+    # Everything below imports Session from photoshop; give it the fake
+    install(app)
+    from image_processor import ImageProcessor
+    from photoshop_backend import PhotoshopBackend
+    from ps_session import SessionPool
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template_path = os.path.join(temp_dir, "template.png")
+        watermark_path = os.path.join(temp_dir, "watermark.png")
+        Image.new("RGB", (2000, 2000), (255, 255, 255)).save(template_path)
+        Image.new("RGBA", (600, 200), (0, 0, 0, 255)).save(watermark_path)
+
+        source_dir = os.path.join(temp_dir, "product")
+        os.makedirs(source_dir)
+        Image.new("RGB", (1500, 1500), (120, 80, 200)).save(os.path.join(source_dir, "sample.jpg"))
+        sample = open(os.path.join(source_dir, "sample.jpg"), 'rb').read()
+        for i in range(image_count):
+            with open(os.path.join(source_dir, f"mockup-{i:04d}_label=context-1-front.jpg"), 'wb') as f:
+                f.write(sample)
+        os.remove(os.path.join(source_dir, "sample.jpg"))
+
+        context_settings = {
+            'context-1-front': {
+                'size': [80, 80],
+                'position': [400, 300],
+                'opacity': 100,
+                'watermark': {'size': [500, 160], 'position': [1400, 1750], 'opacity': 60}
+            }
+        }
+
+        def report(label: str, run):
+            app.reset_clock()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run()
+            wall = time.perf_counter() - start
+            overhead = wall - app.simulated_seconds
+            print(
+                f"{label:<22} {wall:8.2f}s wall  {app.simulated_seconds:8.2f}s Photoshop  "
+                f"{overhead:7.3f}s overhead ({overhead / image_count * 1000:.1f} ms/image, "
+                f"{sum(app.calls.values()) / image_count:.0f} calls/image)"
+            )
+
+        processor = ImageProcessor(template_path, watermark_path,
+                                   session_pool=SessionPool(lambda path, action=None: FakeSession(path, action, app=app)))
+
+        def run_processor():
+            backend = PhotoshopBackend(template_path, watermark_path, session_pool=processor.session_pool)
+            processor.process_images(source_dir, False, {"Custom Placement + Background Removal + Watermark"},
+                                     context_settings, backend=backend)
+
+        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ps_scripts",
+                                   "mass_bg_removal_and_watermarking_script_v2.py")
+        spec = importlib.util.spec_from_file_location("mass_script_v2", script_path)
+        script = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(script)
+
+        def run_script():
+            config = script.Config(source_dir)
+            config.TEMPLATE_PATH = template_path
+            config.ERROR_OUTPUT_LOG_DIR = os.path.join(temp_dir, "errors")
+            config.ERROR_LOG_PATH = os.path.join(config.ERROR_OUTPUT_LOG_DIR, "errors.csv")
+            script_processor = script.ImageProcessor(config, script.ErrorLogger(config))
+            output_dir = os.path.join(temp_dir, "script-output")
+            os.makedirs(output_dir, exist_ok=True)
+            with FakeSession(template_path, action="open", app=app) as ps:
+                for file in sorted(os.listdir(source_dir)):
+                    if file.endswith(".jpg"):
+                        script_processor.process_image(ps, os.path.join(source_dir, file), output_dir)
+
+        print(f"{image_count} images, latency scale {latency_scale}")
+        report("ImageProcessor", run_processor)
+        report("ImageProcessor (warm)", run_processor)
+        report("mass script v2", run_script)
+
+
+if __name__ == "__main__":
+    run_benchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    )
@@ -0,0 +1,261 @@
+"""
+Fan-out Pipeline
+--------------
+Composes every mockup in a folder onto several output targets (template,
+watermark and JPEG profile, e.g. one per marketplace) in a single pass.
+
+- Each source mockup is decoded once, and its background is removed (or
+  its cached mask applied) once, at full size
+- The decoded pixels are shared by every target as they are; each
+  backend folds the fit to its template into the one resample that
+  places the layer
+- Placements are rendered onto each template's size (see
+  preset_registry.py), so one calibration drives every target
+- Each target has its own headless backend, so templates and
+  watermarks are decoded and cached once per target, and its own
+  encoder, so JPEGs are written while the next target is composed
+- Outputs go to processed_output/<target name>/ next to each mockup
+
+Only the headless engine can hold decoded pixels between targets;
+Photoshop runs still go through ImageProcessor.process_images once per
+template.
+
+Run this file directly to compare one fan-out pass against one run per target:
+    python fanout_pipeline.py [image_count] [target_count]
+"""
+
+import os
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from affine_resample import DEFAULT_FILTER
+from headless_backend import HeadlessBackend, HeadlessLayer
+from jpeg_encoder import JpegEncoder, get_profile
+from log_sink import as_status_log
+from mask_cache import MaskCache
+from folder_scanner import FolderIndex
+from preset_registry import PresetRegistry
+from run_control import RunControl
+
+
+class OutputTarget(NamedTuple):
+    name: str  # Output subfolder, e.g. "etsy"
+    template_path: str
+    watermark_path: Optional[str] = None  # None uses the processor's watermark
+    jpeg_profile: Optional[str] = None  # jpeg_encoder profile name; None for the default
+    watermark_settings: Optional[Dict] = None  # Default watermark for this target; None uses the processor's
+
+
+class FanOutPipeline:
+    """Runs ImageProcessor's compositing for every output target from one decode per image"""
+
+    def __init__(self, processor, targets: List[OutputTarget], bg_remover=None, resample: str = DEFAULT_FILTER):
+        """
+        Args:
+            processor: ImageProcessor whose watermark and watermark settings
+                       targets fall back to
+            targets: Where every mockup is composed; names must be unique
+            bg_remover: bg_removal.BackgroundRemover, or None to rely on cached masks
+            resample: affine_resample filter used to place layers on every target
+        """
+        names = [target.name for target in targets]
+        if not targets or len(set(names)) != len(names):
+            raise ValueError("Fan-out targets need unique names")
+        self.processor = processor
+        self.targets = targets
+        self.bg_remover = bg_remover
+        self.resample = resample
+
+    def _open_backends(self, mask_cache: Optional[MaskCache], log) -> Dict[str, HeadlessBackend]:
+        backends = {}
+        for target in self.targets:
+            backend = HeadlessBackend(target.template_path, target.watermark_path or self.processor.watermark_path,
+                                      bg_remover=self.bg_remover, resample=self.resample)
+            backend.jpeg_profile = get_profile(target.jpeg_profile)
+            backend.mask_cache = mask_cache
+            backend.encoder = JpegEncoder(backend.jpeg_profile)
+            backend.open(log)
+            backends[target.name] = backend
+        return backends
+
+    def _decode(self, backend: HeadlessBackend, image_path: str, file: str,
+                removing_bg: bool, log) -> np.ndarray:
+        """Decode a mockup once, with its background removed if the operations need it"""
+        mask_keys = backend.mask_keys(image_path) if removing_bg and backend.mask_cache else []
+        cached_key = backend.mask_cache.lookup_any(mask_keys) if mask_keys else None
+        if cached_key:
+            log(f"Using cached background mask for {file}")
+            return backend.load_source(image_path, cached_key)
+        if removing_bg and not backend.supports_background_removal:
+            raise ValueError(f"No cached background mask for {file}; remove it with Photoshop once first")
+        pixels = backend.load_source(image_path)
+        if removing_bg:
+            log(f"Removing background from {file}")
+            layer = HeadlessLayer(pixels, 0, 0)
+            backend.remove_background(layer)
+            if mask_keys:
+                backend.capture_mask(layer, image_path, mask_keys[-1])
+        return pixels
+
+    def run(self,
+            folder: str,
+            is_mass_mode: bool,
+            operations: Set[str],
+            context_settings: Dict,
+            status_callback=None,
+            mask_cache: Optional[MaskCache] = None,
+            control: Optional[RunControl] = None) -> Dict[str, List[Optional[str]]]:
+        """
+        Compose every image in the folder onto every target. Returns the
+        output paths per target name, in file order (None where it failed).
+        Arguments are as for ImageProcessor.process_images.
+        """
+        log = as_status_log(status_callback)
+        processor = self.processor
+        needs_watermark = ("Add Watermark ONLY" in operations or
+                           "Custom Placement + Background Removal + Watermark" in operations)
+        removing_bg = ("Remove Background ONLY" in operations or
+                       "Custom Placement + Background Removal + Watermark" in operations)
+        if needs_watermark and not processor.watermark_settings and not context_settings and \
+                not all(target.watermark_settings for target in self.targets):
+            raise ValueError("No watermark settings provided")
+        if removing_bg and self.bg_remover is None and not mask_cache:
+            raise ValueError("Background removal needs a local engine or a mask cache for fan-out runs")
+
+        # Normalised once; targets with their own default watermark get their own registry
+        shared_presets = PresetRegistry(context_settings, processor.watermark_settings)
+        presets = {
+            target.name: PresetRegistry(context_settings, target.watermark_settings)
+            if target.watermark_settings else shared_presets
+            for target in self.targets
+        }
+        for error in shared_presets.errors.values():
+            log(f"Warning: {error}; its images will fail")
+
+        files_to_process = FolderIndex(folder).refresh().files_to_process(recursive=is_mass_mode)
+        total_files = len(files_to_process)
+        log(f"Found {total_files} images to process for {len(self.targets)} targets: "
+            f"{', '.join(target.name for target in self.targets)}")
+        results = {target.name: [None] * total_files for target in self.targets}
+        if mask_cache:
+            mask_cache.reset_stats()
+
+        backends = self._open_backends(mask_cache, log)
+        first = backends[self.targets[0].name]
+        pending: List[Tuple[str, int, str, str]] = []  # (target, index, file, output_path) being encoded
+        try:
+            for i, (root, file) in enumerate(files_to_process, 1):
+                if control:
+                    control.checkpoint()
+                log(f"Processing {i}/{total_files}: {file}")
+                image_path = os.path.join(root, file)
+                try:
+                    source = self._decode(first, image_path, file, removing_bg, log)
+                except Exception as e:
+                    log(f"Error processing {file}: {str(e)}")
+                    if control:
+                        control.progress(i, total_files)
+                    continue
+
+                for target in self.targets:
+                    backend = backends[target.name]
+                    output_path = processor._output_path(root, file, target.name)
+                    try:
+                        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                        img_layer = backend.place_pixels(source)
+                        processor._compose(backend, img_layer, file, image_path, output_path,
+                                           operations, presets[target.name], log)
+                        pending.append((target.name, i - 1, file, output_path))
+                    except Exception as e:
+                        log(f"Error processing {file} for {target.name}: {str(e)}")
+                        backend.reset_document()
+                if control:
+                    control.progress(i, total_files)
+        finally:
+            for backend in backends.values():
+                backend.close()
+            failed = {}
+            for target in self.targets:
+                encoder = backends[target.name].encoder
+                encoder.close()
+                failed.update({(target.name, path): error for path, error in encoder.errors.items()})
+                log(f"{target.name}: {encoder.summary()}")
+            for name, index, file, output_path in pending:
+                if (name, output_path) in failed:
+                    log(f"Error saving {file} for {name}: {failed[(name, output_path)]}")
+                else:
+                    results[name][index] = output_path
+            if mask_cache and mask_cache.hits + mask_cache.misses:
+                mask_cache.save()
+                log(mask_cache.summary())
+        return results
+
+
+def run_benchmark(image_count: int = 30, target_count: int = 3):
+    """Print the time for one fan-out pass against one process_images run per target"""
+    import contextlib
+    import io
+    import tempfile
+
+    from PIL import Image
+
+    from bg_removal import FlatBackgroundRemover
+    from image_processor import ImageProcessor
+
+    sizes = [(2000, 2000), (2700, 2025), (2000, 1600), (1500, 1500), (3000, 2000)][:max(1, target_count)]
+    with tempfile.TemporaryDirectory() as tmp:
+        watermark_path = os.path.join(tmp, "watermark.png")
+        watermark = np.zeros((200, 600, 4), dtype=np.uint8)
+        watermark[40:160, 40:560] = (255, 255, 255, 255)
+        Image.fromarray(watermark).save(watermark_path)
+        targets = []
+        for width, height in sizes:
+            template_path = os.path.join(tmp, f"template-{width}x{height}.png")
+            Image.new("RGB", (width, height), (240, 236, 230)).save(template_path)
+            targets.append(OutputTarget(f"{width}x{height}", template_path))
+
+        folder = os.path.join(tmp, "mockups")
+        os.makedirs(folder)
+        rng = np.random.default_rng(0)
+        for i in range(image_count):
+            # A textured garment on a flat backdrop, so background removal has work to do
+            pixels = np.full((2400, 2400, 3), 250, dtype=np.uint8)
+            pixels[400:2000, 500:1900] = rng.integers(0, 200, (1600, 1400, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(os.path.join(folder, f"mockup-{i}_label=front.jpg"), quality=90)
+
+        context_settings = {'front': {'size': [80, 80], 'position': [300, 200], 'opacity': 100,
+                                      'template_size': [2000, 2000]}}
+        operations = {"Custom Placement + Background Removal + Watermark"}
+        processor = ImageProcessor(targets[0].template_path, watermark_path)
+        processor.set_watermark_settings({'size': [600, 200], 'position': [700, 1700], 'opacity': 30,
+                                          'template_size': [2000, 2000]})
+
+        print(f"{image_count} mockups, 2400x2400, onto {len(targets)} templates")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for target in targets:
+                runner = ImageProcessor(target.template_path, watermark_path)
+                runner.set_watermark_settings(processor.watermark_settings)
+                runner.process_images(folder, False, operations, context_settings,
+                                      backend=HeadlessBackend(target.template_path, watermark_path,
+                                                              bg_remover=FlatBackgroundRemover()))
+        separate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            FanOutPipeline(processor, targets, FlatBackgroundRemover()).run(
+                folder, False, operations, context_settings)
+        fanned = time.perf_counter() - start
+
+        per_target = separate / len(targets)
+        print(f"  one run per target: {separate:6.2f}s ({separate / image_count * 1000:.0f} ms/image)")
+        print(f"  fan-out pass:       {fanned:6.2f}s ({fanned / image_count * 1000:.0f} ms/image), "
+              f"{fanned / per_target:.2f}x the cost of one target")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 30,
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 3)
@@ -0,0 +1,188 @@
+"""
+Folder Scanner
+------------
+Builds one index of the images under a root folder so context analysis,
+sample-image lookup and the processing file list do not each walk the
+tree again.
+
+- Uses os.scandir, which returns file sizes and mtimes without extra stat calls
+- The index is saved next to the root folder and refreshed incrementally:
+  a directory whose mtime has not changed keeps its cached listing and its
+  files are only stat'ed, so images overwritten in place (same name, no
+  change to the directory's mtime) still get their new size and mtime
+- Output folders (processed_output and the mass scripts' outputs) are skipped
+- A context -> images map is built in the same pass, so sample lookup is O(1)
+"""
+
+import json
+import os
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from context_parser import extract_context
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Folders written by the processors; their images are outputs, not inputs
+OUTPUT_DIR_NAMES = {"processed_output", "watermarked_output", "script-watermarked-output", "watermarked-output"}
+
+INDEX_VERSION = 1
+
+
+class ImageEntry(NamedTuple):
+    root: str
+    file: str
+    context: Optional[str]
+    size: int
+    mtime_ns: int
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, self.file)
+
+
+def default_index_path(root_folder: str) -> str:
+    """Index file stored beside the root folder, e.g. products/ -> .products.image_index.json"""
+    root_folder = os.path.abspath(root_folder)
+    parent, name = os.path.split(root_folder.rstrip("\\/"))
+    if not name:
+        return os.path.join(root_folder, ".image_index.json")
+    return os.path.join(parent, f".{name}.image_index.json")
+
+
+class FolderIndex:
+    """Persisted index of the images under a root folder"""
+
+    def __init__(self,
+                 root_folder: str,
+                 context_of: Callable[[str], Optional[str]] = extract_context,
+                 index_path: str = None):
+        self.root_folder = os.path.abspath(root_folder)
+        self.context_of = context_of
+        self.index_path = index_path or default_index_path(self.root_folder)
+        # dir path -> {'mtime_ns': int, 'subdirs': [names], 'files': {name: [size, mtime_ns]}}
+        self.dirs: Dict[str, Dict] = {}
+        self.dirs_scanned = 0
+        self.dirs_reused = 0
+        self._entries: Optional[List[ImageEntry]] = None
+        self._context_map: Dict[bool, Dict[str, List[ImageEntry]]] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION and index.get('root') == self.root_folder:
+                self.dirs = index['dirs']
+        except (OSError, ValueError, KeyError):
+            self.dirs = {}
+
+    def save(self):
+        """Write the index beside the root folder (best effort)"""
+        temp_path = self.index_path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'root': self.root_folder, 'dirs': self.dirs}, f)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            pass
+
+    def refresh(self) -> "FolderIndex":
+        """Bring the index up to date, rescanning only directories whose mtime changed"""
+        self.dirs_scanned = 0
+        self.dirs_reused = 0
+        fresh = {}
+        pending = [self.root_folder]
+        while pending:
+            path = pending.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+            cached = self.dirs.get(path)
+            if cached and cached['mtime_ns'] == mtime_ns:
+                listing = self._restat_files(path, cached)
+                self.dirs_reused += 1
+            else:
+                listing = self._scan_dir(path, mtime_ns)
+                self.dirs_scanned += 1
+
+            fresh[path] = listing
+            pending.extend(os.path.join(path, name) for name in listing['subdirs'])
+
+        changed = fresh != self.dirs
+        self.dirs = fresh
+        self._entries = None
+        self._context_map = {}
+        if changed:
+            self.save()
+        return self
+
+    def _restat_files(self, path: str, listing: Dict) -> Dict:
+        """A cached listing with each file's size and mtime read again"""
+        files = {}
+        for name in listing['files']:
+            try:
+                stat = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            files[name] = [stat.st_size, stat.st_mtime_ns]
+        return dict(listing, files=files)
+
+    def _scan_dir(self, path: str, mtime_ns: int) -> Dict:
+        subdirs, files = [], {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if entry.name not in OUTPUT_DIR_NAMES and not entry.name.startswith('.'):
+                                subdirs.append(entry.name)
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            stat = entry.stat()
+                            files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return {'mtime_ns': mtime_ns, 'subdirs': sorted(subdirs), 'files': files}
+
+    def entries(self) -> List[ImageEntry]:
+        """Every indexed image, ordered by folder then file name"""
+        if self._entries is None:
+            if not self.dirs:
+                self.refresh()
+            self._entries = [
+                ImageEntry(path, name, self.context_of(name), size, mtime_ns)
+                for path in sorted(self.dirs)
+                for name, (size, mtime_ns) in sorted(self.dirs[path]['files'].items())
+            ]
+        return self._entries
+
+    def images(self, recursive: bool = True) -> List[ImageEntry]:
+        """Images under the root; only the root folder itself when not recursive"""
+        if recursive:
+            return self.entries()
+        return [entry for entry in self.entries() if entry.root == self.root_folder]
+
+    def files_to_process(self, recursive: bool = True) -> List[Tuple[str, str]]:
+        """(root, file) pairs in the form process_images uses"""
+        return [(entry.root, entry.file) for entry in self.images(recursive)]
+
+    def context_map(self, recursive: bool = True) -> Dict[str, List[ImageEntry]]:
+        """Images grouped by context, built once per refresh"""
+        if recursive not in self._context_map:
+            grouped: Dict[str, List[ImageEntry]] = {}
+            for entry in self.images(recursive):
+                if entry.context:
+                    grouped.setdefault(entry.context, []).append(entry)
+            self._context_map[recursive] = grouped
+        return self._context_map[recursive]
+
+    def contexts(self, recursive: bool = True) -> Set[str]:
+        return set(self.context_map(recursive))
+
+    def sample_for(self, context: str, recursive: bool = True) -> Optional[str]:
+        """Path of the first image with this context"""
+        entries = self.context_map(recursive).get(context)
+        return entries[0].path if entries else None
@@ -0,0 +1,489 @@
+"""
+Headless Backend
+--------------
+Composes images with Pillow and NumPy instead of Photoshop.
+Follows the same steps as the Photoshop backend:
+- Placed images are centred on the template and scaled down to fit,
+  like Photoshop's "Resize Image During Place" preference. The shrink is
+  only recorded at first, so transform_layer can fold it, the resize,
+  the move and the rotation into one resample (see affine_resample.py)
+  with the backend's filter
+- Layer bounds are the box around the non-transparent pixels, so
+  placement settings captured in Photoshop line up the same way
+- Layers are alpha-blended over the template on save; the template is
+  decoded once per process (see template_cache.py) and each image only
+  copies the rectangle its layers cover
+- The watermark is decoded, scaled and premultiplied once per
+  (size, opacity) and kept in an LRU cache, so each image only pays for
+  one blend of the watermark's rectangle
+
+Backgrounds are removed with a local engine when one is given (see
+bg_removal.py, for flat backdrops) on the source pixels, so Place's shrink
+stays the only resample; masks Photoshop produced earlier are applied from
+the mask cache (see mask_cache.py). Outputs are expected to match
+the Photoshop JPEGs to within PARITY_TOLERANCE; check_parity compares two
+output folders.
+
+Run this file directly to benchmark the watermark cache, or to check a
+headless run against a Photoshop run of the same folder:
+    python headless_backend.py [canvas_size]
+    python headless_backend.py parity <photoshop_output_dir> <headless_output_dir>
+"""
+
+import collections
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from affine_resample import DEFAULT_FILTER, get_filter, placement_matrix, resample_affine
+from compositing_backend import CompositingBackend
+from jpeg_encoder import save_image
+from template_cache import TEMPLATE_CACHE, SharedTemplate, TemplateCanvas
+
+# Largest mean per-channel difference (0-255) allowed between a headless
+# output and the Photoshop output for the same image and settings
+PARITY_TOLERANCE = 4.0
+# Distinct watermark (size, opacity) combinations kept ready to blend
+WATERMARK_CACHE_SIZE = 16
+
+
+class HeadlessLayer:
+    """
+    A placed layer: straight-alpha RGBA float32 pixels plus an offset.
+    scale is template pixels per layer pixel; it differs from 1 while Place's
+    shrink has not been resampled yet (see realize()).
+    """
+
+    def __init__(self, pixels: np.ndarray, left: int, top: int, opacity: float = 100, scale: float = 1.0):
+        self.pixels = pixels
+        self.left = left
+        self.top = top
+        self.opacity = opacity
+        self.scale = scale
+
+    def pixel_bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """(left, top, right, bottom) of the non-transparent pixels in the pixel array; None if there are none"""
+        rows = np.flatnonzero(self.pixels[..., 3].any(axis=1))
+        cols = np.flatnonzero(self.pixels[..., 3].any(axis=0))
+        if not len(rows):
+            return None
+        return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+    @property
+    def bounds(self) -> List[int]:
+        """[left, top, right, bottom] of the non-transparent pixels in template pixels, like Photoshop"""
+        pixel_bounds = self.pixel_bounds()
+        if pixel_bounds is None:
+            return [self.left, self.top, self.left, self.top]
+        x0, y0, x1, y1 = pixel_bounds
+        return [
+            self.left + int(np.floor(x0 * self.scale)),
+            self.top + int(np.floor(y0 * self.scale)),
+            self.left + int(np.ceil(x1 * self.scale)),
+            self.top + int(np.ceil(y1 * self.scale))
+        ]
+
+    @property
+    def box(self) -> Tuple[int, int, int, int]:
+        """(left, top, right, bottom) of the whole pixel array"""
+        height, width = self.pixels.shape[:2]
+        return self.left, self.top, self.left + width, self.top + height
+
+    def realize(self, resample: str = DEFAULT_FILTER):
+        """Apply a pending shrink on its own, for layers that are not transformed"""
+        if self.scale != 1.0:
+            height, width = self.pixels.shape[:2]
+            self.pixels = resize_rgba(self.pixels, width * self.scale, height * self.scale, get_filter(resample))
+            self.scale = 1.0
+
+    def blend_onto(self, canvas: np.ndarray, origin: Tuple[int, int] = (0, 0)):
+        blend_layer(canvas, self, origin)
+
+    def crop_to_bounds(self):
+        """Drop the fully transparent margin so bounds start at (left, top)"""
+        self.realize()
+        left, top, right, bottom = self.bounds
+        self.pixels = self.pixels[top - self.top:bottom - self.top, left - self.left:right - self.left]
+        self.left, self.top = left, top
+
+
+def load_rgba(path: str) -> np.ndarray:
+    """Decode an image file into an RGBA float32 array scaled to 0-1"""
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGBA"), dtype=np.float32) / 255.0
+
+
+def resize_rgba(pixels: np.ndarray, width: int, height: int, resample: int = Image.LANCZOS) -> np.ndarray:
+    """Resample an RGBA array to the given size without fringing at the edges"""
+    width, height = max(1, int(round(width))), max(1, int(round(height)))
+    # Premultiply so transparent pixels do not bleed their colour into the edge
+    premultiplied = pixels.copy()
+    premultiplied[..., :3] *= premultiplied[..., 3:4]
+    channels = [
+        np.asarray(Image.fromarray(np.ascontiguousarray(premultiplied[..., c])).resize((width, height), resample))
+        for c in range(4)
+    ]
+    result = np.clip(np.stack(channels, axis=-1), 0.0, 1.0)
+    alpha = result[..., 3:4]
+    np.divide(result[..., :3], alpha, out=result[..., :3], where=alpha > 0)
+    return np.clip(result, 0.0, 1.0)
+
+
+def blend_layer(canvas: np.ndarray, layer: HeadlessLayer, origin: Tuple[int, int] = (0, 0)):
+    """
+    Alpha-blend a layer onto an RGB float32 canvas in place, cropped to the overlap.
+    origin is the template position of the canvas's top-left pixel.
+    """
+    height, width = canvas.shape[:2]
+    layer_height, layer_width = layer.pixels.shape[:2]
+    left, top = layer.left - origin[0], layer.top - origin[1]
+
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + layer_width, width), min(top + layer_height, height)
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    src = layer.pixels[y0 - top:y1 - top, x0 - left:x1 - left]
+    alpha = src[..., 3:4] * (layer.opacity / 100.0)
+    region = canvas[y0:y1, x0:x1]
+    region += (src[..., :3] - region) * alpha
+
+
+class PremultipliedLayer:
+    """
+    A layer ready to blend: colour already multiplied by alpha and opacity,
+    and 1 - alpha, so blending is canvas * (1 - alpha) + colour
+    """
+
+    def __init__(self, color: np.ndarray, inverse_alpha: np.ndarray, left: int, top: int):
+        self.color = color
+        self.inverse_alpha = inverse_alpha
+        self.left = left
+        self.top = top
+
+    @classmethod
+    def from_layer(cls, layer: HeadlessLayer) -> "PremultipliedLayer":
+        alpha = layer.pixels[..., 3:4] * (layer.opacity / 100.0)
+        return cls(
+            np.ascontiguousarray(layer.pixels[..., :3] * alpha),
+            np.ascontiguousarray(1.0 - alpha),
+            layer.left,
+            layer.top
+        )
+
+    def at(self, left: int, top: int) -> "PremultipliedLayer":
+        """The same pixels at another position (shares the arrays)"""
+        return PremultipliedLayer(self.color, self.inverse_alpha, left, top)
+
+    @property
+    def box(self) -> Tuple[int, int, int, int]:
+        height, width = self.color.shape[:2]
+        return self.left, self.top, self.left + width, self.top + height
+
+    def blend_onto(self, canvas: np.ndarray, origin: Tuple[int, int] = (0, 0)):
+        """Blend onto an RGB float32 canvas in place, cropped to the overlap"""
+        height, width = canvas.shape[:2]
+        layer_height, layer_width = self.color.shape[:2]
+        left, top = self.left - origin[0], self.top - origin[1]
+
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + layer_width, width), min(top + layer_height, height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        rows = slice(y0 - top, y1 - top)
+        cols = slice(x0 - left, x1 - left)
+        region = canvas[y0:y1, x0:x1]
+        region *= self.inverse_alpha[rows, cols]
+        region += self.color[rows, cols]
+
+
+class WatermarkCache:
+    """
+    Watermarks decoded, scaled and premultiplied once per (target size,
+    opacity), least recently used dropped first. The target size is
+    absolute, so Place's shrink does not matter; the full-size watermark is
+    resampled once, straight to it.
+    """
+
+    def __init__(self, watermark_path: str, max_entries: int = WATERMARK_CACHE_SIZE):
+        self.watermark_path = watermark_path
+        self.max_entries = max_entries
+        self._entries: "collections.OrderedDict[Tuple, PremultipliedLayer]" = collections.OrderedDict()
+        self._source: Optional[np.ndarray] = None
+        self._source_mtime: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self):
+        """Drop everything if the watermark file changed since it was decoded"""
+        mtime = os.stat(self.watermark_path).st_mtime_ns
+        if mtime != self._source_mtime:
+            self._entries.clear()
+            self._source = None
+            self._source_mtime = mtime
+
+    def get(self, size: List[float], opacity: float) -> PremultipliedLayer:
+        """Watermark scaled to size (pixels) with opacity applied, positioned at (0, 0)"""
+        key = (round(float(size[0]), 3), round(float(size[1]), 3), float(opacity))
+        layer = self._entries.get(key)
+        if layer is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return layer
+
+        self.misses += 1
+        layer = PremultipliedLayer.from_layer(self._scaled(size, opacity))
+        self._entries[key] = layer
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return layer
+
+    def _scaled(self, size: List[float], opacity: float) -> HeadlessLayer:
+        """Crop the watermark to its opaque pixels and resize it to size"""
+        if self._source is None:
+            self._source = load_rgba(self.watermark_path)
+        layer = HeadlessLayer(self._source, 0, 0, opacity)
+        layer.crop_to_bounds()
+        height, width = layer.pixels.shape[:2]
+        if size[0] != width or size[1] != height:
+            layer.pixels = resize_rgba(layer.pixels, size[0], size[1])
+        layer.left, layer.top = 0, 0
+        return layer
+
+
+def mean_abs_difference(path_a: str, path_b: str) -> float:
+    """Mean per-channel difference (0-255) between two images of the same size"""
+    with Image.open(path_a) as a, Image.open(path_b) as b:
+        a = np.asarray(a.convert("RGB"), dtype=np.float32)
+        b = np.asarray(b.convert("RGB"), dtype=np.float32)
+    if a.shape != b.shape:
+        raise ValueError(f"Image sizes differ: {a.shape[:2]} vs {b.shape[:2]}")
+    return float(np.abs(a - b).mean())
+
+
+def check_parity(reference_dir: str, headless_dir: str,
+                 tolerance: float = PARITY_TOLERANCE) -> Dict[str, Optional[float]]:
+    """
+    Compare every JPEG in reference_dir (a Photoshop run) with the file of
+    the same name in headless_dir. Returns the outputs that fail, mapped to
+    their mean difference, or None where the headless output is missing or
+    a different size.
+    """
+    failures: Dict[str, Optional[float]] = {}
+    for name in sorted(os.listdir(reference_dir)):
+        if not name.lower().endswith(('.jpg', '.jpeg')):
+            continue
+        headless_path = os.path.join(headless_dir, name)
+        try:
+            difference = mean_abs_difference(os.path.join(reference_dir, name), headless_path)
+        except (OSError, ValueError):
+            failures[name] = None
+            continue
+        if difference > tolerance:
+            failures[name] = difference
+    return failures
+
+
+class HeadlessBackend(CompositingBackend):
+    name = "headless"
+    supports_parallel = True
+    supports_async_encode = True
+
+    def __init__(self, template_path: str, watermark_path: str, bg_remover=None, resample: str = DEFAULT_FILTER):
+        super().__init__(template_path, watermark_path)
+        self.bg_remover = bg_remover  # bg_removal.BackgroundRemover, or None to rely on cached masks
+        get_filter(resample)  # Fail early on an unknown name
+        self.resample = resample  # affine_resample filter for placed layers
+        self.template: Optional[np.ndarray] = None  # Read-only, shared with other backends
+        self.canvas: Optional[TemplateCanvas] = None
+        self.layers: List = []  # HeadlessLayer or PremultipliedLayer, bottom first
+        self.watermarks = WatermarkCache(watermark_path)
+
+    def open(self, log=None):
+        super().open(log)
+        # Decoded and flattened onto white once per process, as Photoshop does when saving a JPEG
+        decoded = TEMPLATE_CACHE.get(self.template_path)
+        self.template = decoded.pixels
+        self.canvas = TemplateCanvas(decoded)
+        self.layers = []
+        self.watermarks.refresh()
+
+    def close(self):
+        self.template = None
+        self.canvas = None
+        self.layers = []
+
+    def export_shared(self, log) -> SharedTemplate:
+        shared = TEMPLATE_CACHE.share(self.template_path)
+        log.debug("DEBUG: %s", TEMPLATE_CACHE.summary())
+        return shared
+
+    def attach_shared(self, shared: SharedTemplate):
+        TEMPLATE_CACHE.attach(shared)
+
+    def worker_options(self) -> Dict:
+        return {'bg_remover': self.bg_remover, 'resample': self.resample}
+
+    def cache_settings(self) -> Dict:
+        return {'resample': self.resample,
+                'bg_remover': self.bg_remover.settings() if self.bg_remover else None}
+
+    @property
+    def supports_background_removal(self) -> bool:
+        return self.bg_remover is not None
+
+    @property
+    def mask_method(self) -> str:
+        if self.bg_remover is None:
+            return super().mask_method
+        return json.dumps(self.bg_remover.settings(), sort_keys=True)
+
+    def load_source(self, image_path: str, mask_key: Optional[str] = None) -> np.ndarray:
+        """Decode a file at full size, with its cached background mask applied if mask_key is given"""
+        pixels = load_rgba(image_path)
+        if mask_key:
+            mask = self.mask_cache.load(mask_key)
+            if mask.shape != pixels.shape[:2]:
+                mask = np.asarray(Image.fromarray(mask).resize(pixels.shape[1::-1], Image.LANCZOS))
+            pixels[..., 3] *= mask / np.float32(255.0)
+        return pixels
+
+    def place_pixels(self, pixels: np.ndarray) -> HeadlessLayer:
+        """
+        Centre decoded pixels on the template, scaled down if they do not
+        fit. The pixels are not copied or resampled here: the shrink is
+        recorded on the layer and applied by transform_layer, or on save.
+        """
+        canvas_height, canvas_width = self.template.shape[:2]
+        height, width = pixels.shape[:2]
+        scale = min(canvas_width / width, canvas_height / height, 1.0)
+        # Same rounding as resizing to the fitted size
+        placed_width, placed_height = max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+        layer = HeadlessLayer(pixels, (canvas_width - placed_width) // 2, (canvas_height - placed_height) // 2,
+                              scale=scale)
+        self.layers.append(layer)
+        return layer
+
+    def place_image(self, image_path: str):
+        return self.place_pixels(self.load_source(image_path))
+
+    def place_masked(self, image_path: str, mask_key: str):
+        return self.place_pixels(self.load_source(image_path, mask_key))
+
+    def remove_background(self, layer):
+        if self.bg_remover is None:
+            return super().remove_background(layer)
+        start = time.perf_counter()
+        # Photoshop removes it at the placed size; the feather is scaled to match
+        layer.pixels[..., 3] = self.bg_remover.mask(layer.pixels, layer.scale)
+        self.log.debug("DEBUG: Removed background (%s) in %.0f ms", self.bg_remover.name,
+                       (time.perf_counter() - start) * 1000)
+
+    def capture_mask(self, layer, image_path: str, mask_key: str):
+        # At the source's size, which load_source expects
+        alpha = np.clip(layer.pixels[..., 3] * 255.0 + 0.5, 0, 255).astype(np.uint8)
+        self.mask_cache.put(mask_key, alpha)
+
+    def transform_layer(self, layer, size: List[float], position: List[float], opacity: float = 100,
+                        rotate: float = 0):
+        """Place's shrink, the resize, the move and the rotation as one resample, cropped to the template"""
+        layer.opacity = opacity
+        pixel_bounds = layer.pixel_bounds()
+        if pixel_bounds is None:
+            layer.pixels, layer.scale = layer.pixels[:0, :0], 1.0
+            return
+        x0, y0, x1, y1 = pixel_bounds
+        source = layer.pixels[y0:y1, x0:x1]
+        matrix = placement_matrix((x1 - x0, y1 - y0), layer.scale * size[0] / 100, layer.scale * size[1] / 100,
+                                  position, rotate)
+        canvas_height, canvas_width = self.template.shape[:2]
+        placed = resample_affine(source, matrix, (canvas_width, canvas_height), self.resample)
+        if placed is None:
+            # Entirely off the template
+            layer.pixels, layer.left, layer.top = source[:0, :0], 0, 0
+        else:
+            layer.pixels, layer.left, layer.top = placed
+        layer.scale = 1.0
+
+    def place_watermark(self, settings: Dict):
+        watermark = self.watermarks.get(settings['size'], settings['opacity'])
+        position = settings['position']
+        self.layers.append(watermark.at(int(round(position[0])), int(round(position[1]))))
+
+    def _realize_layers(self):
+        """Resample placed layers whose shrink transform_layer did not apply"""
+        for layer in self.layers:
+            if isinstance(layer, HeadlessLayer):
+                layer.realize(self.resample)
+
+    def compose(self) -> np.ndarray:
+        """Blend every placed layer over the template, bottom layer first"""
+        self._realize_layers()
+        canvas = self.template.copy()
+        for layer in self.layers:
+            layer.blend_onto(canvas)
+        return canvas
+
+    def save_jpeg(self, output_path: str):
+        self._realize_layers()
+        pixels = self.canvas.render(self.layers)
+        if self.encoder:
+            # Written on the encoder's threads while the next image is composed
+            self.encoder.submit(pixels, output_path)
+            return
+        start = time.perf_counter()
+        save_image(Image.fromarray(pixels), output_path, self.jpeg_profile)
+        self.log.debug("DEBUG: Encoded %s: %d KB in %.0f ms", os.path.basename(output_path),
+                       os.path.getsize(output_path) // 1024, (time.perf_counter() - start) * 1000)
+
+    def reset_document(self):
+        self.layers = []
+
+
+def run_watermark_benchmark(canvas_size: int = 3000, image_count: int = 20):
+    """Print the per-image watermark cost with and without the watermark cache"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template_path = os.path.join(temp_dir, "template.png")
+        watermark_path = os.path.join(temp_dir, "watermark.png")
+        Image.new("RGB", (canvas_size, canvas_size), (240, 240, 240)).save(template_path)
+        watermark = np.zeros((400, 1200, 4), dtype=np.uint8)
+        watermark[50:350, 50:1150] = (30, 30, 30, 200)
+        Image.fromarray(watermark).save(watermark_path)
+        settings = {'size': [900, 300], 'position': [canvas_size - 1000, canvas_size - 400], 'opacity': 60}
+
+        backend = HeadlessBackend(template_path, watermark_path)
+        backend.open(log=lambda msg: None)
+        canvas = backend.template.copy()
+
+        def per_image_ms(fresh_cache: bool) -> float:
+            start = time.perf_counter()
+            for _ in range(image_count):
+                if fresh_cache:
+                    # Decode and scale every time, as before the cache
+                    backend.watermarks = WatermarkCache(watermark_path)
+                backend.place_watermark(settings)
+                backend.layers.pop().blend_onto(canvas)
+            return (time.perf_counter() - start) / image_count * 1000
+
+        print(f"{canvas_size}x{canvas_size} canvas, {image_count} images")
+        print(f"  decode + scale every image: {per_image_ms(True):7.2f} ms/image")
+        print(f"  cached watermark:           {per_image_ms(False):7.2f} ms/image")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "parity":
+        failed = check_parity(sys.argv[2], sys.argv[3])
+        for name, difference in failed.items():
+            print(f"{name}: " + ("missing or a different size" if difference is None
+                                 else f"mean difference {difference:.2f} > {PARITY_TOLERANCE}"))
+        print(f"{len(failed)} outputs outside the parity tolerance")
+        sys.exit(1 if failed else 0)
+    run_watermark_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
@@ -5,38 +5,61 @@ Handles the actual processing of images including:
 - Background removal
 - Watermarking
 - Custom placement
+
+The compositing itself is done by a backend (see compositing_backend.py):
+Photoshop by default, or the headless Pillow/NumPy engine.
 """
 
 import os
-from photoshop import Session
-import time
-from typing import Set, Dict, Optional
+from typing import Set, Dict, Optional, Tuple
+from compositing_backend import CompositingBackend
+from photoshop_backend import PhotoshopBackend
+from ps_session import SessionPool
+from batch_engine import BatchEngine
+from ps_wait import PhotoshopWaiter
+from ps_watchdog import PhotoshopWatchdog
+from result_cache import ResultCache
+from mask_cache import MaskCache
+from run_journal import RunJournal, settings_hash
+from folder_scanner import FolderIndex
+from context_parser import extract_context
+from preset_registry import Placement, PresetRegistry, WatermarkPlacement, image_size
+from run_control import RunControl
+from log_sink import as_status_log
+from jpeg_encoder import JpegEncoder, get_profile
 
 class ImageProcessor:
-    def __init__(self, template_path: str, watermark_path: str):
+    def __init__(self,
+                 template_path: str,
+                 watermark_path: str,
+                 session_pool: Optional[SessionPool] = None,
+                 watchdog: Optional[PhotoshopWatchdog] = None):
         self.template_path = template_path
         self.watermark_path = watermark_path
         self.watermark_settings = None
+        # Keeps Photoshop and the template open between runs; share it with the placement handler
+        self.session_pool = session_pool or SessionPool()
+        # Polls Photoshop instead of sleeping and records per-step timings
+        self.waiter = PhotoshopWaiter()
+        # Runs Photoshop calls with deadlines and restarts Photoshop when one hangs
+        self.watchdog = watchdog or PhotoshopWatchdog()
+        self._template_sizes: Dict[str, Tuple[int, int]] = {}
     
     def capture_watermark_settings(self, status_callback=None):
         """
         Opens Photoshop to let user position watermark and captures those settings.
         Returns True if settings were successfully captured.
         """
-        def log(msg: str):
-            if status_callback:
-                status_callback(msg)
-            print(msg)
+        log = as_status_log(status_callback)
 
         try:
-            with Session(self.template_path, action="open") as ps:
-                ps.app.displayDialogs = ps.DialogModes.DisplayNoDialogs
-                
+            with self.session_pool.session(self.template_path, log) as ps:
                 # Place the watermark
+                layers_before = len(ps.active_document.artLayers)
                 desc = ps.ActionDescriptor
                 desc.putPath(ps.app.charIDToTypeID("null"), self.watermark_path)
                 ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
-                time.sleep(1)
+                self.waiter.for_layer_count(ps.active_document, layers_before + 1, "place watermark")
                 
                 # Get the watermark layer
                 watermark_layer = ps.active_document.artLayers[0]
@@ -57,7 +80,9 @@ class ImageProcessor:
                 self.watermark_settings = {
                     'size': [bounds[2] - bounds[0], bounds[3] - bounds[1]],  # width, height
                     'position': [bounds[0], bounds[1]],  # x, y position
-                    'opacity': watermark_layer.opacity
+                    'opacity': watermark_layer.opacity,
+                    # Lets the position be rendered onto templates of other sizes
+                    'template_size': [ps.active_document.width, ps.active_document.height]
                 }
                 
                 log("\nWatermark settings captured successfully!")
@@ -80,98 +105,51 @@ class ImageProcessor:
                       is_mass_mode: bool,
                       operations: Set[str],
                       context_settings: Dict,
-                      status_callback=None):
-        """Process images in the folder based on selected operations."""
-        def log(msg: str):
-            if status_callback:
-                status_callback(msg)
-            print(msg)
-        
-        def apply_watermark(context_watermark_settings=None):
-            """
-            Helper function to consistently apply watermark settings.
-            Uses context-specific settings if provided, otherwise uses default settings.
-            """
-            try:
-                settings = context_watermark_settings or self.watermark_settings
-                if not settings:
-                    raise ValueError("No watermark settings available")
-                
-                # Debug log the settings
-                log(f"DEBUG: Using watermark settings: {settings}")
-                
-                # Place the watermark
-                desc = ps.ActionDescriptor
-                desc.putPath(ps.app.charIDToTypeID("null"), self.watermark_path)
-                ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
-                time.sleep(1)
-                
-                # Get the watermark layer
-                watermark_layer = ps.active_document.artLayers[0]
-                watermark_layer.name = "Lady-Cosmica-Watermark"
-                
-                # Get current dimensions
-                current_bounds = watermark_layer.bounds
-                current_width = current_bounds[2] - current_bounds[0]
-                current_height = current_bounds[3] - current_bounds[1]
-                
-                # Debug log the current dimensions
-                log(f"DEBUG: Current watermark dimensions: {current_width} x {current_height}")
-                
-                # Get target dimensions from settings
-                if isinstance(settings, dict) and 'watermark' in settings:
-                    # If settings come from context_settings
-                    watermark_settings = settings['watermark']
-                else:
-                    # If settings are direct watermark settings
-                    watermark_settings = settings
-                
-                # Get target dimensions (handle both 'dimensions' and 'size' keys for compatibility)
-                target_dimensions = watermark_settings.get('dimensions') or watermark_settings.get('size')
-                if not target_dimensions:
-                    raise ValueError("No size/dimensions found in watermark settings")
-                    
-                target_width, target_height = target_dimensions
-                
-                # Debug log the target dimensions
-                log(f"DEBUG: Target dimensions: {target_width} x {target_height}")
-                
-                # Calculate resize percentages
-                width_scale = (target_width / current_width) * 100
-                height_scale = (target_height / current_height) * 100
-                
-                # Debug log the scale factors
-                log(f"DEBUG: Scale factors: {width_scale}% x {height_scale}%")
-                
-                # Resize to match original dimensions
-                watermark_layer.resize(width_scale, height_scale)
-                time.sleep(0.5)
-                
-                # Move to captured position
-                current_bounds = watermark_layer.bounds
-                x_move = watermark_settings['position'][0] - current_bounds[0]
-                y_move = watermark_settings['position'][1] - current_bounds[1]
-                
-                # Debug log the movement
-                log(f"DEBUG: Moving by: {x_move}, {y_move}")
-                
-                watermark_layer.translate(x_move, y_move)
-                
-                # Set opacity
-                watermark_layer.opacity = watermark_settings['opacity']
-                
-            except Exception as e:
-                log(f"DEBUG: Full settings object: {settings}")
-                log(f"DEBUG: Error type: {type(e)}")
-                log(f"DEBUG: Error details: {str(e)}")
-                raise ValueError(f"Failed to apply watermark settings: {str(e)}")
+                      status_callback=None,
+                      backend: Optional[CompositingBackend] = None,
+                      workers: int = 1,
+                      cache: Optional[ResultCache] = None,
+                      file_index: Optional[FolderIndex] = None,
+                      control: Optional[RunControl] = None,
+                      jpeg_profile: Optional[str] = None,
+                      mask_cache: Optional[MaskCache] = None,
+                      journal: Optional[RunJournal] = None,
+                      resume: bool = False,
+                      retry_failed: bool = False):
+        """
+        Process images in the folder based on selected operations.
         
-        def cleanup_layers(keep_template=True):
-            """Helper function to consistently clean up layers"""
-            min_layers = 1 if keep_template else 0
-            while len(ps.active_document.artLayers) > min_layers:
-                ps.active_document.artLayers[0].remove()
-                time.sleep(0.5)
+        Args:
+            status_callback: Receives each log line. Either a plain callable, or
+                             a StatusLog/LogSink whose level decides whether
+                             DEBUG lines are built at all.
+            backend: Engine that does the compositing. Defaults to Photoshop with
+                     step-by-step COM calls; pass a PhotoshopJsxBackend for
+                     one script call per image or a HeadlessBackend to
+                     compose without Photoshop.
+            workers: Number of worker processes. Only used by backends that
+                     support parallel runs (headless); Photoshop is always serial.
+            cache: Result cache; images whose inputs and settings are unchanged
+                   since a cached run reuse their previous output.
+            file_index: Index of the folder's images (e.g. the one the GUI built
+                        while analysing); refreshed incrementally instead of
+                        walking the folder again.
+            control: Lets the caller pause, resume or cancel the run between
+                     images and receive progress. Cancelling raises RunCancelled.
+            jpeg_profile: Output profile name from jpeg_encoder.PROFILES
+                          (default marketplace-max).
+            mask_cache: Background masks from earlier removals. Cached masks are
+                        applied instead of running remove_bg, and Photoshop
+                        removals are added to it. With it, backends that cannot
+                        remove backgrounds (headless) process images whose mask
+                        is cached.
+            journal: Records each finished image as it completes, so the run
+                     can be resumed after a crash or cancel.
+            resume: Skip images the journal shows finished (done or failed)
+                    with the same settings.
+            retry_failed: Like resume, but run the failed images again.
+        """
+        log = as_status_log(status_callback)
         
         # Verify watermark settings if needed
         needs_watermark = ("Add Watermark ONLY" in operations or 
@@ -179,81 +157,299 @@ class ImageProcessor:
         
         if needs_watermark and not self.watermark_settings and not context_settings:
             raise ValueError("No watermark settings provided")
-            
-        with Session(self.template_path, action="open") as ps:
-            ps.app.displayDialogs = ps.DialogModes.DisplayNoDialogs
-            
-            # Get list of files to process
-            files_to_process = []
-            if is_mass_mode:
-                for root, _, files in os.walk(folder):
-                    for file in files:
-                        if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                            files_to_process.append((root, file))
-            else:
-                for file in os.listdir(folder):
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                        files_to_process.append((folder, file))
-            
+        
+        # Every context's settings are normalised once, here, not per image;
+        # a malformed context only fails its own images
+        presets = PresetRegistry(context_settings, self.watermark_settings)
+        for error in presets.errors.values():
+            log(f"Warning: {error}; its images will fail")
+        
+        if backend is None:
+            backend = PhotoshopBackend(
+                self.template_path, self.watermark_path, waiter=self.waiter, session_pool=self.session_pool
+            )
+        backend.jpeg_profile = get_profile(jpeg_profile)
+        backend.mask_cache = mask_cache
+        if mask_cache:
+            mask_cache.reset_stats()
+        self.waiter.profile.reset()
+        
+        needs_bg_removal = ("Remove Background ONLY" in operations or
+                            "Custom Placement + Background Removal + Watermark" in operations)
+        if needs_bg_removal and not backend.supports_background_removal and not mask_cache:
+            raise ValueError(f"Background removal is not available with the {backend.name} backend")
+        
+        # Get list of files to process
+        if file_index is None or file_index.root_folder != os.path.abspath(folder):
+            file_index = FolderIndex(folder)
+        files_to_process = file_index.refresh().files_to_process(recursive=is_mass_mode)
+        
+        total_files = len(files_to_process)
+        log(f"Found {total_files} images to process")
+        
+        # Pick up where an earlier run with the same settings stopped
+        if journal:
+            files_to_process = journal.begin(
+                files_to_process, self._run_settings_hash(backend, operations, context_settings),
+                resume=resume, retry_failed=retry_failed
+            )
+            if len(files_to_process) < total_files:
+                log(f"Resuming: {total_files - len(files_to_process)} images already finished in an earlier run")
             total_files = len(files_to_process)
-            log(f"Found {total_files} images to process")
-            
+        
+        # Skip images whose output is already cached
+        cache_keys = {}
+        if cache:
+            cache.reset_stats()
+            remaining = []
+            for root, file in files_to_process:
+                try:
+                    key = self._cache_key(cache, backend, root, file, operations, presets)
+                except Exception:
+                    key = None
+                if key and cache.lookup(key, self._output_path(root, file)):
+                    if journal:
+                        journal.record(root, file, self._output_path(root, file))
+                    continue
+                cache_keys[(root, file)] = key
+                remaining.append((root, file))
+            if len(remaining) < total_files:
+                log(f"Reusing cached output for {total_files - len(remaining)} unchanged images")
+            files_to_process = remaining
+            total_files = len(files_to_process)
+        
+        def store(root: str, file: str, output_path: Optional[str], error: Optional[str] = None):
+            """Cache a finished output and journal the image as done, or as failed"""
+            if cache and output_path and not error and cache_keys.get((root, file)):
+                cache.store(cache_keys[(root, file)], output_path, extract_context(file))
+            if journal:
+                journal.record(root, file, output_path, error)
+        
+        if workers > 1 and backend.supports_parallel:
+            log(f"Using {workers} worker processes")
+            try:
+                BatchEngine(workers).run(
+                    self, backend, files_to_process, operations, presets, log, control,
+                    on_result=lambda index, output_path, error: store(*files_to_process[index], output_path, error)
+                )
+            finally:
+                self._finish_cache(cache, log, mask_cache, journal)
+            return
+        
+        # Headless outputs are encoded on a thread pool while the next image is composed;
+        # they are only cached once written
+        encoder = JpegEncoder(backend.jpeg_profile) if backend.supports_async_encode else None
+        backend.encoder = encoder
+        encoding = []
+        
+        # Photoshop calls run on the watchdog's thread, so a hung one can be abandoned
+        watchdog = self.watchdog if backend.needs_watchdog else None
+        if watchdog:
+            watchdog.reset_stats()
+            backend = watchdog.guard(backend)
+        
+        backend.open(log)
+        try:
             # Process each file
             for i, (root, file) in enumerate(files_to_process, 1):
+                if control:
+                    control.checkpoint()
                 try:
                     log(f"Processing {i}/{total_files}: {file}")
-                    
-                    # Create output directory if needed
-                    output_dir = os.path.join(root, "processed_output")
-                    if not os.path.exists(output_dir):
-                        os.makedirs(output_dir)
-                    
-                    # Import image
-                    image_path = os.path.join(root, file)
-                    desc = ps.ActionDescriptor
-                    desc.putPath(ps.app.charIDToTypeID("null"), image_path)
-                    ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
-                    time.sleep(1.5)
-                    
-                    # Get the image layer
-                    img_layer = ps.active_document.artLayers[0]
-                    
-                    # Get context from filename
-                    context = self._extract_context(file)
-                    context_settings_for_image = context_settings.get(context) if context else None
-                    
-                    if "Remove Background ONLY" in operations or "Custom Placement + Background Removal + Watermark" in operations:
-                        # Remove background
-                        log(f"Removing background from {file}")
-                        ps.app.doAction("remove_bg", "Default Actions")
-                    
-                    if needs_watermark:
-                        # Use context-specific watermark settings if available
-                        if context_settings_for_image and 'watermark' in context_settings_for_image:
-                            apply_watermark(context_settings_for_image['watermark'])
-                        else:
-                            apply_watermark()
-                    
-                    # Save processed image
-                    output_path = os.path.join(output_dir, f"{os.path.splitext(file)[0]}-processed.jpg")
-                    options = ps.JPEGSaveOptions(quality=12)
-                    ps.active_document.saveAs(output_path, options, asCopy=True)
-                    
-                    # Clean up layers before next image
-                    cleanup_layers()
-                    
+                    if watchdog:
+                        watchdog.begin_image(file)
+                    output_path = self._process_file(backend, root, file, operations, presets, log)
+                    if encoder:
+                        encoding.append((root, file, output_path))
+                    else:
+                        store(root, file, output_path)
                 except Exception as e:
                     log(f"Error processing {file}: {str(e)}")
-                    # Clean up any remaining layers
+                    store(root, file, None, str(e))
+                    if watchdog:
+                        watchdog.end_image()  # The reset gets its own deadline
+                    # Return to the clean template
                     try:
-                        cleanup_layers()
+                        backend.reset_document()
                     except:
                         pass
                     continue
+                finally:
+                    if watchdog:
+                        watchdog.end_image()
+                    if control:
+                        control.progress(i, total_files)
+        finally:
+            backend.close()
+            if encoder:
+                self._finish_encoding(encoder, encoding, store, log)
+                backend.encoder = None
+            self._finish_cache(cache, log, mask_cache, journal)
+            if watchdog:
+                log(watchdog.summary())
+        
+        timings = self.waiter.profile.summary()
+        if timings:
+            log("Photoshop wait timings:")
+            for line in timings:
+                log(f"  {line}")
     
-    def _extract_context(self, filename: str) -> Optional[str]:
-        """Extract context from filename"""
-        try:
-            return filename[filename.find('label=')+6:-4]
-        except:
-            return None 
\ No newline at end of file
+    def _process_file(self,
+                      backend: CompositingBackend,
+                      root: str,
+                      file: str,
+                      operations: Set[str],
+                      presets: PresetRegistry,
+                      log) -> str:
+        """Run the selected operations on one image and return the output path"""
+        # Create output directory if needed
+        output_path = self._output_path(root, file)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        # Import image, with its background already removed if the mask is cached
+        image_path = os.path.join(root, file)
+        removing_bg = ("Remove Background ONLY" in operations or
+                       "Custom Placement + Background Removal + Watermark" in operations)
+        mask_keys = backend.mask_keys(image_path) if removing_bg and backend.mask_cache else []
+        cached_key = backend.mask_cache.lookup_any(mask_keys) if mask_keys else None
+        if cached_key:
+            log(f"Using cached background mask for {file}")
+            img_layer = backend.place_masked(image_path, cached_key)
+        else:
+            if removing_bg and not backend.supports_background_removal:
+                raise ValueError(f"No cached background mask for {file}; remove it with Photoshop once first")
+            img_layer = backend.place_image(image_path)
+            if removing_bg:
+                # Remove background
+                log(f"Removing background from {file}")
+                backend.remove_background(img_layer)
+                if mask_keys:
+                    backend.capture_mask(img_layer, image_path, mask_keys[-1])
+        return self._compose(backend, img_layer, file, image_path, output_path, operations, presets, log)
+    
+    def _compose(self,
+                 backend: CompositingBackend,
+                 img_layer,
+                 file: str,
+                 image_path: str,
+                 output_path: str,
+                 operations: Set[str],
+                 presets: PresetRegistry,
+                 log) -> str:
+        """Position an imported image, add the watermark, save and reset; returns output_path"""
+        needs_watermark = ("Add Watermark ONLY" in operations or 
+                         "Custom Placement + Background Removal + Watermark" in operations)
+        
+        # Placement for the file's context, rendered onto this template's size
+        placement, watermark = presets.resolve(file, self._template_size(backend.template_path), image_path)
+        
+        # Apply the placement captured for this context (size is relative to the bg-removed bounds)
+        if ("Custom Placement + Background Removal + Watermark" in operations
+                and placement and placement.position is not None):
+            backend.transform_layer(img_layer, list(placement.size), list(placement.position), placement.opacity,
+                                    placement.rotate)
+        
+        if needs_watermark:
+            if watermark is None:
+                raise ValueError("No watermark settings available")
+            settings = watermark.as_settings()
+            log.debug("DEBUG: Using watermark settings: %s", settings)
+            backend.place_watermark(settings)
+        
+        # Save processed image
+        backend.save_jpeg(output_path)
+        
+        # Return to the clean template before next image
+        backend.reset_document()
+        return output_path
+    
+    def _output_path(self, root: str, file: str, target: Optional[str] = None) -> str:
+        """Where the processed version of an image is written (in a subfolder per fan-out target)"""
+        output_dir = os.path.join(root, "processed_output", target) if target else os.path.join(root, "processed_output")
+        return os.path.join(output_dir, f"{os.path.splitext(file)[0]}-processed.jpg")
+    
+    def _template_size(self, template_path: str) -> Tuple[int, int]:
+        """Pixel size of a template, read from its header once"""
+        size = self._template_sizes.get(template_path)
+        if size is None:
+            size = self._template_sizes[template_path] = image_size(template_path)
+        return size
+    
+    def _watermark_for(self, presets: PresetRegistry, placement: Optional[Placement]) -> WatermarkPlacement:
+        """The context's own watermark if it has one, else the default one"""
+        watermark = presets.watermark_for(placement)
+        if watermark is None:
+            raise ValueError("No watermark settings available")
+        return watermark
+    
+    def _run_settings_hash(self, backend: CompositingBackend, operations: Set[str], context_settings: Dict) -> str:
+        """Hash of the settings that decide what every output of a run looks like"""
+        return settings_hash({
+            'operations': sorted(operations),
+            'context_settings': context_settings,
+            'watermark_settings': self.watermark_settings,
+            'template': os.path.abspath(self.template_path),
+            'watermark': os.path.abspath(self.watermark_path) if self.watermark_path else None,
+            'backend': backend.name,
+            'backend_settings': backend.cache_settings(),
+            'jpeg': backend.jpeg_profile.name
+        })
+    
+    def _cache_key(self,
+                   cache: ResultCache,
+                   backend: CompositingBackend,
+                   root: str,
+                   file: str,
+                   operations: Set[str],
+                   presets: PresetRegistry) -> str:
+        """Result cache key covering everything that affects this image's output"""
+        needs_watermark = ("Add Watermark ONLY" in operations or 
+                         "Custom Placement + Background Removal + Watermark" in operations)
+        placement = presets.for_file(file)
+        
+        settings = {}
+        if "Custom Placement + Background Removal + Watermark" in operations and placement:
+            settings['placement'] = placement.as_settings()
+        # Different JPEG settings or engine options give a different file
+        settings['jpeg'] = backend.jpeg_profile.name
+        settings['backend'] = backend.cache_settings()
+        if needs_watermark:
+            settings['watermark'] = self._watermark_for(presets, placement).as_settings()
+        
+        return cache.make_key(
+            os.path.join(root, file),
+            backend.template_path,
+            backend.watermark_path if needs_watermark else None,
+            operations,
+            settings,
+            backend.name
+        )
+    
+    def _finish_encoding(self, encoder: JpegEncoder, encoding, store, log):
+        """Wait for queued JPEGs, cache the ones written and report failures and sizes"""
+        encoder.close()
+        failed = encoder.errors
+        for root, file, output_path in encoding:
+            if output_path in failed:
+                log(f"Error saving {file}: {failed[output_path]}")
+                store(root, file, None, failed[output_path])
+            else:
+                store(root, file, output_path)
+        for stat in encoder.stats:
+            log.debug("DEBUG: Encoded %s: %d KB in %.0f ms", os.path.basename(stat.path),
+                      stat.bytes // 1024, stat.seconds * 1000)
+        log(encoder.summary())
+    
+    def _finish_cache(self, cache: Optional[ResultCache], log, mask_cache: Optional[MaskCache] = None,
+                      journal: Optional[RunJournal] = None):
+        """Persist the cache indexes, close the journal and report their counts"""
+        if journal:
+            journal.close()
+            log(journal.summary())
+        if cache:
+            cache.save()
+            log(cache.summary())
+        # Worker processes look masks up in their own copies; only lookups made here are counted
+        if mask_cache and mask_cache.hits + mask_cache.misses:
+            mask_cache.save()
+            log(mask_cache.summary())
@@ -0,0 +1,182 @@
+"""
+JPEG Encoder
+-----------
+One place for output JPEG settings, plus an encode stage that runs
+beside compositing.
+
+- Named profiles (marketplace-max, preview, archive) give the Pillow
+  settings (quality, progressive, optimize, chroma subsampling) and the
+  matching Photoshop JPEGSaveOptions (quality 0-12, format), so every
+  engine and script saves the same way
+- JpegEncoder takes composed pixels from a bounded queue and encodes them
+  on a thread pool. Pillow releases the GIL while encoding, so the next
+  image is composed while the previous one is written
+- Bytes written and encode time are recorded for every file
+
+Run this file directly to compare profiles and serial vs overlapped encoding:
+    python jpeg_encoder.py [image_count]
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+# Photoshop JPEGSaveOptions.formatOptions values
+PS_STANDARD_BASELINE = 1
+PS_OPTIMIZED_BASELINE = 2
+PS_PROGRESSIVE = 3
+
+
+class JpegProfile(NamedTuple):
+    name: str
+    quality: int  # Pillow, 1-95
+    progressive: bool
+    optimize: bool
+    subsampling: int  # 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
+    photoshop_quality: int  # 0-12
+    photoshop_format: int
+
+
+PROFILES: Dict[str, JpegProfile] = {
+    # Listing images: full chroma, largest quality marketplaces accept without recompressing
+    'marketplace-max': JpegProfile('marketplace-max', 95, False, True, 0, 12, PS_OPTIMIZED_BASELINE),
+    # Small, quick-loading proofs; what the mass scripts have always written
+    'preview': JpegProfile('preview', 70, True, True, 2, 5, PS_PROGRESSIVE),
+    # Masters kept for later re-export
+    'archive': JpegProfile('archive', 95, True, True, 0, 12, PS_PROGRESSIVE),
+}
+DEFAULT_PROFILE = 'marketplace-max'
+
+
+def get_profile(name: Optional[str]) -> JpegProfile:
+    """Profile by name; None gives the default"""
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown JPEG profile '{name}' (choose from {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def save_image(image: Image.Image, output_path: str, profile: JpegProfile):
+    image.save(
+        output_path,
+        "JPEG",
+        quality=profile.quality,
+        progressive=profile.progressive,
+        optimize=profile.optimize,
+        subsampling=profile.subsampling
+    )
+
+
+class EncodeStat(NamedTuple):
+    path: str
+    bytes: int
+    seconds: float
+
+
+class JpegEncoder:
+    """Encodes composed RGB uint8 images to JPEG on a thread pool"""
+
+    def __init__(self, profile: Optional[JpegProfile] = None, workers: int = 2, max_pending: Optional[int] = None):
+        self.profile = profile or get_profile(None)
+        self.workers = max(1, workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jpeg-encode")
+        # Each pending image holds a full-size copy; bound them so memory stays flat
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 2)
+        self._lock = threading.Lock()
+        self.stats: List[EncodeStat] = []
+        self.errors: Dict[str, str] = {}  # Output path -> error, for images that failed to encode
+
+    def encode(self, pixels: np.ndarray, output_path: str) -> EncodeStat:
+        """Encode now, on the calling thread"""
+        return self._encode(Image.fromarray(pixels), output_path)
+
+    def submit(self, pixels: np.ndarray, output_path: str) -> Future:
+        """
+        Queue an image for encoding and return its Future (an EncodeStat).
+        The pixels are copied first, so the caller can reuse its buffer right away.
+        Blocks while the queue is full.
+        """
+        image = Image.fromarray(pixels)
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._encode, image, output_path)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda done: self._done(done, output_path))
+        return future
+
+    def _done(self, future: Future, output_path: str):
+        self._slots.release()
+        if future.exception() is not None:
+            with self._lock:
+                self.errors[output_path] = str(future.exception())
+
+    def _encode(self, image: Image.Image, output_path: str) -> EncodeStat:
+        start = time.perf_counter()
+        save_image(image, output_path, self.profile)
+        stat = EncodeStat(output_path, os.path.getsize(output_path), time.perf_counter() - start)
+        with self._lock:
+            self.stats.append(stat)
+        return stat
+
+    def close(self):
+        """Wait for every queued image"""
+        self._pool.shutdown(wait=True)
+
+    def summary(self) -> str:
+        with self._lock:
+            stats = list(self.stats)
+        if not stats:
+            return f"JPEG ({self.profile.name}): nothing encoded"
+        total_bytes = sum(stat.bytes for stat in stats)
+        mean_ms = sum(stat.seconds for stat in stats) / len(stats) * 1000
+        return (
+            f"JPEG ({self.profile.name}): {len(stats)} files, {total_bytes / 1024 ** 2:.1f} MB, "
+            f"{total_bytes / len(stats) / 1024:.0f} KB and {mean_ms:.0f} ms encode per file"
+        )
+
+
+def run_benchmark(image_count: int = 20, size: int = 2000):
+    """Print size and encode time per profile, and serial vs overlapped wall time"""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    # Smooth gradients with some noise, closer to a photo than flat colour
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    base = np.stack([ramp[None, :].repeat(size, 0), ramp[:, None].repeat(size, 1),
+                     np.full((size, size), 128, np.float32)], axis=-1)
+
+    def compose() -> np.ndarray:
+        return np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        print(f"{image_count} images, {size}x{size}")
+        for profile in PROFILES.values():
+            encoder = JpegEncoder(profile, workers=1)
+            for i in range(min(image_count, 5)):
+                encoder.encode(compose(), os.path.join(temp_dir, f"{profile.name}-{i}.jpg"))
+            print(f"  {encoder.summary()}")
+
+        encoder = JpegEncoder(get_profile(None))
+        start = time.perf_counter()
+        for i in range(image_count):
+            encoder.encode(compose(), os.path.join(temp_dir, f"serial-{i}.jpg"))
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(image_count):
+            encoder.submit(compose(), os.path.join(temp_dir, f"overlap-{i}.jpg"))
+        encoder.close()
+        overlapped = time.perf_counter() - start
+        print(f"  compose + encode: serial {serial:.2f}s, overlapped {overlapped:.2f}s")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,256 @@
+"""
+JSX Batch Executor
+----------------
+Compiles the per-image Photoshop operations into one ExtendScript
+program and runs it with a single app.doJavaScript call.
+
+A COM run needs a separate round trip for every place, bounds read,
+resize, translate, opacity change, save and layer removal (around 15 per
+image). A JsxBatch records the same steps and JsxExecutor sends them in
+one call. The script returns the final layer bounds and a status as JSON.
+
+Documents are reset between images by restoring a history snapshot of
+the clean template (see snapshot_script/restore_snapshot_script), so the
+reset is one operation however many layers were added.
+"""
+
+import json
+from typing import Dict, List, Optional
+
+
+class JsxError(Exception):
+    """Raised when the compiled script reports a failure"""
+    pass
+
+
+# Helpers available to every compiled script. ExtendScript has no JSON
+# object, so results are serialised by hand.
+_PRELUDE = r"""
+var doc = app.activeDocument;
+var result = {status: "ok", step: "", layers: {}};
+var savedUnits = app.preferences.rulerUnits;
+app.preferences.rulerUnits = Units.PIXELS;
+
+function toJSON(value) {
+    if (value === null || value === undefined) { return "null"; }
+    if (typeof value === "number") { return isFinite(value) ? String(value) : "null"; }
+    if (typeof value === "boolean") { return value ? "true" : "false"; }
+    if (typeof value === "string") {
+        return '"' + value.replace(/\\/g, "\\\\").replace(/"/g, '\\"').replace(/\n/g, "\\n").replace(/\r/g, "\\r") + '"';
+    }
+    var parts = [];
+    if (value instanceof Array) {
+        for (var i = 0; i < value.length; i++) { parts.push(toJSON(value[i])); }
+        return "[" + parts.join(",") + "]";
+    }
+    for (var key in value) {
+        if (value.hasOwnProperty(key)) { parts.push(toJSON(key) + ":" + toJSON(value[key])); }
+    }
+    return "{" + parts.join(",") + "}";
+}
+
+function boundsOf(layer) {
+    var b = layer.bounds;
+    return [b[0].as("px"), b[1].as("px"), b[2].as("px"), b[3].as("px")];
+}
+
+function placeFile(path) {
+    var desc = new ActionDescriptor();
+    desc.putPath(charIDToTypeID("null"), new File(path));
+    executeAction(charIDToTypeID("Plc "), desc, DialogModes.NO);
+    return doc.activeLayer;
+}
+
+function moveTo(layer, x, y) {
+    var b = boundsOf(layer);
+    layer.translate(x - b[0], y - b[1]);
+}
+
+function resizeTo(layer, width, height) {
+    var b = boundsOf(layer);
+    layer.resize(width / (b[2] - b[0]) * 100, height / (b[3] - b[1]) * 100, AnchorPosition.MIDDLECENTER);
+}
+
+function exportLayer(layer, path) {
+    // Copy the layer into a transparent document the size of this one and save it as PNG
+    var target = app.documents.add(doc.width, doc.height, doc.resolution, "layer-export",
+                                   NewDocumentMode.RGB, DocumentFill.TRANSPARENT);
+    app.activeDocument = doc;
+    layer.duplicate(target, ElementPlacement.PLACEATBEGINNING);
+    app.activeDocument = target;
+    target.saveAs(new File(path), new PNGSaveOptions(), true, Extension.LOWERCASE);
+    target.close(SaveOptions.DONOTSAVECHANGES);
+    app.activeDocument = doc;
+}
+"""
+
+_EPILOGUE = r"""
+app.preferences.rulerUnits = savedUnits;
+"""
+
+# JPEGSaveOptions.formatOptions values by their ExtendScript names
+_FORMAT_OPTIONS = {1: "STANDARDBASELINE", 2: "OPTIMIZEDBASELINE", 3: "PROGRESSIVE"}
+
+# Name of the history snapshot holding the clean template
+TEMPLATE_SNAPSHOT = "clean-template"
+
+
+def _restore_snapshot_statement(name: str) -> str:
+    return f"app.activeDocument.activeHistoryState = app.activeDocument.historyStates.getByName({json.dumps(name)});"
+
+
+def snapshot_script(name: str = TEMPLATE_SNAPSHOT) -> str:
+    """
+    Script that snapshots the active document's current state. Snapshots
+    are not dropped by the history-state limit, unlike plain history states.
+    """
+    return (
+        "(function () {\n"
+        "var desc = new ActionDescriptor();\n"
+        "var snapshot = new ActionReference();\n"
+        "snapshot.putClass(charIDToTypeID(\"SnpS\"));\n"
+        "desc.putReference(charIDToTypeID(\"null\"), snapshot);\n"
+        "var current = new ActionReference();\n"
+        "current.putProperty(charIDToTypeID(\"HstS\"), charIDToTypeID(\"CrnH\"));\n"
+        "desc.putReference(charIDToTypeID(\"From\"), current);\n"
+        f"desc.putString(charIDToTypeID(\"Nm  \"), {json.dumps(name)});\n"
+        "desc.putEnumerated(charIDToTypeID(\"Usng\"), charIDToTypeID(\"HstS\"), charIDToTypeID(\"FllD\"));\n"
+        "executeAction(charIDToTypeID(\"Mk  \"), desc, DialogModes.NO);\n"
+        "return \"ok\";\n"
+        "})();\n"
+    )
+
+
+def restore_snapshot_script(name: str = TEMPLATE_SNAPSHOT) -> str:
+    """Script that returns the active document to a snapshot"""
+    return _restore_snapshot_statement(name) + "\n"
+
+
+def _js(value) -> str:
+    """Python value as a JavaScript literal"""
+    return json.dumps(value)
+
+
+def export_layer_script(path: str) -> str:
+    """Script that saves the active layer, at its place in the document, as a transparent PNG"""
+    return (
+        "(function () {\n"
+        f"{_PRELUDE}\n"
+        f"exportLayer(doc.activeLayer, {_js(path)});\n"
+        f"{_EPILOGUE}\n"
+        "return \"ok\";\n"
+        "})();\n"
+    )
+
+
+class JsxBatch:
+    """Records the Photoshop steps for one image as ExtendScript statements"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self.layer_count = 0
+
+    def _step(self, name: str, code: str):
+        self.statements.append(f"result.step = {_js(name)};\n{code}")
+
+    def place(self, path: str, name: Optional[str] = None) -> str:
+        """Place a file and return the variable holding its layer"""
+        layer = f"layer{self.layer_count}"
+        self.layer_count += 1
+        code = f"var {layer} = placeFile({_js(path)});"
+        if name:
+            code += f"\n{layer}.name = {_js(name)};"
+        self._step("place", code)
+        return layer
+
+    def remove_background(self, layer: str, action: str = "remove_bg", action_set: str = "Default Actions"):
+        self._step("remove_bg", f"app.doAction({_js(action)}, {_js(action_set)});")
+
+    def transform(self, layer: str, size: List[float], position: List[float], opacity: float = 100,
+                  rotate: float = 0):
+        """Resize by percentage, move the bounds' top-left corner to position, rotate and set opacity"""
+        code = ""
+        if size[0] != 100 or size[1] != 100:
+            code += f"{layer}.resize({_js(size[0])}, {_js(size[1])}, AnchorPosition.MIDDLECENTER);\n"
+        code += f"moveTo({layer}, {_js(position[0])}, {_js(position[1])});\n"
+        if rotate:
+            code += f"{layer}.rotate({_js(rotate)}, AnchorPosition.MIDDLECENTER);\n"
+        code += f"{layer}.opacity = {_js(opacity)};"
+        self._step("transform", code)
+
+    def fit(self, layer: str, size: List[float], position: List[float], opacity: float = 100):
+        """Resize to an absolute pixel size, then move and set opacity"""
+        self._step(
+            "fit",
+            f"resizeTo({layer}, {_js(size[0])}, {_js(size[1])});\n"
+            f"moveTo({layer}, {_js(position[0])}, {_js(position[1])});\n"
+            f"{layer}.opacity = {_js(opacity)};"
+        )
+
+    def export_layer(self, layer: str, path: str):
+        """Save the layer, at its place in the document, as a transparent PNG"""
+        self._step("export", f"exportLayer({layer}, {_js(path)});")
+
+    def record_bounds(self, layer: str, key: str):
+        """Include a layer's current bounds in the result under key"""
+        self._step("bounds", f"result.layers[{_js(key)}] = boundsOf({layer});")
+
+    def save_jpeg(self, path: str, quality: int = 12, format_options: int = 1):
+        """format_options: 1 standard baseline, 2 optimized baseline, 3 progressive"""
+        self._step(
+            "save",
+            "var jpegOptions = new JPEGSaveOptions();\n"
+            f"jpegOptions.quality = {int(quality)};\n"
+            f"jpegOptions.formatOptions = FormatOptions.{_FORMAT_OPTIONS[format_options]};\n"
+            + ("jpegOptions.scans = 3;\n" if format_options == 3 else "")
+            + f"doc.saveAs(new File({_js(path)}), jpegOptions, true, Extension.LOWERCASE);"
+        )
+
+    def compile(self, snapshot: Optional[str] = TEMPLATE_SNAPSHOT) -> str:
+        """
+        Build the script. Steps run inside try/catch; afterwards the document
+        is restored to the named snapshot (None skips the reset), even on failure.
+        """
+        body = "\n".join(self.statements)
+        cleanup = ""
+        if snapshot is not None:
+            cleanup = _restore_snapshot_statement(snapshot)
+        return (
+            "(function () {\n"
+            f"{_PRELUDE}\n"
+            "try {\n"
+            f"{body}\n"
+            "result.step = \"done\";\n"
+            "} catch (e) {\n"
+            "result.status = \"error\";\n"
+            "result.error = String(e) + (e.line ? \" (line \" + e.line + \")\" : \"\");\n"
+            "}\n"
+            "try {\n"
+            f"{cleanup}\n"
+            "} catch (e) {\n"
+            "result.cleanup_error = String(e);\n"
+            "}\n"
+            f"{_EPILOGUE}\n"
+            "return toJSON(result);\n"
+            "})();\n"
+        )
+
+
+class JsxExecutor:
+    """Runs compiled batches through app.doJavaScript"""
+
+    def __init__(self, app):
+        self.app = app
+        self.round_trips = 0
+
+    def run(self, batch: JsxBatch, snapshot: Optional[str] = TEMPLATE_SNAPSHOT) -> Dict:
+        """Run a batch and return the parsed result; raise JsxError if a step failed"""
+        self.round_trips += 1
+        raw = self.app.doJavaScript(batch.compile(snapshot))
+        try:
+            result = json.loads(raw)
+        except (TypeError, ValueError):
+            raise JsxError(f"Unexpected script result: {raw!r}")
+        if result.get('status') != "ok":
+            raise JsxError(f"{result.get('error', 'unknown error')} during {result.get('step')}")
+        return result
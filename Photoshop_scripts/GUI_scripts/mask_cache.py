@@ -0,0 +1,261 @@
+"""
+Mask Cache
+---------
+Keeps the alpha mask from each background removal so the same mockup is
+never sent through the "remove_bg" action twice.
+
+- Masks are keyed by a hash of the source image bytes and the removal
+  method, and stored at the source's resolution as compressed
+  single-channel PNGs next to an on-disk index
+- On a hit the source is placed with the mask applied instead of running
+  the action: Photoshop places a masked PNG (written once per mask), the
+  headless backend applies the mask in memory, so headless runs can
+  remove backgrounds that Photoshop has removed before
+- On a miss the Photoshop backends export the removed layer once and its
+  alpha is cropped to the placed image and scaled back to the source size;
+  a headless run with a local remover stores that remover's mask under its
+  own method, and still prefers Photoshop's mask where there is one
+- The store is kept under a size limit (least recently used first) and
+  optionally a maximum age; summary() reports the hit rate
+- Bookkeeping is kept like result_cache.py's: a running byte total, an
+  index in least recently used order and at most MAX_FILE_HASHES source
+  hashes. A run stores masks from its worker thread while the GUI looks
+  them up from its own thread for placements, so the index is guarded by
+  a lock
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from jsx_executor import export_layer_script
+from result_cache import sha256_file
+
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), "Photoshop_scripts/cache/masks")
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2  # 512 MB
+DEFAULT_METHOD = "remove_bg/Default Actions"
+# Source hashes remembered between runs
+MAX_FILE_HASHES = 20000
+
+
+def mask_from_layer(layer_path: str, placed_bounds: List[float], source_size) -> np.ndarray:
+    """
+    Alpha of an exported document-sized layer PNG, cropped to where the
+    source was placed and scaled back to the source's (width, height)
+    """
+    with Image.open(layer_path) as img:
+        alpha = img.convert("RGBA").getchannel("A")
+    left, top, right, bottom = (int(round(float(value))) for value in placed_bounds)
+    alpha = alpha.crop((left, top, right, bottom))  # Areas off the document come back transparent
+    if alpha.size != tuple(source_size):
+        alpha = alpha.resize(tuple(source_size), Image.LANCZOS)
+    return np.asarray(alpha)
+
+
+class MaskCache:
+    def __init__(self, cache_dir: str = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_days: Optional[float] = None, read_only: bool = False):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days  # None keeps masks until they are evicted for space
+        self.read_only = read_only  # put() stores nothing, e.g. in worker processes sharing the store
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self):
+        """Load the index, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            # Least recently used first, so eviction takes entries from the front
+            self.entries: Dict[str, Dict] = dict(sorted(index.get('entries', {}).items(),
+                                                        key=lambda item: item[1]['last_used']))
+            self.file_hashes: Dict[str, list] = index.get('file_hashes', {})
+        except (OSError, ValueError):
+            self.entries = {}
+            self.file_hashes = {}
+        self._total_bytes = sum(entry['size'] for entry in self.entries.values())
+
+    def save(self):
+        """Write the index to disk if it changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({'entries': self.entries, 'file_hashes': self.file_hashes}, f)
+            os.replace(temp_path, self.index_path)
+            self._dirty = False
+
+    def key_for(self, source_path: str, method: str = DEFAULT_METHOD) -> str:
+        """Key for a source's mask; the same image bytes give the same key wherever the file is"""
+        path = os.path.abspath(source_path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self.file_hashes.pop(path, None)
+            if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                # Re-inserted, so the dict stays in least recently used order
+                self.file_hashes[path] = known
+                digest = known[2]
+            else:
+                known = None
+        if known is None:
+            digest = sha256_file(path)
+            with self._lock:
+                self.file_hashes[path] = [stat.st_size, stat.st_mtime_ns, digest]
+                while len(self.file_hashes) > MAX_FILE_HASHES:
+                    del self.file_hashes[next(iter(self.file_hashes))]
+                self._dirty = True
+        return hashlib.sha256(json.dumps({'source': digest, 'method': method}).encode("utf-8")).hexdigest()
+
+    def _mask_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def _masked_source_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}-rgba.png")
+
+    def incoming_path(self, key: str) -> str:
+        """Where Photoshop writes an exported layer before its mask is stored"""
+        return os.path.join(self.cache_dir, "incoming", f"{key}.png")
+
+    def lookup(self, key: str) -> bool:
+        """Whether a mask is stored for key; counts towards the hit rate"""
+        return self.lookup_any([key]) is not None
+
+    def lookup_any(self, keys: List[str]) -> Optional[str]:
+        """The first of keys with a stored mask, or None; counts as one hit or miss"""
+        with self._lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry and os.path.exists(self._mask_path(key)):
+                    entry['last_used'] = time.time()
+                    self.entries[key] = self.entries.pop(key)  # Now the most recently used
+                    self._dirty = True
+                    self.hits += 1
+                    return key
+            self.misses += 1
+            return None
+
+    def load(self, key: str) -> np.ndarray:
+        """The stored mask as a uint8 (height, width) array"""
+        with Image.open(self._mask_path(key)) as img:
+            return np.asarray(img.convert("L"))
+
+    def put(self, key: str, mask: np.ndarray):
+        """Store a uint8 mask at the source's resolution"""
+        if self.read_only:
+            return
+        mask_path = self._mask_path(key)
+        os.makedirs(os.path.dirname(mask_path), exist_ok=True)
+        Image.fromarray(mask, "L").save(mask_path, optimize=True)
+        now = time.time()
+        entry = {
+            'size': os.path.getsize(mask_path),
+            'created': now,
+            'last_used': now
+        }
+        with self._lock:
+            replaced = self.entries.pop(key, None)
+            if replaced:
+                self._total_bytes -= replaced['size']
+                try:
+                    os.remove(self._masked_source_path(key))  # Made from the old mask
+                except OSError:
+                    pass
+            self.entries[key] = entry
+            self._total_bytes += entry['size']
+            self._dirty = True
+            self.evict()
+
+    def put_from_layer(self, key: str, layer_path: str, placed_bounds: List[float], source_path: str):
+        """Store the mask from a layer PNG Photoshop exported, then delete the PNG"""
+        try:
+            with Image.open(source_path) as img:
+                source_size = img.size
+            self.put(key, mask_from_layer(layer_path, placed_bounds, source_size))
+        finally:
+            try:
+                os.remove(layer_path)
+            except OSError:
+                pass
+
+    def capture(self, app, key: str, source_path: str, placed_bounds: List[float]):
+        """Export Photoshop's active layer (after remove_bg) and store its mask"""
+        layer_path = self.incoming_path(key)
+        os.makedirs(os.path.dirname(layer_path), exist_ok=True)
+        app.doJavaScript(export_layer_script(layer_path))
+        self.put_from_layer(key, layer_path, placed_bounds, source_path)
+
+    def masked_source(self, key: str, source_path: str) -> str:
+        """An RGBA PNG of the source with its mask as alpha, for placing in Photoshop"""
+        path = self._masked_source_path(key)
+        if not os.path.exists(path):
+            with Image.open(source_path) as img:
+                masked = img.convert("RGBA")
+            alpha = np.minimum(np.asarray(masked.getchannel("A")), self.load(key))
+            masked.putalpha(Image.fromarray(alpha, "L"))
+            masked.save(path, compress_level=1)  # Written once, placed every run; favour speed
+            size = os.path.getsize(path)
+            with self._lock:
+                entry = self.entries.get(key)
+                if entry:
+                    entry['size'] += size
+                    self._total_bytes += size
+                    self._dirty = True
+                    self.evict()
+        return path
+
+    def _remove(self, key: str):
+        for path in (self._mask_path(key), self._masked_source_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._total_bytes -= self.entries.pop(key)['size']
+        self._dirty = True
+
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def evict(self):
+        """Drop masks older than max_age_days, then least recently used ones until the store fits"""
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                while self.entries and self.entries[next(iter(self.entries))]['last_used'] < cutoff:
+                    self._remove(next(iter(self.entries)))
+            while self._total_bytes > self.max_bytes and self.entries:
+                self._remove(next(iter(self.entries)))
+
+    def clear(self):
+        """Remove every stored mask"""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.entries = {}
+            self.file_hashes = {}
+            self._total_bytes = 0
+            self._dirty = True
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = (self.hits / lookups * 100) if lookups else 0.0
+        return (
+            f"Mask cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+            f"{len(self.entries)} masks, {self.total_bytes() / 1024 ** 2:.1f} MB"
+        )
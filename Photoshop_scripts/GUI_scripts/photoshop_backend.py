@@ -0,0 +1,197 @@
+"""
+Photoshop Backend
+---------------
+Runs the compositing steps through a live Photoshop session.
+These are the only backends that can run the recorded "remove_bg" action.
+- PhotoshopBackend: one COM call per step, the original behaviour
+- PhotoshopJsxBackend: every step for an image in one doJavaScript call
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from compositing_backend import CompositingBackend
+from jsx_executor import JsxBatch, JsxExecutor, restore_snapshot_script
+from ps_session import SessionPool
+from ps_wait import PhotoshopWaiter, resized_bounds
+
+
+class PhotoshopBackend(CompositingBackend):
+    name = "photoshop"
+    supports_background_removal = True
+    needs_watchdog = True
+
+    def __init__(self,
+                 template_path: str,
+                 watermark_path: str,
+                 waiter: Optional[PhotoshopWaiter] = None,
+                 session_pool: Optional[SessionPool] = None):
+        super().__init__(template_path, watermark_path)
+        self.ps = None
+        self.waiter = waiter or PhotoshopWaiter()
+        self.session_pool = session_pool or SessionPool()
+
+    def open(self, log=None):
+        super().open(log)
+        # The pool keeps the template open between runs and hands it back clean;
+        # every image is undone back to its snapshot
+        self.ps = self.session_pool.acquire(self.template_path, self.log)
+        self.has_snapshot = self.session_pool.has_snapshot(self.template_path)
+
+    def close(self):
+        if self.ps:
+            self.log(self.session_pool.summary())
+        self.ps = None
+
+    def abandon_session(self, thread_id: int):
+        self.session_pool.invalidate(self.template_path, thread_id)
+        self.ps = None
+
+    def _place(self, path: str, step: str = "place"):
+        """Place a file on the active document and wait for the new layer"""
+        document = self.ps.active_document
+        layers_before = len(document.artLayers)
+        desc = self.ps.ActionDescriptor
+        desc.putPath(self.ps.app.charIDToTypeID("null"), path)
+        self.ps.app.executeAction(self.ps.app.charIDToTypeID("Plc "), desc)
+        self.waiter.for_layer_count(document, layers_before + 1, step)
+
+    def place_image(self, image_path: str):
+        self._place(image_path)
+        return self.ps.active_document.artLayers[0]
+
+    def remove_background(self, layer):
+        if self.mask_cache:
+            # Where the whole image sits, to crop the mask to later
+            self.placed_bounds = list(layer.bounds)
+        self.ps.app.doAction("remove_bg", "Default Actions")
+        self.waiter.for_stable_bounds(layer, "remove_bg")
+
+    def capture_mask(self, layer, image_path: str, mask_key: str):
+        try:
+            self.mask_cache.capture(self.ps.app, mask_key, image_path, self.placed_bounds)
+        except Exception as e:
+            self.log(f"Could not cache the background mask: {str(e)}")
+
+    def transform_layer(self, layer, size: List[float], position: List[float], opacity: float = 100,
+                        rotate: float = 0):
+        if size[0] != 100 or size[1] != 100:
+            bounds_before = layer.bounds
+            layer.resize(size[0], size[1])
+            self.waiter.for_bounds_change(layer, bounds_before, "resize", resized_bounds(bounds_before, size))
+
+        current_bounds = layer.bounds
+        layer.translate(position[0] - current_bounds[0], position[1] - current_bounds[1])
+        if rotate:
+            layer.rotate(rotate)  # About the centre by default
+            # 180 degrees, 90 on a square or round artwork keep the same bounds
+            self.waiter.for_stable_bounds(layer, "rotate")
+        layer.opacity = opacity
+
+    def place_watermark(self, settings: Dict):
+        self._place(self.watermark_path, "place watermark")
+
+        # Get the watermark layer
+        watermark_layer = self.ps.active_document.artLayers[0]
+        watermark_layer.name = "Lady-Cosmica-Watermark"
+
+        # Get current dimensions
+        current_bounds = watermark_layer.bounds
+        current_width = current_bounds[2] - current_bounds[0]
+        current_height = current_bounds[3] - current_bounds[1]
+        self.log.debug("DEBUG: Current watermark dimensions: %s x %s", current_width, current_height)
+
+        target_width, target_height = settings['size']
+        self.log.debug("DEBUG: Target dimensions: %s x %s", target_width, target_height)
+
+        # Calculate resize percentages
+        width_scale = (target_width / current_width) * 100
+        height_scale = (target_height / current_height) * 100
+        self.log.debug("DEBUG: Scale factors: %s%% x %s%%", width_scale, height_scale)
+
+        self.transform_layer(
+            watermark_layer,
+            [width_scale, height_scale],
+            settings['position'],
+            settings['opacity']
+        )
+
+    def save_jpeg(self, output_path: str):
+        options = self.ps.JPEGSaveOptions(quality=self.jpeg_profile.photoshop_quality)
+        options.formatOptions = self.jpeg_profile.photoshop_format
+        if self.jpeg_profile.progressive:
+            options.scans = 3
+        self.ps.active_document.saveAs(output_path, options, asCopy=True)
+
+    def reset_document(self):
+        if self.has_snapshot:
+            self.ps.app.doJavaScript(restore_snapshot_script())
+        else:
+            self.cleanup_layers()
+
+    def cleanup_layers(self, keep_template: bool = True):
+        """Remove layers one by one; used when the template snapshot is unavailable"""
+        min_layers = 1 if keep_template else 0
+        document = self.ps.active_document
+        while len(document.artLayers) > min_layers:
+            count_before = len(document.artLayers)
+            document.artLayers[0].remove()
+            self.waiter.for_layer_removed(document, count_before)
+
+
+class PhotoshopJsxBackend(PhotoshopBackend):
+    """
+    Records the steps for each image and sends them to Photoshop as one
+    ExtendScript program when the image is finished (in reset_document),
+    instead of one COM call per step.
+    """
+    name = "photoshop-jsx"
+
+    def open(self, log=None):
+        super().open(log)
+        self.executor = JsxExecutor(self.ps.app)
+        self.batch = JsxBatch()
+        self.pending_masks = []  # (mask key, image path, exported layer path) for the current batch
+
+    def place_image(self, image_path: str):
+        return self.batch.place(image_path)
+
+    def remove_background(self, layer):
+        if self.mask_cache:
+            self.batch.record_bounds(layer, "placed")
+        self.batch.remove_background(layer)
+
+    def capture_mask(self, layer, image_path: str, mask_key: str):
+        # Exported by the batch; the mask is stored once the batch has run
+        layer_path = self.mask_cache.incoming_path(mask_key)
+        os.makedirs(os.path.dirname(layer_path), exist_ok=True)
+        self.batch.export_layer(layer, layer_path)
+        self.pending_masks.append((mask_key, image_path, layer_path))
+
+    def transform_layer(self, layer, size: List[float], position: List[float], opacity: float = 100,
+                        rotate: float = 0):
+        self.batch.transform(layer, size, position, opacity, rotate)
+
+    def place_watermark(self, settings: Dict):
+        layer = self.batch.place(self.watermark_path, "Lady-Cosmica-Watermark")
+        self.batch.fit(layer, settings['size'], settings['position'], settings['opacity'])
+        self.batch.record_bounds(layer, "watermark")
+
+    def save_jpeg(self, output_path: str):
+        self.batch.save_jpeg(output_path, self.jpeg_profile.photoshop_quality, self.jpeg_profile.photoshop_format)
+
+    def reset_document(self):
+        batch, self.batch = self.batch, JsxBatch()
+        pending_masks, self.pending_masks = self.pending_masks, []
+        if not self.has_snapshot:
+            result = self.executor.run(batch, snapshot=None)
+            self.cleanup_layers()
+        else:
+            result = self.executor.run(batch)
+        if 'watermark' in result['layers']:
+            self.log.debug("DEBUG: Watermark bounds: %s", result['layers']['watermark'])
+        for mask_key, image_path, layer_path in pending_masks:
+            try:
+                self.mask_cache.put_from_layer(mask_key, layer_path, result['layers']['placed'], image_path)
+            except Exception as e:
+                self.log(f"Could not cache the background mask: {str(e)}")
@@ -0,0 +1,327 @@
+"""
+Placement Preview
+----------------
+Calibrates context placements on a downscaled proxy of the template
+instead of a full-resolution Photoshop document.
+
+- The template and sample are decoded once and shrunk so the longest
+  template side is PROXY_MAX_SIDE; JPEGs are decoded at reduced size
+- Layers are placed like Photoshop's Place (fit to the template, centred,
+  cropped to their opaque pixels) and their geometry is kept in template
+  pixels; the proxy is only what is drawn, so settings scale back exactly
+- placement_settings() returns the same dict confirm_placement() builds
+  ('size' in percent, 'position' and the watermark in template pixels)
+- PlacementPreviewWindow lets the user drag, scale and fade the sample
+  (and the watermark) inside the GUI
+
+The sample is placed with its background removed, because real runs
+measure 'size' against the background-removed layer. The caller passes
+either a masked source (from the mask cache) or a local remover
+(bg_removal.py), which runs on the reduced decode.
+
+Run this file directly to time proxy setup and redraws:
+    python placement_preview.py [size]
+"""
+
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from preset_registry import normalize_watermark
+
+PROXY_MAX_SIDE = 800
+
+
+def _open_reduced(path: str, max_side: int) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Decode an image near max_side (JPEGs decode at 1/2-1/8 scale); returns it and its full size"""
+    with Image.open(path) as img:
+        full_size = img.size
+        img.draft("RGB", (max_side, max_side))  # No-op for formats without reduced decoding
+        img = img.convert("RGBA")
+    return img, full_size
+
+
+class ProxyLayer:
+    """A placed layer; geometry in template pixels, pixels at a reduced size"""
+
+    def __init__(self, image: Image.Image, left: float, top: float, width: float, height: float,
+                 opacity: float = 100):
+        self.image = image  # Cropped to its opaque pixels
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.base_width = width  # Size as placed, which 'size' percentages refer to
+        self.base_height = height
+        self.opacity = opacity
+        self._scaled: Dict[Tuple[int, int], Image.Image] = {}
+
+    @property
+    def scale_percent(self) -> float:
+        return self.width / self.base_width * 100
+
+    def set_scale(self, percent: float):
+        """Resize around the layer's centre"""
+        centre_x, centre_y = self.left + self.width / 2, self.top + self.height / 2
+        self.width = self.base_width * percent / 100
+        self.height = self.base_height * percent / 100
+        self.left, self.top = centre_x - self.width / 2, centre_y - self.height / 2
+
+    def scaled(self, width: int, height: int) -> Image.Image:
+        """The layer resampled to a proxy size; kept for the next redraw at the same size"""
+        key = (max(1, width), max(1, height))
+        image = self._scaled.get(key)
+        if image is None:
+            # Premultiplied so transparent pixels do not bleed into the edge
+            image = self.image.convert("RGBa").resize(key, Image.BILINEAR).convert("RGBA")
+            if len(self._scaled) > 8:
+                self._scaled.clear()
+            self._scaled[key] = image
+        return image
+
+
+class PlacementProxy:
+    """A downscaled template with the sample (and optionally the watermark) placed on it"""
+
+    def __init__(self, template_path: str, max_side: int = PROXY_MAX_SIDE):
+        template, self.template_size = _open_reduced(template_path, max_side)
+        width, height = self.template_size
+        self.scale = min(max_side / max(width, height), 1.0)
+        self.proxy_size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        self.max_side = max_side
+        # Flatten onto white, as the saved JPEG will be
+        background = Image.new("RGBA", self.proxy_size, (255, 255, 255, 255))
+        self.background = Image.alpha_composite(background, template.resize(self.proxy_size, Image.BILINEAR))
+        self.image_layer: Optional[ProxyLayer] = None
+        self.watermark_layer: Optional[ProxyLayer] = None
+
+    def to_template(self, proxy_value: float) -> float:
+        return proxy_value / self.scale
+
+    def _place(self, path: str, crop: bool, bg_remover=None) -> ProxyLayer:
+        """
+        Fit to the template and centre like Photoshop's Place, optionally cropped
+        to opaque pixels after bg_remover (bg_removal.BackgroundRemover) has run
+        """
+        image, (full_width, full_height) = _open_reduced(path, self.max_side)
+        if bg_remover is not None:
+            alpha = bg_remover.mask(np.asarray(image, dtype=np.float32) / 255.0)
+            image.putalpha(Image.fromarray(np.clip(alpha * 255.0 + 0.5, 0, 255).astype(np.uint8), "L"))
+        canvas_width, canvas_height = self.template_size
+        fit = min(canvas_width / full_width, canvas_height / full_height, 1.0)
+        placed_width, placed_height = round(full_width * fit), round(full_height * fit)
+        left, top = (canvas_width - placed_width) // 2, (canvas_height - placed_height) // 2
+
+        # Template pixels per decoded pixel
+        ratio_x, ratio_y = placed_width / image.width, placed_height / image.height
+        # Bounds come from the decoded pixels (full size for PNGs), so they stay exact
+        bounds = image.getchannel("A").getbbox() if crop else None
+        if bounds:
+            image = image.crop(bounds)
+            x0, y0, x1, y1 = bounds
+            geometry = (left + x0 * ratio_x, top + y0 * ratio_y, (x1 - x0) * ratio_x, (y1 - y0) * ratio_y)
+        else:
+            geometry = (left, top, placed_width, placed_height)
+        # Only proxy-sized pixels are kept for drawing
+        image.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+        return ProxyLayer(image, *geometry)
+
+    def place_image(self, image_path: str, bg_remover=None) -> ProxyLayer:
+        """Place the sample; bg_remover removes its background first (pass None if it already has)"""
+        self.image_layer = self._place(image_path, crop=True, bg_remover=bg_remover)
+        return self.image_layer
+
+    def place_watermark(self, watermark_path: str, settings: Optional[Dict] = None) -> ProxyLayer:
+        """Place the watermark, at earlier watermark settings (from any template size) if given"""
+        layer = self._place(watermark_path, crop=False)
+        if settings:
+            watermark = normalize_watermark(settings).for_template(self.template_size)
+            layer.left, layer.top = watermark.position
+            layer.width, layer.height = watermark.size
+            layer.opacity = watermark.opacity
+        self.watermark_layer = layer
+        return layer
+
+    @property
+    def layers(self) -> List[ProxyLayer]:
+        return [layer for layer in (self.image_layer, self.watermark_layer) if layer]
+
+    def move(self, layer: ProxyLayer, proxy_dx: float, proxy_dy: float):
+        """Move by a distance in proxy pixels"""
+        layer.left += self.to_template(proxy_dx)
+        layer.top += self.to_template(proxy_dy)
+
+    def layer_at(self, proxy_x: float, proxy_y: float) -> Optional[ProxyLayer]:
+        """Topmost layer under a proxy point"""
+        x, y = self.to_template(proxy_x), self.to_template(proxy_y)
+        for layer in reversed(self.layers):
+            if layer.left <= x < layer.left + layer.width and layer.top <= y < layer.top + layer.height:
+                return layer
+        return None
+
+    def render(self) -> Image.Image:
+        """The proxy template with every layer drawn on, as RGB"""
+        canvas = self.background.copy()
+        for layer in self.layers:
+            scaled = layer.scaled(round(layer.width * self.scale), round(layer.height * self.scale))
+            if layer.opacity < 100:
+                alpha = scaled.getchannel("A").point(lambda a: a * layer.opacity / 100)
+                scaled = scaled.copy()
+                scaled.putalpha(alpha)
+            # paste() clips layers hanging off the edge; alpha_composite() does not allow that
+            overlay = Image.new("RGBA", self.proxy_size, (0, 0, 0, 0))
+            overlay.paste(scaled, (round(layer.left * self.scale), round(layer.top * self.scale)))
+            canvas.alpha_composite(overlay)
+        return canvas.convert("RGB")
+
+    def placement_settings(self) -> Dict:
+        """Settings in the format confirm_placement() returns, in template pixels"""
+        layer = self.image_layer
+        settings = {
+            'size': [layer.width / layer.base_width * 100, layer.height / layer.base_height * 100],
+            'position': [int(round(layer.left)), int(round(layer.top))],
+            'opacity': layer.opacity,
+            'template_size': list(self.template_size)
+        }
+        if self.watermark_layer:
+            watermark = self.watermark_layer
+            settings['watermark'] = {
+                'position': [int(round(watermark.left)), int(round(watermark.top))],
+                'size': [int(round(watermark.width)), int(round(watermark.height))],
+                'opacity': watermark.opacity,
+                'template_size': list(self.template_size)
+            }
+        return settings
+
+
+class PlacementPreviewWindow:
+    """
+    Toplevel window for one proxy placement. Drag a layer to move it; the
+    sliders scale and fade the selected layer. on_confirm receives
+    placement_settings(); closing the window cancels.
+    """
+
+    def __init__(self, master, proxy: PlacementProxy, title: str,
+                 on_confirm: Callable[[Dict], None], on_cancel: Optional[Callable[[], None]] = None):
+        import tkinter as tk
+        import customtkinter as ctk
+        from PIL import ImageTk
+
+        self._image_tk = ImageTk
+        self.proxy = proxy
+        self.on_confirm = on_confirm
+        self.on_cancel = on_cancel
+        self.selected = proxy.image_layer
+        self._drag_from = None
+
+        self.window = ctk.CTkToplevel(master)
+        self.window.title(title)
+        self.window.protocol("WM_DELETE_WINDOW", self._cancel)
+
+        width, height = proxy.proxy_size
+        self.canvas = tk.Canvas(self.window, width=width, height=height, highlightthickness=0)
+        self.canvas.pack(padx=10, pady=10)
+        self._canvas_image = self.canvas.create_image(0, 0, anchor="nw")
+        self.canvas.bind("<ButtonPress-1>", self._start_drag)
+        self.canvas.bind("<B1-Motion>", self._drag)
+        self.canvas.bind("<ButtonRelease-1>", lambda event: setattr(self, '_drag_from', None))
+
+        controls = ctk.CTkFrame(self.window)
+        controls.pack(fill="x", padx=10, pady=5)
+        self.layer_label = ctk.CTkLabel(controls, text="")
+        self.layer_label.pack(side="left", padx=5)
+
+        ctk.CTkLabel(controls, text="Scale %").pack(side="left", padx=5)
+        self.scale_slider = ctk.CTkSlider(controls, from_=5, to=300, command=self._set_scale, width=160)
+        self.scale_slider.pack(side="left", padx=5)
+        ctk.CTkLabel(controls, text="Opacity").pack(side="left", padx=5)
+        self.opacity_slider = ctk.CTkSlider(controls, from_=0, to=100, command=self._set_opacity, width=120)
+        self.opacity_slider.pack(side="left", padx=5)
+
+        ctk.CTkButton(controls, text="Confirm", command=self._confirm, width=100).pack(side="right", padx=5)
+        ctk.CTkButton(controls, text="Cancel", command=self._cancel, width=80,
+                      fg_color="#8B0000", hover_color="#A52A2A").pack(side="right", padx=5)
+
+        self._select(self.selected)
+        self._redraw()
+
+    def _select(self, layer: ProxyLayer):
+        self.selected = layer
+        name = "Watermark" if layer is self.proxy.watermark_layer else "Image"
+        self.layer_label.configure(text=f"Selected: {name}")
+        self.scale_slider.set(layer.scale_percent)
+        self.opacity_slider.set(layer.opacity)
+
+    def _redraw(self):
+        # Keep a reference or Tk drops the image
+        self._photo = self._image_tk.PhotoImage(self.proxy.render())
+        self.canvas.itemconfigure(self._canvas_image, image=self._photo)
+
+    def _start_drag(self, event):
+        layer = self.proxy.layer_at(event.x, event.y)
+        if layer:
+            self._select(layer)
+        self._drag_from = (event.x, event.y)
+
+    def _drag(self, event):
+        if not self._drag_from:
+            return
+        self.proxy.move(self.selected, event.x - self._drag_from[0], event.y - self._drag_from[1])
+        self._drag_from = (event.x, event.y)
+        self._redraw()
+
+    def _set_scale(self, percent: float):
+        self.selected.set_scale(percent)
+        self._redraw()
+
+    def _set_opacity(self, opacity: float):
+        self.selected.opacity = round(opacity)
+        self._redraw()
+
+    def _confirm(self):
+        settings = self.proxy.placement_settings()
+        self.window.destroy()
+        self.on_confirm(settings)
+
+    def _cancel(self):
+        self.window.destroy()
+        if self.on_cancel:
+            self.on_cancel()
+
+
+def run_benchmark(size: int = 4000, redraws: int = 50):
+    """Print proxy setup time and time per redraw while dragging"""
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template_path = os.path.join(temp_dir, "template.png")
+        sample_path = os.path.join(temp_dir, "sample.jpg")
+        watermark_path = os.path.join(temp_dir, "watermark.png")
+        Image.new("RGB", (size, size), (240, 240, 240)).save(template_path)
+        Image.new("RGB", (size * 3 // 4, size), (120, 80, 200)).save(sample_path, quality=90)
+        Image.new("RGBA", (size // 3, size // 10), (30, 30, 30, 200)).save(watermark_path)
+
+        start = time.perf_counter()
+        proxy = PlacementProxy(template_path)
+        proxy.place_image(sample_path)
+        proxy.place_watermark(watermark_path)
+        setup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(redraws):
+            proxy.move(proxy.image_layer, 1, 1)
+            proxy.image_layer.set_scale(50 + i % 5)
+            proxy.render()
+        redraw = (time.perf_counter() - start) / redraws * 1000
+
+        print(f"{size}x{size} template, proxy {proxy.proxy_size[0]}x{proxy.proxy_size[1]}")
+        print(f"  setup {setup * 1000:.0f} ms, redraw {redraw:.1f} ms")
+        print(f"  settings: {proxy.placement_settings()}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 4000)
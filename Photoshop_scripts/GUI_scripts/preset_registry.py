@@ -0,0 +1,310 @@
+"""
+Preset Registry
+-------------
+One place, and one schema, for how a mockup is placed on the template.
+
+Placement presets used to come in several shapes:
+- The mass scripts' hard-coded presets: size in % of the placed layer,
+  absolute top-left position, rotate, opacity
+- context_placements.json (GUI): the same, with a 'watermark' entry whose
+  size is in template pixels (sometimes under 'dimensions')
+- watermark_config.json (watermark_calibration.py): size as
+  {'width', 'height'} in % of the calibration document, position {'x', 'y'}
+- The v1 script's watermark props: size in % of the placed watermark and
+  position as a move from where Photoshop placed it (the document centre)
+
+Every format is normalised once into Placement / WatermarkPlacement
+when it is registered; lookups per image are a dict hit.
+
+Placements remember the template size they were recorded on
+('template_size'), so one calibration renders onto any template (Etsy,
+Shopify, square, ...):
+- The recorded template is scaled uniformly to fit the target and
+  centred, so the layout keeps its proportions; positions and watermark
+  sizes scale with it
+- Size % refers to the layer as placed, and Place shrinks a mockup to
+  fit the template, so for_template() corrects it with the mockup's size
+Settings are stored in the pixels the scripts and backends use, so the
+file stays readable by the mass scripts; template_size is all that is
+needed to rescale them. Settings without 'template_size' apply as they
+are on every template.
+"""
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from context_parser import extract_context
+
+# The mass scripts' placements, recorded by hand in Photoshop for Printify's mockup set
+SCRIPT_PRESETS: Dict[str, Dict] = {
+    'context-1-front': {
+        'position': [612, 34],
+        'rotate': 0,
+        'size': [121.08, 121.08],
+        'opacity': 100,
+    },
+    'context-2-front': {
+        'position': [574, 77],
+        'rotate': 0,
+        'size': [124.75, 116.625],
+        'opacity': 100,
+    },
+    'front': {
+        'position': [404, -31],
+        'rotate': 2.28,
+        'size': [124.875, 125],
+        'opacity': 100,
+    },
+}
+
+# The v1 script's watermark: % of the placed watermark and a move from where it was placed
+LEGACY_WATERMARK_PROPS = {
+    'size': [373.875, 373.875],
+    'opacity': 22,
+    'position': [0, 245],
+}
+
+
+def layout_transform(reference: Tuple[float, float], target: Tuple[float, float]) -> Tuple[float, float, float]:
+    """
+    (scale, offset_x, offset_y) mapping reference template pixels onto a
+    target template: the reference is scaled to fit and centred
+    """
+    scale = min(target[0] / reference[0], target[1] / reference[1])
+    return scale, (target[0] - reference[0] * scale) / 2, (target[1] - reference[1] * scale) / 2
+
+
+def place_fit(image_size: Tuple[float, float], template_size: Tuple[float, float]) -> float:
+    """How much Place shrinks an image to fit the template (1 if it already fits)"""
+    return min(template_size[0] / image_size[0], template_size[1] / image_size[1], 1.0)
+
+
+class WatermarkPlacement(NamedTuple):
+    size: Tuple[float, float]  # Width and height in template pixels
+    position: Tuple[float, float]  # Top-left corner in template pixels
+    opacity: float
+    template_size: Optional[Tuple[float, float]] = None  # Template the pixels refer to; None for any
+
+    def as_settings(self) -> Dict:
+        """The {'size', 'position', 'opacity'} dict backends take"""
+        settings = {'size': list(self.size), 'position': list(self.position), 'opacity': self.opacity}
+        if self.template_size:
+            settings['template_size'] = list(self.template_size)
+        return settings
+
+    def for_template(self, template_size: Tuple[float, float]) -> "WatermarkPlacement":
+        """The watermark in pixels of a template of template_size"""
+        if not self.template_size or tuple(self.template_size) == tuple(template_size):
+            return self
+        scale, offset_x, offset_y = layout_transform(self.template_size, template_size)
+        return WatermarkPlacement(
+            (self.size[0] * scale, self.size[1] * scale),
+            (offset_x + self.position[0] * scale, offset_y + self.position[1] * scale),
+            self.opacity,
+            tuple(template_size)
+        )
+
+
+class Placement(NamedTuple):
+    size: Tuple[float, float]  # % of the placed (background-removed) layer
+    position: Optional[Tuple[float, float]]  # Top-left corner in template pixels; None leaves it where placed
+    rotate: float  # Degrees, clockwise
+    opacity: float
+    watermark: Optional[WatermarkPlacement]  # None uses the registry's default watermark
+    template_size: Optional[Tuple[float, float]] = None  # Template the pixels refer to; None for any
+
+    def as_settings(self) -> Dict:
+        settings = {
+            'size': list(self.size),
+            'position': list(self.position) if self.position is not None else None,
+            'rotate': self.rotate,
+            'opacity': self.opacity,
+        }
+        if self.watermark:
+            settings['watermark'] = self.watermark.as_settings()
+        if self.template_size:
+            settings['template_size'] = list(self.template_size)
+        return settings
+
+    def for_template(self, template_size: Tuple[float, float],
+                     source_size: Optional[Tuple[float, float]] = None) -> "Placement":
+        """
+        The placement in pixels of a template of template_size. source_size
+        is the mockup's size, needed to correct size % for how much Place
+        shrinks it on each template; without it the mockup is assumed to
+        fit both templates unshrunk.
+        """
+        if not self.template_size or tuple(self.template_size) == tuple(template_size):
+            return self
+        scale, offset_x, offset_y = layout_transform(self.template_size, template_size)
+        size_scale = scale
+        if source_size:
+            size_scale *= place_fit(source_size, self.template_size) / place_fit(source_size, template_size)
+        return Placement(
+            (self.size[0] * size_scale, self.size[1] * size_scale),
+            (offset_x + self.position[0] * scale, offset_y + self.position[1] * scale)
+            if self.position is not None else None,
+            self.rotate,
+            self.opacity,
+            self.watermark.for_template(template_size) if self.watermark else None,
+            tuple(template_size)
+        )
+
+
+def _pair(value, keys: Tuple[str, str]) -> Tuple[float, float]:
+    """[a, b] or {keys[0]: a, keys[1]: b} as a float pair"""
+    if isinstance(value, dict):
+        return float(value[keys[0]]), float(value[keys[1]])
+    first, second = value
+    return float(first), float(second)
+
+
+def _template_size(settings: Dict) -> Optional[Tuple[float, float]]:
+    size = settings.get('template_size')
+    return _pair(size, ('width', 'height')) if size else None
+
+
+def normalize_watermark(settings: Dict,
+                        template_size: Optional[Tuple[float, float]] = None) -> WatermarkPlacement:
+    """
+    WatermarkPlacement from direct watermark settings, context settings
+    holding a 'watermark' entry or watermark_config.json. template_size is
+    used when the settings do not name one.
+    """
+    if 'watermark' in settings:
+        template_size = _template_size(settings) or template_size
+        settings = settings['watermark']
+    size = settings.get('dimensions') or settings.get('size')
+    if not size:
+        raise ValueError("No size/dimensions found in watermark settings")
+    if 'position' not in settings:
+        raise ValueError("No position found in watermark settings")
+    size = _pair(size, ('width', 'height'))
+    position = _pair(settings['position'], ('x', 'y'))
+    template_size = _template_size(settings) or template_size
+
+    if 'original_dimensions' in settings:
+        # watermark_calibration.py: size in % of the document it was calibrated on
+        template_size = _pair(settings['original_dimensions'], ('width', 'height'))
+        size = (size[0] / 100 * template_size[0], size[1] / 100 * template_size[1])
+    return WatermarkPlacement(size, position, float(settings.get('opacity', 100)), template_size)
+
+
+def normalize_placement(settings: Dict) -> Placement:
+    """Placement from script presets or context_placements.json entries"""
+    template_size = _template_size(settings)
+    position = settings.get('position')
+    if position is not None:
+        position = _pair(position, ('x', 'y'))
+    return Placement(
+        _pair(settings.get('size') or (100, 100), ('width', 'height')),
+        position,
+        float(settings.get('rotate') or 0),
+        float(settings.get('opacity', 100)),
+        normalize_watermark(settings['watermark'], template_size) if settings.get('watermark') else None,
+        template_size
+    )
+
+
+def migrate_relative_watermark(props: Dict,
+                               watermark_size: Tuple[float, float],
+                               template_size: Tuple[float, float]) -> WatermarkPlacement:
+    """
+    Absolute WatermarkPlacement for v1-style props: size in % of the placed
+    watermark and position as a move from where it was placed. Photoshop
+    places a file centred on the document and resizes about the centre.
+    (A watermark larger than the template would be scaled to fit on place;
+    that is not accounted for.)
+    """
+    width = watermark_size[0] * props['size'][0] / 100
+    height = watermark_size[1] * props['size'][1] / 100
+    dx, dy = props['position']
+    return WatermarkPlacement(
+        (width, height),
+        ((template_size[0] - width) / 2 + dx, (template_size[1] - height) / 2 + dy),
+        float(props.get('opacity', 100)),
+        tuple(template_size)
+    )
+
+
+def image_size(path: str) -> Tuple[int, int]:
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.size
+
+
+class PresetRegistry:
+    """
+    Normalised placements per context, plus the default watermark. A context
+    whose settings cannot be normalised is kept in errors instead, so only
+    its own images fail (for_file raises its error).
+    """
+
+    def __init__(self, placements: Optional[Dict[str, Dict]] = None, default_watermark: Optional[Dict] = None):
+        self._placements: Dict[str, Placement] = {}
+        self.errors: Dict[str, str] = {}
+        self.default_watermark: Optional[WatermarkPlacement] = None
+        if default_watermark:
+            self.set_default_watermark(default_watermark)
+        for context, settings in (placements or {}).items():
+            try:
+                self.register(context, settings)
+            except ValueError as e:
+                self.errors[context] = str(e)
+
+    def register(self, context: str, settings: Dict):
+        """Add or replace a context's placement, in any supported format"""
+        try:
+            self._placements[context] = normalize_placement(settings)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid placement settings for {context}: {str(e)}")
+        self.errors.pop(context, None)
+
+    def set_default_watermark(self, settings: Dict):
+        """Watermark for contexts without their own, in any supported format"""
+        try:
+            self.default_watermark = normalize_watermark(settings)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid watermark settings: {str(e)}")
+
+    def contexts(self) -> List[str]:
+        return list(self._placements)
+
+    def placement(self, context: Optional[str]) -> Optional[Placement]:
+        return self._placements.get(context) if context else None
+
+    def for_file(self, filename: str) -> Optional[Placement]:
+        """The placement for a mockup file name's context; raises ValueError if its settings are invalid"""
+        context = extract_context(filename)
+        if context in self.errors:
+            raise ValueError(self.errors[context])
+        return self.placement(context)
+
+    def watermark_for(self, placement: Optional[Placement]) -> Optional[WatermarkPlacement]:
+        """The context's own watermark, else the default one"""
+        if placement and placement.watermark:
+            return placement.watermark
+        return self.default_watermark
+
+    def resolve(self, filename: str, template_size: Tuple[float, float],
+                image_path: Optional[str] = None) -> Tuple[Optional[Placement], Optional[WatermarkPlacement]]:
+        """
+        A mockup's placement and watermark in pixels of a template of
+        template_size. The mockup's header is read (from image_path) only
+        when its placement was recorded on a different template size.
+        """
+        placement = self.for_file(filename)
+        watermark = self.watermark_for(placement)
+        if placement and placement.template_size and tuple(placement.template_size) != tuple(template_size):
+            placement = placement.for_template(template_size, image_size(image_path) if image_path else None)
+        if watermark:
+            watermark = watermark.for_template(template_size)
+        return placement, watermark
+
+    def as_settings(self, contexts: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """Normalised settings per context, e.g. to write back to context_placements.json"""
+        return {context: self._placements[context].as_settings() for context in (contexts or self._placements)}
+
+
+# Shared by the mass scripts
+SCRIPT_REGISTRY = PresetRegistry(SCRIPT_PRESETS)
@@ -0,0 +1,66 @@
+"""
+Processing Worker
+---------------
+Runs ImageProcessor.process_images on a background thread so the Tk
+main loop never blocks on Photoshop.
+
+The worker never touches widgets. Log lines go to the given LogSink
+(or, without one, onto the event queue as ("log", message)); everything
+else is posted to a thread-safe queue that the GUI drains with after():
+    ("progress", done, total, eta_seconds)
+    ("finished", None) / ("cancelled", None) / ("failed", error message)
+"""
+
+import queue
+import threading
+from typing import Dict, Optional
+
+from log_sink import StatusLog
+from run_control import RunCancelled, RunControl
+
+
+class ProcessingWorker(threading.Thread):
+    def __init__(self, image_processor, process_kwargs: Dict, log: Optional[StatusLog] = None):
+        super().__init__(daemon=True)
+        self.image_processor = image_processor
+        self.process_kwargs = process_kwargs
+        self.log = log
+        self.events: "queue.Queue[tuple]" = queue.Queue()
+        self.control = RunControl(
+            on_progress=lambda done, total, eta: self.events.put(("progress", done, total, eta))
+        )
+
+    def run(self):
+        # Photoshop is driven over COM, which must be initialised on every thread that uses it
+        com = None
+        try:
+            import comtypes
+            comtypes.CoInitialize()
+            com = comtypes
+        except ImportError:
+            pass
+
+        try:
+            self.image_processor.process_images(
+                status_callback=self.log or (lambda msg: self.events.put(("log", msg))),
+                control=self.control,
+                **self.process_kwargs
+            )
+            self.events.put(("finished", None))
+        except RunCancelled:
+            self.events.put(("cancelled", None))
+        except Exception as e:
+            self.events.put(("failed", str(e)))
+        finally:
+            if com:
+                com.CoUninitialize()
+
+    def drain(self, limit: int = 1000):
+        """Return up to limit queued events without blocking"""
+        events = []
+        try:
+            while len(events) < limit:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
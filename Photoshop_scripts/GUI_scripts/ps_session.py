@@ -0,0 +1,160 @@
+"""
+Photoshop Session Pool
+--------------------
+Keeps Photoshop attached and the template open between runs, instead of
+every placement, watermark capture and processing run opening a new
+Session and the template again.
+
+- One attached session and template document per (thread, template):
+  COM proxies only work on the thread that created them
+- Before a session is handed out, a cheap probe checks that Photoshop
+  still answers and the template is still open; otherwise it reconnects
+- A template that is already open in Photoshop is reused instead of
+  opened a second time
+- The clean template is snapshotted once and every checkout is restored
+  to it, so each caller starts from the bare template
+- Counters show how often a session was reused, re-attached or opened
+"""
+
+import contextlib
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from jsx_executor import restore_snapshot_script, snapshot_script
+
+
+def photoshop_session(*args, **kwargs):
+    """A photoshop.Session; the package is imported here so headless runs do not need it"""
+    from photoshop import Session
+    return Session(*args, **kwargs)
+
+
+def _same_file(a: str, b: str) -> bool:
+    return os.path.normcase(os.path.normpath(a)) == os.path.normcase(os.path.normpath(b))
+
+
+class _PooledSession:
+    """An attached session, its template document and whether it has a clean snapshot"""
+
+    def __init__(self, session, document, has_snapshot: bool):
+        self.session = session
+        self.document = document
+        self.has_snapshot = has_snapshot
+
+
+class SessionPool:
+    """Hands out long-lived Photoshop sessions, one per thread and template"""
+
+    def __init__(self, session_factory: Callable = photoshop_session):
+        self.session_factory = session_factory
+        self._sessions: Dict[Tuple[int, str], _PooledSession] = {}
+        self._lock = threading.Lock()
+        self.reused = 0  # Handed out an existing session
+        self.attached = 0  # New session, template was already open in Photoshop
+        self.opened = 0  # New session that opened the template
+        self.reconnects = 0  # Sessions dropped because the health probe failed
+
+    def _key(self, template_path: str, thread_id: Optional[int] = None) -> Tuple[int, str]:
+        return thread_id or threading.get_ident(), os.path.normcase(os.path.abspath(template_path))
+
+    def acquire(self, template_path: str, log: Callable[[str], None] = print):
+        """
+        Return a Session whose active document is the clean template.
+        The session stays owned by the pool; callers must not close it.
+        """
+        key = self._key(template_path)
+        with self._lock:
+            pooled = self._sessions.get(key)
+            if pooled:
+                if self._healthy(pooled):
+                    self.reused += 1
+                    return pooled.session
+                log("Photoshop session was lost, reconnecting")
+                self.reconnects += 1
+                del self._sessions[key]
+
+            pooled = self._connect(template_path, log)
+            self._sessions[key] = pooled
+            return pooled.session
+
+    @contextlib.contextmanager
+    def session(self, template_path: str, log: Callable[[str], None] = print):
+        """acquire() as a drop-in for `with Session(template, action="open") as ps`"""
+        yield self.acquire(template_path, log)
+
+    def has_snapshot(self, template_path: str) -> bool:
+        """Whether this thread's session for the template can be restored from a snapshot"""
+        pooled = self._sessions.get(self._key(template_path))
+        return bool(pooled and pooled.has_snapshot)
+
+    def invalidate(self, template_path: str, thread_id: Optional[int] = None):
+        """
+        Forget this thread's (or thread_id's) session for the template, e.g.
+        after Photoshop errors or hangs
+        """
+        with self._lock:
+            self._sessions.pop(self._key(template_path, thread_id), None)
+
+    def _healthy(self, pooled: _PooledSession) -> bool:
+        """Probe Photoshop and the template document, and return the template to its snapshot"""
+        try:
+            pooled.document.name  # Raises if Photoshop or the document has gone away
+            pooled.session.active_document = pooled.document
+            if pooled.has_snapshot:
+                pooled.session.app.doJavaScript(restore_snapshot_script())
+            return True
+        except Exception:
+            return False
+
+    def _connect(self, template_path: str, log: Callable[[str], None]) -> _PooledSession:
+        session = self.session_factory(template_path, action="open")
+        document = self._find_open_document(session, template_path)
+        if document is not None:
+            session.active_document = document
+            self.attached += 1
+        else:
+            session.__enter__()  # Runs the "open" action
+            document = session.active_document
+            self.opened += 1
+        session.app.displayDialogs = session.DialogModes.DisplayNoDialogs
+        return _PooledSession(session, document, self._prepare_snapshot(session, log))
+
+    def _prepare_snapshot(self, session, log: Callable[[str], None]) -> bool:
+        """Return the template to its clean snapshot, taking the snapshot if there is none yet"""
+        # A template left open by an earlier session may still have layers on it
+        try:
+            session.app.doJavaScript(restore_snapshot_script())
+            return True
+        except Exception:
+            pass
+        try:
+            session.app.doJavaScript(snapshot_script())
+            return True
+        except Exception as e:
+            log(f"Could not snapshot the template, falling back to layer removal: {str(e)}")
+            return False
+
+    def _find_open_document(self, session, template_path: str):
+        """The template's document if Photoshop already has it open"""
+        try:
+            for document in session.app.documents:
+                try:
+                    if _same_file(str(document.fullName), template_path):
+                        return document
+                except Exception:
+                    continue  # Unsaved documents have no fullName
+        except Exception:
+            pass
+        return None
+
+    def close_all(self):
+        """Drop every pooled session; the template documents stay open in Photoshop"""
+        with self._lock:
+            self._sessions.clear()
+
+    def summary(self) -> str:
+        return (
+            f"Photoshop sessions: {self.reused} reused, {self.attached} re-attached, "
+            f"{self.opened} opened, {self.reconnects} reconnects"
+        )
@@ -0,0 +1,160 @@
+"""
+Photoshop Wait Layer
+------------------
+Replaces fixed time.sleep() calls after Photoshop commands with polling
+of document and layer state:
+- Layer count going up after a place, or down after a remove
+- Layer bounds changing after a resize, or settling after an action or
+  a transform that may leave them where they were (a resize that rounds
+  to the same box, a 180 degree rotation)
+
+Polls back off from a short first delay up to a cap and give up after a
+timeout. Every wait is recorded in a TimingProfile, so runs can report
+per-step latency histograms.
+"""
+
+import time
+from typing import Callable, Dict, List, Optional
+
+# Defaults used when a waiter is not configured explicitly
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_INITIAL_DELAY = 0.02
+DEFAULT_BACKOFF = 1.5
+DEFAULT_MAX_DELAY = 0.5
+
+# Upper edges (seconds) of the latency histogram buckets
+HISTOGRAM_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+
+def resized_bounds(bounds, size) -> List[float]:
+    """Bounds a layer should have after resizing by size [width %, height %] about its centre"""
+    left, top, right, bottom = [float(b) for b in bounds]
+    cx, cy = (left + right) / 2, (top + bottom) / 2
+    half_width, half_height = (right - left) * size[0] / 200, (bottom - top) * size[1] / 200
+    return [cx - half_width, cy - half_height, cx + half_width, cy + half_height]
+
+
+def same_pixel_box(a, b) -> bool:
+    """Whether two bounds cover the same whole-pixel box"""
+    return [round(float(v)) for v in a] == [round(float(v)) for v in b]
+
+
+class WaitTimeout(Exception):
+    """Raised when Photoshop does not reach the expected state in time"""
+    pass
+
+
+class TimingProfile:
+    """Collects how long each named step took"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def record(self, step: str, seconds: float):
+        self.samples.setdefault(step, []).append(seconds)
+
+    def histogram(self, step: str) -> List[int]:
+        """Sample counts per HISTOGRAM_BUCKETS edge, plus one overflow bucket"""
+        counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for seconds in self.samples.get(step, []):
+            for i, edge in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= edge:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+    def summary(self) -> List[str]:
+        """One line per step: count, mean, p95, max and the histogram"""
+        lines = []
+        labels = [f"<={edge}s" for edge in HISTOGRAM_BUCKETS] + [f">{HISTOGRAM_BUCKETS[-1]}s"]
+        for step, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            buckets = ", ".join(
+                f"{label}: {count}" for label, count in zip(labels, self.histogram(step)) if count
+            )
+            lines.append(
+                f"{step}: n={len(samples)} mean={sum(samples) / len(samples):.3f}s "
+                f"p95={p95:.3f}s max={ordered[-1]:.3f}s [{buckets}]"
+            )
+        return lines
+
+    def reset(self):
+        self.samples.clear()
+
+
+class PhotoshopWaiter:
+    """Polls Photoshop state until a condition holds, with timeout and backoff"""
+
+    def __init__(self,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 initial_delay: float = DEFAULT_INITIAL_DELAY,
+                 backoff: float = DEFAULT_BACKOFF,
+                 max_delay: float = DEFAULT_MAX_DELAY,
+                 profile: Optional[TimingProfile] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.profile = profile or TimingProfile()
+        self._sleep = sleep
+
+    def until(self, condition: Callable[[], bool], step: str, timeout: Optional[float] = None) -> float:
+        """
+        Poll condition until it returns True and return the time it took.
+        Errors from Photoshop while polling (busy, object not ready) count as not ready.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        delay = self.initial_delay
+        while True:
+            try:
+                if condition():
+                    break
+            except Exception:
+                pass
+            elapsed = time.perf_counter() - start
+            if elapsed >= timeout:
+                self.profile.record(step, elapsed)
+                raise WaitTimeout(f"Timed out after {elapsed:.1f}s waiting for {step}")
+            self._sleep(min(delay, timeout - elapsed))
+            delay = min(delay * self.backoff, self.max_delay)
+
+        elapsed = time.perf_counter() - start
+        self.profile.record(step, elapsed)
+        return elapsed
+
+    def for_layer_count(self, document, at_least: int, step: str = "place") -> float:
+        """Wait until the document has at least this many art layers"""
+        return self.until(lambda: len(document.artLayers) >= at_least, step)
+
+    def for_layer_removed(self, document, count_before: int, step: str = "remove layer") -> float:
+        """Wait until the document has fewer art layers than before"""
+        return self.until(lambda: len(document.artLayers) < count_before, step)
+
+    def for_bounds_change(self, layer, old_bounds, step: str = "resize", expected=None) -> float:
+        """
+        Wait until a layer's bounds differ from old_bounds. If expected (the
+        bounds the command should produce) is the same pixel box as
+        old_bounds, there is no change to wait for, so this only waits for
+        the bounds to settle.
+        """
+        old_bounds = list(old_bounds)
+        if expected is not None and same_pixel_box(expected, old_bounds):
+            return self.for_stable_bounds(layer, step)
+        return self.until(lambda: list(layer.bounds) != old_bounds, step)
+
+    def for_stable_bounds(self, layer, step: str = "action") -> float:
+        """Wait until a layer's bounds read the same twice in a row"""
+        previous = []
+
+        def settled() -> bool:
+            bounds = list(layer.bounds)
+            stable = bool(previous) and previous[-1] == bounds
+            previous.append(bounds)
+            return stable
+
+        return self.until(settled, step)
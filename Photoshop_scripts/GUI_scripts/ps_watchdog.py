@@ -0,0 +1,267 @@
+"""
+Photoshop Watchdog
+----------------
+Keeps one hung Photoshop call (a stuck executeAction or doAction) from
+stalling a whole run.
+
+- Every call into a Photoshop backend runs on a long-lived Photoshop
+  thread; the processing loop waits for it with a deadline per operation
+  (place, remove_bg, save, ...) and an overall deadline per image
+- When a deadline passes the hang is recorded, the stuck thread is
+  abandoned, Photoshop is terminated, and the call raises OperationTimeout
+  so the image fails and the run moves on
+- The next call opens a new session on a fresh Photoshop thread
+- summary() reports the timeouts per operation and the restarts
+"""
+
+import concurrent.futures
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds each operation may take before Photoshop counts as hung
+DEFAULT_DEADLINES = {
+    'open': 180.0,  # May have to start Photoshop and open the template
+    'close': 30.0,
+    'place': 60.0,
+    'remove_bg': 180.0,
+    'capture_mask': 60.0,
+    'transform': 30.0,
+    'watermark': 60.0,
+    'save': 120.0,
+    'reset': 300.0,  # Runs the whole image for the JSX backend
+}
+DEFAULT_IMAGE_DEADLINE = 600.0
+
+
+class OperationTimeout(Exception):
+    """Raised when a Photoshop call does not return before its deadline"""
+    pass
+
+
+def terminate_photoshop(log: Callable[[str], None]):
+    """Force-quit Photoshop, so the hung call returns and a new session can start"""
+    if sys.platform != "win32":
+        log("Cannot terminate Photoshop on this platform; restart it by hand if it stays hung")
+        return
+    subprocess.run(["taskkill", "/F", "/IM", "Photoshop.exe"], capture_output=True, timeout=30)
+
+
+class _CallThread(threading.Thread):
+    """Runs submitted calls one at a time, on the thread that owns the COM objects"""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="photoshop-calls")
+        self.calls: "queue.Queue" = queue.Queue()
+
+    def submit(self, fn: Callable, *args) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        self.calls.put((future, fn, args))
+        return future
+
+    def stop(self):
+        self.calls.put(None)
+
+    def run(self):
+        # Photoshop is driven over COM, which must be initialised on every thread that uses it
+        com = None
+        try:
+            import comtypes
+            comtypes.CoInitialize()
+            com = comtypes
+        except ImportError:
+            pass
+
+        try:
+            while True:
+                item = self.calls.get()
+                if item is None:
+                    break
+                future, fn, args = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            if com:
+                com.CoUninitialize()
+
+
+class PhotoshopWatchdog:
+    """Runs Photoshop calls with deadlines and recovers from hangs"""
+
+    def __init__(self,
+                 deadlines: Optional[Dict[str, float]] = None,
+                 image_deadline: float = DEFAULT_IMAGE_DEADLINE,
+                 restart: Callable[[Callable[[str], None]], None] = terminate_photoshop):
+        """
+        Args:
+            deadlines: Seconds per operation, overriding DEFAULT_DEADLINES
+            image_deadline: Seconds all the calls for one image may take together
+            restart: Called with a log function after a hang to bring Photoshop down
+        """
+        self.deadlines = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        self.image_deadline = image_deadline
+        self.restart = restart
+        self._thread: Optional[_CallThread] = None
+        self._image: Optional[str] = None
+        self._image_started: Optional[float] = None
+        self.timeouts: List[Tuple[Optional[str], str, float]] = []  # (image, operation, deadline)
+        self.restarts = 0
+
+    def begin_image(self, image: str):
+        """Start the per-image deadline for the next calls"""
+        self._image = image
+        self._image_started = time.perf_counter()
+
+    def end_image(self):
+        self._image = None
+        self._image_started = None
+
+    def _deadline(self, step: str) -> Tuple[float, bool]:
+        """Seconds the call may take, and whether the image's deadline is the tighter one"""
+        deadline = self.deadlines.get(step, max(self.deadlines.values()))
+        if self._image_started is not None and step not in ('open', 'close'):
+            remaining = self.image_deadline - (time.perf_counter() - self._image_started)
+            if remaining < deadline:
+                return max(remaining, 0.0), True
+        return deadline, False
+
+    def call(self, step: str, fn: Callable, *args):
+        """Run fn(*args) on the Photoshop thread; raise OperationTimeout if it is late"""
+        if self._thread is None:
+            self._thread = _CallThread()
+            self._thread.start()
+        deadline, image_limit = self._deadline(step)
+        future = self._thread.submit(fn, *args)
+        try:
+            return future.result(timeout=deadline)
+        except concurrent.futures.TimeoutError:
+            self.timeouts.append((self._image, step, deadline))
+            limit = f"the {self.image_deadline:.0f}s image limit" if image_limit else f"{deadline:.1f}s"
+            raise OperationTimeout(
+                f"Photoshop did not finish {step} within {limit}"
+                + (f" on {self._image}" if self._image else "")
+            )
+
+    def recover(self, log: Callable[[str], None]) -> Optional[int]:
+        """
+        Abandon the hung Photoshop thread and bring Photoshop down; return the
+        abandoned thread's ident, whose sessions are no longer usable
+        """
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return None
+        thread.stop()  # Exits once the hung call returns, if it ever does
+        self.restarts += 1
+        try:
+            self.restart(log)
+        except Exception as e:
+            log(f"Could not terminate Photoshop: {str(e)}")
+        return thread.ident
+
+    def guard(self, backend) -> "WatchdogBackend":
+        return WatchdogBackend(backend, self)
+
+    def reset_stats(self):
+        self.timeouts = []
+        self.restarts = 0
+
+    def summary(self) -> str:
+        if not self.timeouts:
+            return "Photoshop watchdog: no hangs"
+        steps: Dict[str, int] = {}
+        for _, step, _ in self.timeouts:
+            steps[step] = steps.get(step, 0) + 1
+        per_step = ", ".join(f"{step}: {count}" for step, count in sorted(steps.items()))
+        return (
+            f"Photoshop watchdog: {len(self.timeouts)} timeouts ({per_step}), "
+            f"{self.restarts} Photoshop restarts"
+        )
+
+
+class WatchdogBackend:
+    """
+    A Photoshop backend whose calls all run under a PhotoshopWatchdog. Other
+    attributes (name, flags, jpeg_profile, mask_cache, ...) are the wrapped
+    backend's.
+    """
+
+    _own_attributes = ('backend', 'watchdog', '_log', '_needs_open')
+
+    def __init__(self, backend, watchdog: PhotoshopWatchdog):
+        self.backend = backend
+        self.watchdog = watchdog
+        self._log = None
+        self._needs_open = False
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def __setattr__(self, name, value):
+        if name in self._own_attributes:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.backend, name, value)
+
+    def _call(self, step: str, fn: Callable, *args):
+        if self._needs_open:
+            self._reopen()
+        try:
+            return self.watchdog.call(step, fn, *args)
+        except OperationTimeout as e:
+            log = self.backend.log
+            log(f"{str(e)}; restarting Photoshop")
+            hung_thread = self.watchdog.recover(log)
+            if hung_thread is not None:
+                self.backend.abandon_session(hung_thread)
+            self._needs_open = True
+            raise
+
+    def _reopen(self):
+        self.backend.log("Opening a new Photoshop session")
+        self._needs_open = False
+        try:
+            self._call('open', self.backend.open, self._log)
+        except Exception:
+            self._needs_open = True  # Try again with the next image
+            raise
+
+    def open(self, log=None):
+        self._log = log
+        self._call('open', self.backend.open, log)
+
+    def close(self):
+        if self._needs_open:
+            return  # Nothing usable is open
+        self._call('close', self.backend.close)
+
+    def place_image(self, image_path: str):
+        return self._call('place', self.backend.place_image, image_path)
+
+    def place_masked(self, image_path: str, mask_key: str):
+        return self._call('place', self.backend.place_masked, image_path, mask_key)
+
+    def remove_background(self, layer):
+        return self._call('remove_bg', self.backend.remove_background, layer)
+
+    def capture_mask(self, layer, image_path: str, mask_key: str):
+        return self._call('capture_mask', self.backend.capture_mask, layer, image_path, mask_key)
+
+    def transform_layer(self, layer, size: List[float], position: List[float], opacity: float = 100,
+                        rotate: float = 0):
+        return self._call('transform', self.backend.transform_layer, layer, size, position, opacity, rotate)
+
+    def place_watermark(self, settings: Dict):
+        return self._call('watermark', self.backend.place_watermark, settings)
+
+    def save_jpeg(self, output_path: str):
+        return self._call('save', self.backend.save_jpeg, output_path)
+
+    def reset_document(self):
+        return self._call('reset', self.backend.reset_document)
@@ -0,0 +1,205 @@
+"""
+Result Cache
+-----------
+Lets re-runs skip images whose output would not change.
+
+Each output is keyed by a hash of:
+- The source image bytes
+- The template and watermark file hashes
+- The selected operations and the resolved placement/watermark settings
+- The backend that produced it
+
+Outputs are copied into a content-addressed store next to an on-disk
+index. On a hit the existing -processed.jpg is reused if it is still the
+one we wrote, otherwise it is copied back from the store. The store is
+kept under a size limit by evicting the least recently used entries.
+File hashes are remembered by (size, mtime) so unchanged sources are not
+re-read on the next run; only the MAX_FILE_HASHES most recently used are
+kept.
+
+The GUI drops entries from its thread (drop_contexts) while a run stores
+them from the worker thread, so the index is guarded by a lock.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), "Photoshop_scripts/cache/results")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+# Source, template and watermark hashes remembered between runs
+MAX_FILE_HASHES = 20000
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self):
+        """Load the index, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            # Least recently used first, so eviction takes entries from the front
+            self.entries: Dict[str, Dict] = dict(sorted(index.get('entries', {}).items(),
+                                                        key=lambda item: item[1]['last_used']))
+            self.file_hashes: Dict[str, list] = index.get('file_hashes', {})
+        except (OSError, ValueError):
+            self.entries = {}
+            self.file_hashes = {}
+        self._total_bytes = sum(entry['size'] for entry in self.entries.values())
+
+    def save(self):
+        """Write the index to disk if it changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({'entries': self.entries, 'file_hashes': self.file_hashes}, f)
+            os.replace(temp_path, self.index_path)
+            self._dirty = False
+
+    def file_hash(self, path: str) -> str:
+        """SHA-256 of a file, reusing the stored hash while its size and mtime are unchanged"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self.file_hashes.pop(path, None)
+            if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                # Re-inserted, so the dict stays in least recently used order
+                self.file_hashes[path] = known
+                return known[2]
+
+        digest = sha256_file(path)
+        with self._lock:
+            self.file_hashes[path] = [stat.st_size, stat.st_mtime_ns, digest]
+            while len(self.file_hashes) > MAX_FILE_HASHES:
+                del self.file_hashes[next(iter(self.file_hashes))]
+            self._dirty = True
+        return digest
+
+    def make_key(self,
+                 source_path: str,
+                 template_path: str,
+                 watermark_path: Optional[str],
+                 operations: Iterable[str],
+                 settings: Optional[Dict],
+                 backend_name: str) -> str:
+        """Key for one output; changes whenever anything that affects the output changes"""
+        parts = {
+            'source': self.file_hash(source_path),
+            'template': self.file_hash(template_path),
+            'watermark': self.file_hash(watermark_path) if watermark_path and os.path.exists(watermark_path) else None,
+            'operations': sorted(operations),
+            'settings': settings,
+            'backend': backend_name
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+    def lookup(self, key: str, output_path: str) -> bool:
+        """Put the cached output at output_path and return True, or return False on a miss"""
+        with self._lock:
+            entry = self.entries.get(key)
+            blob_path = self._blob_path(key)
+            if not entry or not os.path.exists(blob_path):
+                self.misses += 1
+                return False
+
+            # Reuse the existing output if it is still the file we produced
+            try:
+                stat = os.stat(output_path)
+                unchanged = stat.st_size == entry['size'] and stat.st_mtime_ns == entry.get('output_mtime_ns')
+            except OSError:
+                unchanged = False
+            if not unchanged:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                shutil.copyfile(blob_path, output_path)
+                entry['output_mtime_ns'] = os.stat(output_path).st_mtime_ns
+
+            entry['last_used'] = time.time()
+            self.entries[key] = self.entries.pop(key)  # Now the most recently used
+            self._dirty = True
+            self.hits += 1
+            return True
+
+    def store(self, key: str, output_path: str, context: Optional[str] = None):
+        """Copy a freshly written output into the store, tagged with its image context"""
+        blob_path = self._blob_path(key)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        shutil.copyfile(output_path, blob_path)
+        stat = os.stat(output_path)
+        entry = {
+            'size': stat.st_size,
+            'output_mtime_ns': stat.st_mtime_ns,
+            'last_used': time.time()
+        }
+        if context:
+            entry['context'] = context
+        with self._lock:
+            replaced = self.entries.pop(key, None)
+            if replaced:
+                self._total_bytes -= replaced['size']
+            self.entries[key] = entry
+            self._total_bytes += entry['size']
+            self._dirty = True
+            self.evict()
+
+    def _remove(self, key: str):
+        try:
+            os.remove(self._blob_path(key))
+        except OSError:
+            pass
+        self._total_bytes -= self.entries.pop(key)['size']
+        self._dirty = True
+
+    def drop_contexts(self, contexts: Iterable[str]):
+        """Drop the outputs made for contexts whose placement settings changed"""
+        contexts = set(contexts)
+        with self._lock:
+            for key in [key for key, entry in self.entries.items() if entry.get('context') in contexts]:
+                self._remove(key)
+
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def evict(self):
+        """Drop least recently used entries until the store fits in max_bytes"""
+        with self._lock:
+            while self._total_bytes > self.max_bytes and self.entries:
+                self._remove(next(iter(self.entries)))
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = (self.hits / lookups * 100) if lookups else 0.0
+        return (
+            f"Result cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+            f"{len(self.entries)} entries, {self.total_bytes() / 1024 ** 2:.1f} MB"
+        )
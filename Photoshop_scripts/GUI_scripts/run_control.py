@@ -0,0 +1,72 @@
+"""
+Run Control
+----------
+Shared between a processing run and whoever started it (the GUI):
+- Cancel, pause and resume, checked by the processor between images
+- Progress reporting with an ETA that leaves out time spent paused
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class RunCancelled(Exception):
+    """Raised inside a run when the user cancels it"""
+    pass
+
+
+class RunControl:
+    def __init__(self, on_progress: Optional[Callable[[int, int, Optional[float]], None]] = None):
+        self.on_progress = on_progress
+        self._cancelled = threading.Event()
+        self._running = threading.Event()  # Cleared while paused
+        self._running.set()
+        self._started = time.perf_counter()
+        self._paused_at: Optional[float] = None
+        self._paused_total = 0.0
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()  # Wake a paused run so it can stop
+
+    def pause(self):
+        if self._running.is_set():
+            self._paused_at = time.perf_counter()
+            self._running.clear()
+
+    def resume(self):
+        if not self._running.is_set():
+            self._paused_total += time.perf_counter() - self._paused_at
+            self._paused_at = None
+            self._running.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def checkpoint(self):
+        """Called between images: blocks while paused, raises RunCancelled if cancelled"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise RunCancelled("Processing cancelled")
+
+    def active_seconds(self) -> float:
+        """Time since the run started, not counting pauses"""
+        paused = self._paused_total
+        if self._paused_at is not None:
+            paused += time.perf_counter() - self._paused_at
+        return time.perf_counter() - self._started - paused
+
+    def progress(self, done: int, total: int):
+        """Report that done of total images are finished"""
+        if not self.on_progress:
+            return
+        eta = None
+        if done:
+            eta = self.active_seconds() / done * (total - done)
+        self.on_progress(done, total, eta)
@@ -0,0 +1,148 @@
+"""
+Run Journal
+----------
+Records every finished image of a processing run so a crashed, hung or
+cancelled run can pick up where it stopped instead of starting over.
+
+- One append-only JSONL file per source folder; each line is flushed to
+  disk as soon as an image is done or has failed, so at most the image
+  in progress is lost
+- Each line holds the run's settings hash and the source's size and
+  mtime; an image only counts as finished if neither has changed since
+- A fresh run starts a new journal. resume skips images that finished
+  (done or failed); retry_failed skips only the done ones, so failed and
+  unfinished images run again
+- A partly written last line (from a crash) is ignored
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.getcwd(), "Photoshop_scripts/logs/journals")
+
+DONE = "done"
+FAILED = "failed"
+
+
+def settings_hash(settings: Dict) -> str:
+    """Short hash of everything that changes what a run writes"""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class RunJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self.settings: Optional[str] = None
+        self.skipped_done = 0
+        self.skipped_failed = 0
+        self.done = 0
+        self.failed = 0
+
+    @classmethod
+    def for_folder(cls, folder: str, journal_dir: str = None) -> "RunJournal":
+        """The journal for runs over a source folder"""
+        folder = os.path.abspath(folder)
+        name = f"{os.path.basename(folder) or 'root'}-{hashlib.sha1(folder.encode('utf-8')).hexdigest()[:10]}.jsonl"
+        return cls(os.path.join(journal_dir or DEFAULT_JOURNAL_DIR, name))
+
+    def _read(self) -> List[Dict]:
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # Cut short by a crash
+        except OSError:
+            pass
+        return records
+
+    def outcomes(self, settings: str) -> Dict[str, Dict]:
+        """Latest record per source path, for records written with these settings"""
+        latest = {}
+        for record in self._read():
+            if record.get('event') == "image" and record.get('settings') == settings:
+                latest[record['path']] = record
+        return latest
+
+    def begin(self,
+              files: List[Tuple[str, str]],
+              settings: str,
+              resume: bool = False,
+              retry_failed: bool = False) -> List[Tuple[str, str]]:
+        """
+        Open the journal for a run and return the (root, file) pairs still to
+        process. Without resume or retry_failed the journal starts over.
+        """
+        self.settings = settings
+        self.skipped_done = self.skipped_failed = self.done = self.failed = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        remaining = files
+        if resume or retry_failed:
+            outcomes = self.outcomes(settings)
+            remaining = []
+            for root, file in files:
+                record = outcomes.get(os.path.abspath(os.path.join(root, file)))
+                if record and self._unchanged(record):
+                    if record['status'] == DONE:
+                        self.skipped_done += 1
+                        continue
+                    if not retry_failed:
+                        self.skipped_failed += 1
+                        continue
+                remaining.append((root, file))
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+
+        mode = "retry-failed" if retry_failed else "resume" if resume else "fresh"
+        self._write({'event': "run", 'mode': mode, 'settings': settings,
+                     'total': len(files), 'remaining': len(remaining), 'time': time.time()})
+        return remaining
+
+    def _unchanged(self, record: Dict) -> bool:
+        """Whether the source is still the file the record was written for"""
+        try:
+            stat = os.stat(record['path'])
+        except OSError:
+            return False
+        return stat.st_size == record.get('size') and stat.st_mtime_ns == record.get('mtime_ns')
+
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, root: str, file: str, output_path: Optional[str] = None, error: Optional[str] = None):
+        """Log one finished image: done with its output, or failed with the error"""
+        path = os.path.abspath(os.path.join(root, file))
+        try:
+            stat = os.stat(path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size = mtime_ns = None
+        status = FAILED if error or not output_path else DONE
+        if status == DONE:
+            self.done += 1
+        else:
+            self.failed += 1
+        self._write({'event': "image", 'path': path, 'status': status, 'settings': self.settings,
+                     'output': output_path, 'error': error, 'size': size, 'mtime_ns': mtime_ns,
+                     'time': time.time()})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def summary(self) -> str:
+        skipped = ""
+        if self.skipped_done or self.skipped_failed:
+            skipped = f" (skipped {self.skipped_done} already done, {self.skipped_failed} failed earlier)"
+        return f"Run journal: {self.done} done, {self.failed} failed{skipped}"
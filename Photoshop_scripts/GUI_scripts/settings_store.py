@@ -0,0 +1,121 @@
+"""
+Settings Store
+------------
+A JSON settings file (e.g. context_placements.json) that is read once and
+served from memory.
+
+- Changes are written through to disk atomically: a temp file is written
+  and fsynced, then renamed over the old one, so a crash mid-write leaves
+  the previous settings intact
+- batch() groups several changes (e.g. "Copy Settings To All") into one
+  write
+- Listeners are told which keys' values actually changed, so caches can
+  drop exactly the outputs made with the old values
+- Keys starting with "_" are reserved, and skipped when the file is read
+"""
+
+import contextlib
+import copy
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+
+class SettingsStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[Set[str]], None]] = []
+        self._batch_depth = 0
+        self._changed: Set[str] = set()
+        self._load()
+
+    def _load(self):
+        """Read the file, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self._values: Dict[str, Dict] = {key: value for key, value in data.items() if not key.startswith("_")}
+
+    def get(self, key: str) -> Optional[Dict]:
+        """A copy of the value for key, or None"""
+        with self._lock:
+            value = self._values.get(key)
+            return copy.deepcopy(value) if value is not None else None
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._values)
+
+    def set(self, key: str, value: Dict):
+        """Store a value; written to disk now, or when the enclosing batch() ends"""
+        if key.startswith("_"):
+            raise ValueError(f"Settings keys starting with '_' are reserved: {key}")
+        with self._lock:
+            if self._values.get(key) == value:
+                return
+            self._values[key] = copy.deepcopy(value)
+            self._mark_changed(key)
+
+    def update(self, values: Dict[str, Dict]):
+        """Store several values with one write"""
+        with self.batch():
+            for key, value in values.items():
+                self.set(key, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key not in self._values:
+                return
+            del self._values[key]
+            self._mark_changed(key)
+
+    def _mark_changed(self, key: str):
+        self._changed.add(key)
+        if not self._batch_depth:
+            self.flush()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Write all changes made inside the block at once, when it ends"""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self.flush()
+
+    def flush(self):
+        """Write pending changes atomically and tell listeners which keys changed"""
+        with self._lock:
+            if not self._changed:
+                return
+            data = dict(self._values)
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            if hasattr(os, "O_DIRECTORY"):
+                # Make the rename itself durable (not possible on Windows)
+                directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(directory)
+                finally:
+                    os.close(directory)
+
+            changed, self._changed = self._changed, set()
+        for listener in self._listeners:
+            listener(changed)
+
+    def subscribe(self, listener: Callable[[Set[str]], None]):
+        """Call listener with the set of changed keys after each write"""
+        self._listeners.append(listener)
@@ -0,0 +1,271 @@
+"""
+Template Cache
+-------------
+Decodes each listing template once and hands every image a cheap
+writable canvas instead of a fresh full-size copy.
+
+- Templates are decoded once per (path, mtime) and flattened onto white,
+  kept as float32 for blending and as the uint8 pixels every output starts from
+- TemplateCanvas copies on write: the output buffer is allocated once per
+  backend, each image only copies and blends the rectangle its layers
+  cover, and the next image puts just that rectangle back
+- For worker processes the decoded template is placed in shared memory
+  once; workers attach to it instead of decoding their own copy
+- memory_bytes()/summary() report what the cache holds
+
+Run this file directly to compare per-image allocations:
+    python template_cache.py [size]
+"""
+
+import atexit
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+def to_uint8(pixels: np.ndarray) -> np.ndarray:
+    """0-1 float pixels to 0-255, rounded the same way for every output"""
+    return np.clip(pixels * 255.0 + 0.5, 0, 255).astype(np.uint8)
+
+
+class DecodedTemplate:
+    """A template flattened onto white, as float32 (for blending) and uint8 (for output)"""
+
+    def __init__(self, pixels: np.ndarray, pixels_u8: np.ndarray, shared_block=None):
+        self.pixels = pixels
+        self.pixels_u8 = pixels_u8
+        self.shared_block = shared_block  # Keeps attached shared memory alive
+        self.pixels.flags.writeable = False
+        self.pixels_u8.flags.writeable = False
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        height, width = self.pixels.shape[:2]
+        return width, height
+
+    @property
+    def nbytes(self) -> int:
+        return self.pixels.nbytes + self.pixels_u8.nbytes
+
+
+class SharedTemplate(NamedTuple):
+    """Picklable handle to a decoded template in shared memory"""
+    path: str
+    mtime_ns: int
+    block_name: str
+    shape: Tuple[int, int, int]
+
+
+def decode_template(path: str) -> DecodedTemplate:
+    """Decode a template and flatten it onto white, as Photoshop does when saving a JPEG"""
+    with Image.open(path) as img:
+        rgba = np.asarray(img.convert("RGBA"), dtype=np.float32) / 255.0
+    pixels = rgba[..., :3] * rgba[..., 3:4] + (1.0 - rgba[..., 3:4])
+    return DecodedTemplate(pixels, to_uint8(pixels))
+
+
+def _views(buffer, shape: Tuple[int, int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """float32 pixels followed by uint8 pixels, both of shape, in one buffer"""
+    float_bytes = int(np.prod(shape)) * 4
+    pixels = np.ndarray(shape, dtype=np.float32, buffer=buffer)
+    pixels_u8 = np.ndarray(shape, dtype=np.uint8, buffer=buffer, offset=float_bytes)
+    return pixels, pixels_u8
+
+
+class TemplateCache:
+    """Decoded templates by (path, mtime), shared across backends in this process"""
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, int], DecodedTemplate] = {}
+        self._shared: Dict[Tuple[str, int], shared_memory.SharedMemory] = {}
+        self.decodes = 0
+        self.hits = 0
+
+    def _key(self, path: str) -> Tuple[str, int]:
+        path = os.path.abspath(path)
+        return path, os.stat(path).st_mtime_ns
+
+    def get(self, path: str) -> DecodedTemplate:
+        key = self._key(path)
+        template = self._entries.get(key)
+        if template is not None:
+            self.hits += 1
+            return template
+
+        # The file changed or is new: drop older versions of it
+        for old_key in [k for k in self._entries if k[0] == key[0]]:
+            self._drop(old_key)
+        template = decode_template(path)
+        self.decodes += 1
+        self._entries[key] = template
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+        return template
+
+    def share(self, path: str) -> SharedTemplate:
+        """Put the decoded template in shared memory (once) and return a handle for workers"""
+        key = self._key(path)
+        template = self.get(path)
+        block = self._shared.get(key)
+        if block is None:
+            shape = template.pixels.shape
+            block = shared_memory.SharedMemory(create=True, size=template.nbytes)
+            pixels, pixels_u8 = _views(block.buf, shape)
+            pixels[...] = template.pixels
+            pixels_u8[...] = template.pixels_u8
+            self._shared[key] = block
+            # Serve this process from the shared copy too, so it is only held once
+            self._entries[key] = DecodedTemplate(pixels, pixels_u8, block)
+            if len(self._shared) == 1:
+                atexit.register(self.release_shared)
+        return SharedTemplate(key[0], key[1], block.name, tuple(self._entries[key].pixels.shape))
+
+    def attach(self, shared: SharedTemplate) -> DecodedTemplate:
+        """In a worker: use the parent's shared template instead of decoding it"""
+        key = (shared.path, shared.mtime_ns)
+        template = self._entries.get(key)
+        if template is not None:
+            return template
+        block = shared_memory.SharedMemory(name=shared.block_name)
+        if os.name == "posix":
+            # The parent owns the block; stop this process's tracker unlinking it on exit
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(block._name, "shared_memory")
+        pixels, pixels_u8 = _views(block.buf, shared.shape)
+        template = DecodedTemplate(pixels, pixels_u8, block)
+        self._entries[key] = template
+        return template
+
+    def _drop(self, key: Tuple[str, int]):
+        self._entries.pop(key, None)
+        block = self._shared.pop(key, None)
+        if block is not None:
+            try:
+                block.close()
+            except BufferError:
+                pass  # Arrays still use it; the mapping goes when they do
+            block.unlink()
+
+    def release_shared(self):
+        """Free every shared block this process created"""
+        for key in list(self._shared):
+            self._drop(key)
+
+    def memory_bytes(self) -> int:
+        return sum(template.nbytes for template in self._entries.values())
+
+    def summary(self) -> str:
+        return (
+            f"Template cache: {len(self._entries)} templates, {self.decodes} decodes, {self.hits} hits, "
+            f"{self.memory_bytes() / 1024 ** 2:.0f} MB ({len(self._shared)} shared)"
+        )
+
+
+# One cache per process, shared by every backend in it
+TEMPLATE_CACHE = TemplateCache()
+
+
+class TemplateCanvas:
+    """
+    Writable output for one template. Layers need a `box` (left, top, right,
+    bottom) and `blend_onto(canvas, origin)`; only the rectangles they cover
+    (overlapping ones merged) are copied and blended.
+    """
+
+    def __init__(self, template: DecodedTemplate):
+        self.template = template
+        self.output: Optional[np.ndarray] = None
+        self._dirty: List[Tuple[int, int, int, int]] = []
+
+    def _regions(self, layers: List) -> List[Tuple[int, int, int, int]]:
+        """Layer boxes clipped to the template, overlapping boxes merged"""
+        width, height = self.template.size
+        regions = []
+        for left, top, right, bottom in (layer.box for layer in layers):
+            box = (max(left, 0), max(top, 0), min(right, width), min(bottom, height))
+            if box[0] >= box[2] or box[1] >= box[3]:
+                continue
+            # Merge with every region it overlaps until nothing overlaps
+            merged = True
+            while merged:
+                merged = False
+                for other in regions:
+                    if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                        regions.remove(other)
+                        box = (min(box[0], other[0]), min(box[1], other[1]),
+                               max(box[2], other[2]), max(box[3], other[3]))
+                        merged = True
+                        break
+            regions.append(box)
+        return regions
+
+    def render(self, layers: List) -> np.ndarray:
+        """The template with the layers blended on, as uint8 RGB; valid until the next render"""
+        if self.output is None:
+            self.output = self.template.pixels_u8.copy()
+        for x0, y0, x1, y1 in self._dirty:
+            self.output[y0:y1, x0:x1] = self.template.pixels_u8[y0:y1, x0:x1]
+
+        self._dirty = self._regions(layers)
+        for x0, y0, x1, y1 in self._dirty:
+            region = self.template.pixels[y0:y1, x0:x1].copy()
+            for layer in layers:
+                layer.blend_onto(region, (x0, y0))
+            # to_uint8 in place; assigning to the uint8 buffer truncates like astype
+            region *= 255.0
+            region += 0.5
+            np.clip(region, 0, 255, out=region)
+            self.output[y0:y1, x0:x1] = region
+        return self.output
+
+
+def run_allocation_benchmark(size: int = 3000, image_count: int = 10):
+    """Print peak allocation and time per image for a full canvas copy vs TemplateCanvas"""
+    import tempfile
+    import tracemalloc
+
+    from headless_backend import HeadlessBackend
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template_path = os.path.join(temp_dir, "template.png")
+        watermark_path = os.path.join(temp_dir, "watermark.png")
+        image_path = os.path.join(temp_dir, "image.png")
+        Image.new("RGB", (size, size), (240, 240, 240)).save(template_path)
+        Image.new("RGBA", (size // 3, size // 10), (30, 30, 30, 200)).save(watermark_path)
+        Image.new("RGBA", (size // 2, size // 2), (120, 80, 200, 255)).save(image_path)
+
+        backend = HeadlessBackend(template_path, watermark_path)
+        backend.open(log=lambda msg: None)
+        layer = backend.place_image(image_path)
+        backend.transform_layer(layer, [100, 100], [size // 4, size // 4])
+        backend.place_watermark({'size': [size // 3, size // 10], 'position': [size // 2, size - size // 8],
+                                 'opacity': 60})
+
+        def measure(label: str, render):
+            render()  # Warm up (the canvas buffer is allocated once)
+            tracemalloc.start()
+            start = time.perf_counter()
+            for _ in range(image_count):
+                tracemalloc.reset_peak()
+                render()
+            elapsed = (time.perf_counter() - start) / image_count * 1000
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {label:<28} {peak / 1024 ** 2:8.1f} MB peak  {elapsed:7.1f} ms/image")
+
+        print(f"{size}x{size} template, {image_count} images")
+        measure("full copy per image", lambda: to_uint8(backend.compose()))
+        measure("copy-on-write canvas", lambda: backend.canvas.render(backend.layers))
+        # Run as a script this module is __main__; the backend uses the imported one
+        import template_cache
+        print(f"  {template_cache.TEMPLATE_CACHE.summary()}")
+
+
+if __name__ == "__main__":
+    run_allocation_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
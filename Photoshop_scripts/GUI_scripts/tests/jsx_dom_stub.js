@@ -0,0 +1,165 @@
+// Minimal Photoshop DOM for running compiled JsxBatch scripts under node.
+//
+//     node jsx_dom_stub.js <script.jsx> <state.json>
+//
+// state.json: {"document": [width, height], "files": {path: [width, height]},
+//              "snapshots": [name, ...], "fail_action": name or null}
+// Prints {"result", "ruler_units", "calls", "layers"} as JSON. The script runs
+// in a context without JSON, as ExtendScript has none.
+"use strict";
+var fs = require("fs");
+var vm = require("vm");
+
+var script = fs.readFileSync(process.argv[2], "utf8");
+var state = JSON.parse(fs.readFileSync(process.argv[3], "utf8"));
+var calls = [];
+
+function UnitValue(value) {
+    this.value = value;
+}
+UnitValue.prototype.as = function (unit) {
+    if (unit !== "px") { throw new Error("Unexpected unit " + unit); }
+    return this.value;
+};
+
+function describe(layers) {
+    return layers.map(function (layer) {
+        return {name: layer.name, bounds: layer.box.slice(), opacity: layer.opacity};
+    });
+}
+
+function Layer(name, box) {
+    this.name = name;
+    this.box = box;
+    this.opacity = 100;
+}
+Object.defineProperty(Layer.prototype, "bounds", {
+    get: function () { return this.box.map(function (v) { return new UnitValue(v); }); }
+});
+Layer.prototype.resize = function (width, height, anchor) {
+    calls.push(["resize", this.name, width, height, anchor]);
+    var b = this.box, cx = (b[0] + b[2]) / 2, cy = (b[1] + b[3]) / 2;
+    var halfWidth = (b[2] - b[0]) * width / 200, halfHeight = (b[3] - b[1]) * height / 200;
+    this.box = [cx - halfWidth, cy - halfHeight, cx + halfWidth, cy + halfHeight];
+};
+Layer.prototype.translate = function (dx, dy) {
+    calls.push(["translate", this.name, dx, dy]);
+    var b = this.box;
+    this.box = [b[0] + dx, b[1] + dy, b[2] + dx, b[3] + dy];
+};
+Layer.prototype.rotate = function (angle, anchor) {
+    calls.push(["rotate", this.name, angle, anchor]);
+    var b = this.box, cx = (b[0] + b[2]) / 2, cy = (b[1] + b[3]) / 2, w = b[2] - b[0], h = b[3] - b[1];
+    var cos = Math.abs(Math.cos(angle * Math.PI / 180)), sin = Math.abs(Math.sin(angle * Math.PI / 180));
+    var halfWidth = (w * cos + h * sin) / 2, halfHeight = (w * sin + h * cos) / 2;
+    this.box = [cx - halfWidth, cy - halfHeight, cx + halfWidth, cy + halfHeight];
+};
+Layer.prototype.duplicate = function (target, placement) {
+    calls.push(["duplicate", this.name, target.name, placement]);
+    target.layers.unshift(new Layer(this.name, this.box.slice()));
+};
+
+function Document(name, width, height) {
+    var doc = this;
+    this.name = name;
+    this.width = width;
+    this.height = height;
+    this.resolution = 72;
+    this.layers = [new Layer("Background", [0, 0, width, height])];
+    this.historyStates = {
+        getByName: function (snapshot) {
+            if (state.snapshots.indexOf(snapshot) < 0) { throw new Error("No snapshot named " + snapshot); }
+            return {name: snapshot};
+        }
+    };
+    Object.defineProperty(this, "activeLayer", {get: function () { return doc.layers[0]; }});
+    Object.defineProperty(this, "activeHistoryState", {
+        set: function (snapshot) {
+            calls.push(["restore", snapshot.name]);
+            doc.layers = doc.layers.slice(-1);
+        }
+    });
+}
+Document.prototype.saveAs = function (file, options, asCopy, extension) {
+    calls.push(["saveAs", this.name, file.path, {
+        quality: options.quality, formatOptions: options.formatOptions, scans: options.scans || null,
+        png: options instanceof PNGSaveOptions
+    }, asCopy, extension, describe(this.layers)]);
+};
+Document.prototype.close = function (saving) {
+    calls.push(["close", this.name, saving]);
+};
+
+function File(path) {
+    this.path = path;
+}
+function ActionDescriptor() {
+    this.path = null;
+}
+ActionDescriptor.prototype.putPath = function (key, file) {
+    this.path = file.path;
+};
+function JPEGSaveOptions() {}
+function PNGSaveOptions() {}
+
+var doc = new Document("template", state.document[0], state.document[1]);
+var app = {
+    activeDocument: doc,
+    preferences: {rulerUnits: "CM"},
+    documents: {
+        add: function (width, height, resolution, name, mode, fill) {
+            calls.push(["newDocument", name, mode, fill]);
+            return new Document(name, width, height);
+        }
+    },
+    doAction: function (action, actionSet) {
+        calls.push(["doAction", action, actionSet]);
+        if (action === state.fail_action) { throw new Error("Action " + action + " failed"); }
+        // Trim 10% off each side, as if the background around the product was cleared
+        var layer = this.activeDocument.activeLayer, b = layer.box;
+        var dx = (b[2] - b[0]) * 0.1, dy = (b[3] - b[1]) * 0.1;
+        layer.box = [b[0] + dx, b[1] + dy, b[2] - dx, b[3] - dy];
+    }
+};
+
+function executeAction(type, descriptor, mode) {
+    if (type !== "Plc ") { throw new Error("Unsupported action " + type); }
+    var size = state.files[descriptor.path];
+    if (!size) { throw new Error("File not found: " + descriptor.path); }
+    calls.push(["place", descriptor.path, mode]);
+    // Centred and scaled down to fit, like Photoshop's place
+    var document = app.activeDocument;
+    var scale = Math.min(1, document.width / size[0], document.height / size[1]);
+    var width = size[0] * scale, height = size[1] * scale;
+    var left = (document.width - width) / 2, top = (document.height - height) / 2;
+    var name = descriptor.path.replace(/^.*[\\\/]/, "").replace(/\.[^.]*$/, "");
+    document.layers.unshift(new Layer(name, [left, top, left + width, top + height]));
+}
+
+var context = vm.createContext({
+    app: app,
+    executeAction: executeAction,
+    charIDToTypeID: function (code) { return code; },
+    ActionDescriptor: ActionDescriptor,
+    File: File,
+    JPEGSaveOptions: JPEGSaveOptions,
+    PNGSaveOptions: PNGSaveOptions,
+    Units: {PIXELS: "PIXELS"},
+    DialogModes: {NO: "NO"},
+    AnchorPosition: {MIDDLECENTER: "MIDDLECENTER"},
+    FormatOptions: {STANDARDBASELINE: 1, OPTIMIZEDBASELINE: 2, PROGRESSIVE: 3},
+    Extension: {LOWERCASE: "LOWERCASE"},
+    NewDocumentMode: {RGB: "RGB"},
+    DocumentFill: {TRANSPARENT: "TRANSPARENT"},
+    ElementPlacement: {PLACEATBEGINNING: "PLACEATBEGINNING"},
+    SaveOptions: {DONOTSAVECHANGES: "DONOTSAVECHANGES"},
+    JSON: undefined
+});
+
+var result = vm.runInContext(script, context);
+console.log(JSON.stringify({
+    result: result,
+    ruler_units: app.preferences.rulerUnits,
+    calls: calls,
+    layers: describe(doc.layers)
+}));
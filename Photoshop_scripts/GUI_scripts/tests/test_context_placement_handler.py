@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from context_placement_handler import ContextPlacementHandler
+from fake_photoshop import FakeApplication, FakeScriptError, FakeSession
+from mask_cache import MaskCache
+from ps_session import SessionPool
+
+
+class NoSnapshotApplication(FakeApplication):
+    """A Photoshop that cannot take history snapshots"""
+
+    def doJavaScript(self, script: str, arguments=None, mode=None) -> str:
+        raise FakeScriptError("Snapshots are not available")
+
+
+@pytest.fixture
+def paths(tmp_path):
+    template_path = str(tmp_path / "template.png")
+    watermark_path = str(tmp_path / "watermark.png")
+    sample_path = str(tmp_path / "sample.jpg")
+    Image.new("RGB", (1000, 1000), (255, 255, 255)).save(template_path)
+    Image.new("RGBA", (300, 100), (0, 0, 0, 255)).save(watermark_path)
+    Image.new("RGB", (500, 500), (120, 80, 200)).save(sample_path)
+    return template_path, watermark_path, sample_path, str(tmp_path / "placements.json")
+
+
+@pytest.mark.parametrize("app_class, has_snapshot", [(FakeApplication, True), (NoSnapshotApplication, False)])
+def test_confirm_placement_keeps_the_captured_settings_and_clears_the_template(paths, app_class, has_snapshot):
+    template_path, watermark_path, sample_path, settings_path = paths
+    app = app_class(realtime=False)
+    pool = SessionPool(lambda path, action=None: FakeSession(path, action, app=app))
+    handler = ContextPlacementHandler(template_path, watermark_path, settings_path, session_pool=pool)
+
+    handler.set_placement_interactively(sample_path, "front")
+    assert pool.has_snapshot(template_path) == has_snapshot
+    layer = handler.current_settings['layer']
+    layer.resize(50, 50)
+    layer.translate(-100, 50)
+    layer.opacity = 80
+    handler.confirm_placement()
+
+    handler.start_watermark_placement()
+    watermark = app.activeDocument.layers[0]
+    watermark.translate(200, 300)
+    settings = handler.confirm_placement()
+
+    # Background removal trims the 500px sample to 400px; the user then halved it and moved it
+    assert settings['size'] == [50, 50]
+    assert settings['position'] == [300, 450]
+    assert settings['opacity'] == 80
+    assert settings['watermark'] == {'position': [550, 750], 'size': [300, 100], 'opacity': 100}
+    assert [layer._name for layer in app.activeDocument.layers] == ["Background"]
+    assert handler.current_settings is None
+
+
+def test_save_placement_settings_stamps_a_copy(paths):
+    template_path, watermark_path, _, settings_path = paths
+    handler = ContextPlacementHandler(template_path, watermark_path, settings_path,
+                                      session_pool=SessionPool(lambda path, action=None: None))
+    watermark = {'size': [300, 100], 'position': [550, 750], 'opacity': 100}
+    settings = {'size': [50, 50], 'position': [300, 450], 'opacity': 80, 'watermark': watermark}
+
+    saved = handler.save_placement_settings("front", settings)
+    handler.save_placement_settings("back", settings)  # As "Copy Settings To All" does
+    assert 'template_size' not in settings and 'template_size' not in watermark
+    assert saved['template_size'] == saved['watermark']['template_size'] == [1000, 1000]
+    assert handler.get_placement_settings("back") == saved
+
+    wide_template_path = template_path.replace("template.png", "wide.png")
+    Image.new("RGB", (1600, 900), (255, 255, 255)).save(wide_template_path)
+    handler.template_path = wide_template_path  # As browsing for another template does
+    assert handler.save_placement_settings("side", settings)['template_size'] == [1600, 900]
+
+
+def preview_handler(paths, mask_cache=None) -> ContextPlacementHandler:
+    template_path, watermark_path, _, settings_path = paths
+    return ContextPlacementHandler(template_path, watermark_path, settings_path,
+                                   session_pool=SessionPool(lambda path, action=None: None), mask_cache=mask_cache)
+
+
+def test_preview_measures_against_the_background_removed_sample(paths, tmp_path):
+    sample_path = str(tmp_path / "mug.jpg")
+    sample = Image.new("RGB", (500, 500), (250, 250, 250))
+    sample.paste((30, 60, 200), (100, 150, 400, 350))
+    sample.save(sample_path, quality=95)
+
+    proxy = preview_handler(paths).create_preview(sample_path)
+    layer = proxy.image_layer
+    # Only the 300x200 object (plus its feathered edge), centred as Photoshop places the 500px sample
+    assert [layer.left, layer.top, layer.base_width, layer.base_height] == pytest.approx([350, 400, 300, 200], abs=6)
+
+
+def test_preview_uses_a_cached_mask(paths, tmp_path):
+    sample_path = paths[2]
+    mask_cache = MaskCache(str(tmp_path / "masks"))
+    mask = np.zeros((500, 500), np.uint8)
+    mask[50:250, 200:300] = 255
+    mask_cache.put(mask_cache.key_for(sample_path), mask)
+
+    layer = preview_handler(paths, mask_cache).create_preview(sample_path).image_layer
+    assert [layer.left, layer.top, layer.base_width, layer.base_height] == pytest.approx([450, 300, 100, 200], abs=1)
+
+
+def test_preview_is_refused_when_the_background_cannot_be_removed(paths, tmp_path):
+    sample_path = str(tmp_path / "scene.png")
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (300, 300, 3), np.uint8)).save(sample_path)
+    with pytest.raises(ValueError, match="set this placement in Photoshop"):
+        preview_handler(paths).create_preview(sample_path)
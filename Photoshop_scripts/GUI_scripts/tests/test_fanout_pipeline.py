@@ -0,0 +1,43 @@
+from PIL import Image
+
+from bg_removal import FlatBackgroundRemover
+from fanout_pipeline import FanOutPipeline, OutputTarget
+from headless_backend import HeadlessBackend
+from image_processor import ImageProcessor
+from mask_cache import MaskCache
+
+OPERATION = "Custom Placement + Background Removal + Watermark"
+CONTEXT_SETTINGS = {'front': {'size': [50, 50], 'position': [100, 150], 'opacity': 100}}
+
+
+def test_locally_removed_masks_are_cached_for_the_next_run(tmp_path):
+    template_path, watermark_path = str(tmp_path / "template.png"), str(tmp_path / "watermark.png")
+    Image.new("RGB", (1000, 1000), (255, 255, 255)).save(template_path)
+    Image.new("RGBA", (600, 200), (0, 0, 0, 255)).save(watermark_path)
+    folder = tmp_path / "mockups"
+    folder.mkdir()
+    mockup = Image.new("RGB", (400, 400), (240, 240, 240))
+    mockup.paste((30, 60, 200), (100, 100, 300, 300))
+    mockup.save(folder / "a_label=front.png")
+
+    processor = ImageProcessor(template_path, watermark_path)
+    processor.watermark_settings = {'size': [300, 100], 'position': [600, 850], 'opacity': 40}
+    pipeline = FanOutPipeline(processor, [OutputTarget("shop", template_path)], bg_remover=FlatBackgroundRemover())
+    cache_dir = str(tmp_path / "masks")
+    logs = []
+    pipeline.run(str(folder), False, {OPERATION}, CONTEXT_SETTINGS, logs.append, mask_cache=MaskCache(cache_dir))
+    assert "Removing background from a_label=front.png" in logs
+
+    # Stored under the local remover's method, not as Photoshop's mask
+    mask_cache = MaskCache(cache_dir)
+    image_path = str(folder / "a_label=front.png")
+    local_method = HeadlessBackend(template_path, watermark_path, bg_remover=FlatBackgroundRemover()).mask_method
+    local_key = mask_cache.key_for(image_path, local_method)
+    assert list(mask_cache.entries) == [local_key]
+    mask = mask_cache.load(local_key)
+    assert mask[200, 200] == 255 and mask[20, 20] == 0
+
+    logs.clear()
+    pipeline.run(str(folder), False, {OPERATION}, CONTEXT_SETTINGS, logs.append, mask_cache=mask_cache)
+    assert "Using cached background mask for a_label=front.png" in logs
+    assert mask_cache.hits == 1 and mask_cache.misses == 0
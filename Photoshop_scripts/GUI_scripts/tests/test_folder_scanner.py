@@ -0,0 +1,37 @@
+import os
+
+from folder_scanner import FolderIndex
+
+
+def test_refresh_sees_files_overwritten_in_place(tmp_path):
+    root = tmp_path / "product"
+    root.mkdir()
+    image = root / "a_label=front.jpg"
+    image.write_bytes(b"1" * 10)
+    assert FolderIndex(str(root)).refresh().entries()[0].size == 10
+
+    # Rewriting a file does not change the directory's mtime
+    directory_mtime = os.stat(root).st_mtime_ns
+    with open(image, "r+b") as f:
+        f.write(b"2" * 20)
+    os.utime(root, ns=(directory_mtime, directory_mtime))
+
+    index = FolderIndex(str(root)).refresh()
+    assert index.dirs_reused == 1 and index.dirs_scanned == 0
+    assert index.entries()[0].size == 20
+    assert index.entries()[0].mtime_ns == os.stat(image).st_mtime_ns
+
+
+def test_refresh_rescans_changed_directories_and_skips_outputs(tmp_path):
+    root = tmp_path / "product"
+    (root / "processed_output").mkdir(parents=True)
+    (root / "processed_output" / "a_label=front-processed.jpg").write_bytes(b"x")
+    (root / "a_label=front.jpg").write_bytes(b"x")
+    index = FolderIndex(str(root)).refresh()
+    (root / "b_label=back.jpg").write_bytes(b"x")
+    os.utime(root, ns=(1, os.stat(root).st_mtime_ns + 10 ** 9))
+
+    index = FolderIndex(str(root)).refresh()
+    assert index.dirs_scanned == 1
+    assert [entry.file for entry in index.entries()] == ["a_label=front.jpg", "b_label=back.jpg"]
+    assert index.sample_for("back") == str(root / "b_label=back.jpg")
@@ -0,0 +1,32 @@
+import pytest
+from PIL import Image
+
+import headless_backend
+from bg_removal import FlatBackgroundRemover
+from headless_backend import HeadlessBackend
+
+
+def test_removing_the_background_leaves_one_resample(tmp_path, monkeypatch):
+    template_path, watermark_path = str(tmp_path / "template.png"), str(tmp_path / "watermark.png")
+    Image.new("RGB", (500, 500), (255, 255, 255)).save(template_path)
+    Image.new("RGBA", (60, 20), (0, 0, 0, 255)).save(watermark_path)
+    mockup_path = str(tmp_path / "mockup.png")
+    mockup = Image.new("RGB", (1000, 1000), (240, 240, 240))
+    mockup.paste((30, 60, 200), (250, 250, 750, 750))
+    mockup.save(mockup_path)
+
+    resamples = []
+    for name in ("resize_rgba", "resample_affine"):
+        resample = getattr(headless_backend, name)
+        monkeypatch.setattr(headless_backend, name,
+                            lambda *args, _resample=resample, _name=name: resamples.append(_name) or _resample(*args))
+    backend = HeadlessBackend(template_path, watermark_path, bg_remover=FlatBackgroundRemover())
+    backend.open()
+    layer = backend.place_image(mockup_path)
+    backend.remove_background(layer)
+    # The 500px square is placed at half size, give or take the feathered edge
+    assert layer.bounds == pytest.approx([125, 125, 375, 375], abs=6)
+    backend.transform_layer(layer, [50, 50], [100, 100])
+    backend.compose()
+    assert resamples == ["resample_affine"]
+    assert layer.bounds == pytest.approx([100, 100, 225, 225], abs=6)
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+from PIL import Image
+
+from bg_removal import FlatBackgroundRemover
+from headless_backend import HeadlessBackend
+from image_processor import ImageProcessor
+from preset_registry import PresetRegistry
+from result_cache import ResultCache
+from run_journal import RunJournal
+
+OPERATION = "Custom Placement + Background Removal + Watermark"
+CONTEXT_SETTINGS = {'front': {'size': [50, 50], 'position': [100, 150], 'opacity': 90,
+                              'watermark': {'size': [300, 100], 'position': [600, 850], 'opacity': 40}}}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    template_path, watermark_path = str(tmp_path / "template.png"), str(tmp_path / "watermark.png")
+    Image.new("RGB", (1000, 1000), (255, 255, 255)).save(template_path)
+    Image.new("RGBA", (600, 200), (0, 0, 0, 255)).save(watermark_path)
+    folder = tmp_path / "mockups"
+    folder.mkdir()
+    Image.new("RGB", (500, 500), (120, 80, 200)).save(folder / "a_label=front.jpg")
+    return template_path, watermark_path, str(folder)
+
+
+def cache_key(paths, tmp_path, backend) -> str:
+    template_path, watermark_path, folder = paths
+    processor = ImageProcessor(template_path, watermark_path)
+    return processor._cache_key(ResultCache(str(tmp_path / "cache")), backend, folder, "a_label=front.jpg",
+                                {OPERATION}, PresetRegistry(CONTEXT_SETTINGS))
+
+
+def test_cache_key_covers_the_resample_filter(paths, tmp_path):
+    template_path, watermark_path, _ = paths
+    keys = {resample: cache_key(paths, tmp_path, HeadlessBackend(template_path, watermark_path, resample=resample))
+            for resample in ("bilinear", "lanczos")}
+    assert keys["bilinear"] != keys["lanczos"]
+    assert keys["lanczos"] == cache_key(paths, tmp_path, HeadlessBackend(template_path, watermark_path,
+                                                                          resample="lanczos"))
+
+
+def test_cache_key_covers_the_local_background_remover(paths, tmp_path):
+    template_path, watermark_path, _ = paths
+    keys = [cache_key(paths, tmp_path, HeadlessBackend(template_path, watermark_path, bg_remover=remover))
+            for remover in (None, FlatBackgroundRemover(), FlatBackgroundRemover(threshold=20))]
+    assert len(set(keys)) == 3
+
+
+def test_a_malformed_context_only_fails_its_own_images(paths, tmp_path):
+    template_path, watermark_path, folder = paths
+    Image.new("RGB", (500, 500), (120, 80, 200)).save(f"{folder}/b_label=back.jpg")
+    processor = ImageProcessor(template_path, watermark_path)
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    logs = []
+    context_settings = dict(CONTEXT_SETTINGS, back={'size': "large", 'position': [0, 0]})
+    processor.process_images(folder, False, {"Add Watermark ONLY"}, context_settings, logs.append,
+                             backend=HeadlessBackend(template_path, watermark_path), journal=journal)
+
+    outcomes = {os.path.basename(path): record for path, record in journal.outcomes(journal.settings).items()}
+    assert outcomes["a_label=front.jpg"]['status'] == "done"
+    assert outcomes["b_label=back.jpg"]['status'] == "failed"
+    assert "Invalid placement settings for back" in outcomes["b_label=back.jpg"]['error']
+    assert any(line.startswith("Warning: Invalid placement settings for back") for line in logs)
@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+from PIL import Image
+
+from fake_photoshop import FakeApplication, FakeSession
+from image_processor import ImageProcessor
+from jsx_executor import JsxBatch, JsxError, JsxExecutor, TEMPLATE_SNAPSHOT
+from photoshop_backend import PhotoshopJsxBackend
+from ps_session import SessionPool
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jsx_dom_stub.js")
+NODE = shutil.which("node")
+
+pytestmark = pytest.mark.skipif(NODE is None, reason="the JSX harness runs scripts under node")
+
+
+def run_jsx(script: str, tmp_path, files=None, document=(1000, 1000),
+            snapshots=(TEMPLATE_SNAPSHOT,), fail_action=None) -> dict:
+    """Run a script against the stub Photoshop DOM; returns its result, the DOM calls and the layers"""
+    script_path, state_path = tmp_path / "batch.jsx", tmp_path / "state.json"
+    script_path.write_text(script)
+    state_path.write_text(json.dumps({'document': list(document), 'files': files or {},
+                                      'snapshots': list(snapshots), 'fail_action': fail_action}))
+    output = subprocess.run([NODE, STUB, str(script_path), str(state_path)],
+                            capture_output=True, text=True, check=True).stdout
+    run = json.loads(output)
+    run['result'] = json.loads(run['result']) if run['result'] is not None else None
+    return run
+
+
+def calls_named(run: dict, name: str) -> list:
+    return [call[1:] for call in run['calls'] if call[0] == name]
+
+
+class NodeApp:
+    """app.doJavaScript through the stub DOM, for JsxExecutor"""
+
+    def __init__(self, tmp_path, **state):
+        self.tmp_path = tmp_path
+        self.state = state
+        self.runs = []
+
+    def doJavaScript(self, script: str, arguments=None, mode=None) -> str:
+        run = run_jsx(script, self.tmp_path, **self.state)
+        self.runs.append(run)
+        return json.dumps(run['result'])
+
+
+class NodeFakeApplication(FakeApplication):
+    """The fake Photoshop, with compiled batches run through the stub DOM"""
+
+    def __init__(self, tmp_path, files):
+        super().__init__(realtime=False)
+        self.node = NodeApp(tmp_path, files=files)
+
+    def doJavaScript(self, script: str, arguments=None, mode=None) -> str:
+        if "result.step" in script:
+            self.spend('javascript')
+            return self.node.doJavaScript(script)
+        return super().doJavaScript(script, arguments, mode)
+
+
+def test_compiled_script_is_extendscript_compatible():
+    batch = JsxBatch()
+    layer = batch.place("C:\\mockups\\a \"b\".png", "Named")
+    batch.remove_background(layer)
+    batch.transform(layer, [50, 50], [1, 2], 80, 10)
+    batch.fit(layer, [100, 50], [3, 4])
+    batch.export_layer(layer, "/tmp/layer.png")
+    batch.record_bounds(layer, "placed")
+    batch.save_jpeg("/tmp/out.jpg", 10, 3)
+    script = batch.compile()
+    # ES3: no block-scoped declarations, arrow functions or template literals
+    assert not re.search(r"\b(let|const)\s|=>|`", script)
+    assert script.count("result.step = ") == 8  # Seven steps and "done"
+
+
+def test_place_names_the_layer_and_centres_it(tmp_path):
+    batch = JsxBatch()
+    layer = batch.place("/in/sample.png", "Sample")
+    batch.record_bounds(layer, "placed")
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/sample.png": [400, 200]})
+    assert run['result']['status'] == "ok" and run['result']['step'] == "done"
+    assert calls_named(run, "place") == [["/in/sample.png", "NO"]]
+    assert run['result']['layers']['placed'] == [300, 400, 700, 600]
+    assert run['ruler_units'] == "CM"  # Restored after the batch
+
+
+def test_place_shrinks_large_files_to_fit(tmp_path):
+    batch = JsxBatch()
+    batch.record_bounds(batch.place("/in/big.png"), "placed")
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/big.png": [4000, 2000]})
+    assert run['result']['layers']['placed'] == [0, 250, 1000, 750]
+
+
+def test_remove_background_runs_the_action(tmp_path):
+    batch = JsxBatch()
+    batch.remove_background(batch.place("/in/sample.png"), "cut_out", "My Actions")
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/sample.png": [500, 500]})
+    assert calls_named(run, "doAction") == [["cut_out", "My Actions"]]
+
+
+def test_transform_resizes_moves_rotates_and_fades(tmp_path):
+    batch = JsxBatch()
+    layer = batch.place("/in/sample.png")
+    batch.transform(layer, [50, 25], [10, 20], 70, 90)
+    batch.record_bounds(layer, "placed")
+    run = run_jsx(batch.compile(snapshot=None), tmp_path, files={"/in/sample.png": [400, 400]})
+    assert calls_named(run, "resize") == [["sample", 50, 25, "MIDDLECENTER"]]
+    # moveTo puts the resized box's top-left corner on the position
+    assert calls_named(run, "translate") == [["sample", 10 - 400, 20 - 450]]
+    assert calls_named(run, "rotate") == [["sample", 90, "MIDDLECENTER"]]
+    assert run['result']['layers']['placed'] == pytest.approx([60, -30, 160, 170])
+    assert run['layers'][0]['opacity'] == 70
+
+
+def test_transform_skips_an_identity_resize_and_rotation(tmp_path):
+    batch = JsxBatch()
+    batch.transform(batch.place("/in/sample.png"), [100, 100], [0, 0])
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/sample.png": [400, 400]})
+    assert not calls_named(run, "resize") and not calls_named(run, "rotate")
+    assert calls_named(run, "translate") == [["sample", -300, -300]]
+
+
+def test_fit_resizes_to_pixels(tmp_path):
+    batch = JsxBatch()
+    layer = batch.place("/in/watermark.png", "Watermark")
+    batch.fit(layer, [300, 100], [600, 800], 40)
+    batch.record_bounds(layer, "watermark")
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/watermark.png": [600, 100]})
+    assert run['result']['layers']['watermark'] == pytest.approx([600, 800, 900, 900])
+    assert calls_named(run, "resize") == [["Watermark", 50, 100, "MIDDLECENTER"]]
+
+
+def test_export_layer_saves_a_transparent_png(tmp_path):
+    batch = JsxBatch()
+    batch.export_layer(batch.place("/in/sample.png"), "/masks/a.png")
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/sample.png": [400, 400]})
+    assert calls_named(run, "newDocument") == [["layer-export", "RGB", "TRANSPARENT"]]
+    assert calls_named(run, "duplicate") == [["sample", "layer-export", "PLACEATBEGINNING"]]
+    saved = calls_named(run, "saveAs")
+    assert saved[0][:2] == ["layer-export", "/masks/a.png"] and saved[0][2]['png']
+    assert calls_named(run, "close") == [["layer-export", "DONOTSAVECHANGES"]]
+
+
+@pytest.mark.parametrize("format_options, scans", [(1, None), (2, None), (3, 3)])
+def test_save_jpeg_options(tmp_path, format_options, scans):
+    batch = JsxBatch()
+    batch.save_jpeg("/out/a-processed.jpg", 9, format_options)
+    run = run_jsx(batch.compile(), tmp_path)
+    (name, path, options, as_copy, extension, _), = calls_named(run, "saveAs")
+    assert (name, path, as_copy, extension) == ("template", "/out/a-processed.jpg", True, "LOWERCASE")
+    assert options == {'quality': 9, 'formatOptions': format_options, 'scans': scans, 'png': False}
+
+
+def test_snapshot_is_restored_after_the_steps(tmp_path):
+    batch = JsxBatch()
+    batch.place("/in/sample.png")
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/sample.png": [400, 400]})
+    assert run['calls'][-1] == ["restore", TEMPLATE_SNAPSHOT]
+    assert [layer['name'] for layer in run['layers']] == ["Background"]
+
+    run = run_jsx(batch.compile(snapshot=None), tmp_path, files={"/in/sample.png": [400, 400]})
+    assert not calls_named(run, "restore") and len(run['layers']) == 2
+
+
+def test_failed_step_is_reported_and_the_document_still_reset(tmp_path):
+    batch = JsxBatch()
+    layer = batch.place("/in/sample.png")
+    batch.remove_background(layer)
+    batch.save_jpeg("/out/a.jpg")
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/sample.png": [400, 400]}, fail_action="remove_bg")
+    assert run['result']['status'] == "error" and run['result']['step'] == "remove_bg"
+    assert "remove_bg failed" in run['result']['error']
+    assert not calls_named(run, "saveAs")
+    assert run['calls'][-1] == ["restore", TEMPLATE_SNAPSHOT]
+
+
+def test_missing_snapshot_is_a_cleanup_error(tmp_path):
+    run = run_jsx(JsxBatch().compile(), tmp_path, snapshots=())
+    assert run['result']['status'] == "ok"
+    assert "No snapshot named" in run['result']['cleanup_error']
+
+
+def test_result_strings_are_escaped(tmp_path):
+    key = 'quote " backslash \\ newline \n done'
+    batch = JsxBatch()
+    batch.record_bounds(batch.place("/in/sample.png"), key)
+    run = run_jsx(batch.compile(), tmp_path, files={"/in/sample.png": [400, 400]})
+    assert list(run['result']['layers']) == [key]
+
+
+def test_executor_parses_results_and_raises_on_errors(tmp_path):
+    app = NodeApp(tmp_path, files={"/in/sample.png": [400, 400]})
+    executor = JsxExecutor(app)
+    batch = JsxBatch()
+    batch.record_bounds(batch.place("/in/sample.png"), "placed")
+    assert executor.run(batch)['layers']['placed'] == [300, 300, 700, 700]
+
+    batch = JsxBatch()
+    batch.place("/in/missing.png")
+    with pytest.raises(JsxError, match="File not found.*during place"):
+        executor.run(batch)
+    assert executor.round_trips == 2
+
+
+def test_jsx_backend_runs_each_image_as_one_script(tmp_path):
+    folder = tmp_path / "mockups"
+    folder.mkdir()
+    template_path, watermark_path = str(tmp_path / "template.png"), str(tmp_path / "watermark.png")
+    Image.new("RGB", (1000, 1000), (255, 255, 255)).save(template_path)
+    Image.new("RGBA", (600, 200), (0, 0, 0, 255)).save(watermark_path)
+    files = {watermark_path: [600, 200]}
+    for name in ("a_label=front.jpg", "b_label=front.jpg"):
+        Image.new("RGB", (500, 500), (120, 80, 200)).save(folder / name)
+        files[str(folder / name)] = [500, 500]
+
+    app = NodeFakeApplication(tmp_path, files)
+    pool = SessionPool(lambda path, action=None: FakeSession(path, action, app=app))
+    processor = ImageProcessor(template_path, watermark_path, session_pool=pool)
+    backend = PhotoshopJsxBackend(template_path, watermark_path, session_pool=pool)
+    context_settings = {'front': {'size': [50, 50], 'position': [100, 150], 'opacity': 90,
+                                  'watermark': {'size': [300, 100], 'position': [600, 850], 'opacity': 40}}}
+    processor.process_images(str(folder), False, {"Custom Placement + Background Removal + Watermark"},
+                             context_settings, backend=backend)
+
+    assert len(app.node.runs) == 2  # One round trip per image
+    for run, name in zip(app.node.runs, ("a_label=front", "b_label=front")):
+        assert run['result']['status'] == "ok"
+        (_, path, _, _, _, layers), = calls_named(run, "saveAs")
+        assert path == processor._output_path(str(folder), name + ".jpg")
+        watermark, image, _ = layers
+        # Background removal trims the 500px layer to 400px, then it is halved and moved
+        assert image['bounds'] == pytest.approx([100, 150, 300, 350]) and image['opacity'] == 90
+        assert watermark['bounds'] == pytest.approx([600, 850, 900, 950]) and watermark['opacity'] == 40
+        assert run['calls'][-1] == ["restore", TEMPLATE_SNAPSHOT]
@@ -0,0 +1,61 @@
+import os
+import threading
+
+import numpy as np
+
+import mask_cache
+from mask_cache import MaskCache
+
+
+def noise_mask(seed):
+    # Random pixels do not compress, so every mask stores at about the same size
+    return np.random.default_rng(seed).integers(0, 256, (64, 64), dtype=np.uint8)
+
+
+def test_eviction_drops_the_least_recently_used(tmp_path):
+    cache = MaskCache(str(tmp_path / "masks"))
+    cache.put("a" * 64, noise_mask(0))
+    cache.max_bytes = int(cache.total_bytes() * 3.5)
+    for key in ("b", "c"):
+        cache.put(key * 64, noise_mask(ord(key)))
+    assert cache.lookup("a" * 64)  # "b" is now the oldest
+    cache.put("d" * 64, noise_mask(3))
+    assert list(cache.entries) == ["c" * 64, "a" * 64, "d" * 64]
+    assert not os.path.exists(cache._mask_path("b" * 64))
+    assert cache.total_bytes() == sum(entry['size'] for entry in cache.entries.values())
+
+
+def test_total_survives_replacing_and_reloading(tmp_path):
+    cache = MaskCache(str(tmp_path / "masks"))
+    cache.put("a" * 64, noise_mask(0))
+    cache.put("a" * 64, np.zeros((64, 64), dtype=np.uint8))
+    size = os.path.getsize(cache._mask_path("a" * 64))
+    assert cache.total_bytes() == size
+    cache.save()
+    assert MaskCache(str(tmp_path / "masks")).total_bytes() == size
+
+
+def test_lookups_while_another_thread_stores(tmp_path):
+    cache = MaskCache(str(tmp_path / "masks"), max_bytes=20000)
+    mask = noise_mask(0)
+    worker = threading.Thread(target=lambda: [cache.put(f"{i:064x}", mask) for i in range(100)])
+    worker.start()
+    for i in range(100):
+        cache.lookup(f"{i:064x}")
+        cache.save()
+    worker.join()
+    assert cache.total_bytes() == sum(entry['size'] for entry in cache.entries.values())
+    assert cache.total_bytes() <= cache.max_bytes
+
+
+def test_file_hashes_keep_only_the_most_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(mask_cache, "MAX_FILE_HASHES", 3)
+    cache = MaskCache(str(tmp_path / "masks"))
+    paths = []
+    for i in range(4):
+        paths.append(str(tmp_path / f"source-{i}.jpg"))
+        with open(paths[-1], 'wb') as f:
+            f.write(os.urandom(10))
+        cache.key_for(paths[-1])
+    cache.key_for(paths[1])
+    assert list(cache.file_hashes) == [paths[2], paths[3], paths[1]]
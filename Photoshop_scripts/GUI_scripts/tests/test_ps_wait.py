@@ -0,0 +1,128 @@
+import time
+
+import pytest
+from PIL import Image
+
+from fake_photoshop import FakeApplication, FakeLayer, FakeSession
+from photoshop_backend import PhotoshopBackend
+from ps_session import SessionPool
+from ps_wait import HISTOGRAM_BUCKETS, PhotoshopWaiter, TimingProfile, WaitTimeout, resized_bounds, same_pixel_box
+
+
+class PixelLayer(FakeLayer):
+    """A layer whose bounds read back in whole pixels, as Photoshop reports them"""
+
+    @property
+    def bounds(self):
+        return [round(b) for b in super().bounds]
+
+
+@pytest.fixture
+def app():
+    return FakeApplication(realtime=False)
+
+
+@pytest.fixture
+def backend(app, tmp_path):
+    template_path = str(tmp_path / "template.png")
+    watermark_path = str(tmp_path / "watermark.png")
+    Image.new("RGB", (1000, 1000), (255, 255, 255)).save(template_path)
+    Image.new("RGBA", (300, 100), (0, 0, 0, 255)).save(watermark_path)
+    pool = SessionPool(lambda path, action=None: FakeSession(path, action, app=app))
+    # Any wait that has to run into the timeout fails the test quickly
+    backend = PhotoshopBackend(template_path, watermark_path, waiter=PhotoshopWaiter(timeout=1.0),
+                               session_pool=pool)
+    backend.open(log=lambda message: None)
+    yield backend
+    backend.close()
+
+
+def place_pixel_layer(backend, bounds):
+    document = backend.ps.active_document
+    layer = PixelLayer(document, "sample", bounds)
+    document.layers.insert(0, layer)
+    return layer
+
+
+def timed_transform(backend, layer, size, position, rotate=0) -> float:
+    start = time.perf_counter()
+    backend.transform_layer(layer, size, position, 100, rotate)
+    return time.perf_counter() - start
+
+
+def test_until_returns_once_the_condition_holds():
+    calls = []
+    waiter = PhotoshopWaiter(sleep=lambda seconds: None)
+    waiter.until(lambda: calls.append(1) or len(calls) == 3, "poll")
+    assert len(calls) == 3
+    assert len(waiter.profile.samples["poll"]) == 1
+
+
+def test_until_treats_photoshop_errors_as_not_ready():
+    calls = []
+
+    def busy_then_ready():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("Photoshop is busy")
+        return True
+
+    PhotoshopWaiter(sleep=lambda seconds: None).until(busy_then_ready, "busy")
+    assert len(calls) == 3
+
+
+def test_until_times_out_and_records_the_wait():
+    waiter = PhotoshopWaiter(timeout=0.05)
+    with pytest.raises(WaitTimeout):
+        waiter.until(lambda: False, "never")
+    assert waiter.profile.samples["never"][0] >= 0.05
+
+
+def test_polls_back_off_up_to_the_cap():
+    delays = []
+    waiter = PhotoshopWaiter(timeout=10, initial_delay=0.1, backoff=2, max_delay=0.5, sleep=delays.append)
+    waiter.until(lambda: len(delays) == 5, "backoff")
+    assert delays == [0.1, 0.2, 0.4, 0.5, 0.5]
+
+
+def test_histogram_buckets_and_summary():
+    profile = TimingProfile()
+    for seconds in (0.005, 0.03, 0.03, 100.0):
+        profile.record("place", seconds)
+    counts = profile.histogram("place")
+    assert len(counts) == len(HISTOGRAM_BUCKETS) + 1
+    assert counts[0] == 1 and counts[1] == 2 and counts[-1] == 1
+    assert profile.summary()[0].startswith("place: n=4")
+
+
+def test_place_waits_for_the_new_layer(backend, tmp_path):
+    image_path = str(tmp_path / "sample.png")
+    Image.new("RGB", (500, 400), (10, 20, 30)).save(image_path)
+    layer = backend.place_image(image_path)
+    assert len(backend.ps.active_document.artLayers) == 2
+    assert layer.bounds == [250, 300, 750, 700]
+    assert backend.waiter.profile.samples["place"]
+
+
+def test_resize_waits_for_the_new_bounds(backend):
+    layer = place_pixel_layer(backend, [100, 100, 300, 300])
+    timed_transform(backend, layer, [50, 50], [10, 20])
+    assert layer.bounds == [10, 20, 110, 120]
+
+
+@pytest.mark.parametrize("bounds, size, rotate", [
+    ([100, 100, 300, 200], [100, 100], 180),  # 180 degrees keeps any box
+    ([100, 100, 300, 300], [100, 100], 90),  # 90 degrees keeps a square
+    ([100, 100, 300, 300], [100.1, 100.1], 0),  # Rounds back to the same pixel box
+])
+def test_transforms_that_keep_the_bounds_do_not_wait_for_a_change(backend, bounds, size, rotate):
+    layer = place_pixel_layer(backend, bounds)
+    elapsed = timed_transform(backend, layer, size, bounds[:2], rotate)
+    assert elapsed < 0.5
+    assert layer.bounds == bounds
+
+
+def test_resized_bounds_match_a_centre_anchored_resize():
+    assert resized_bounds([100, 100, 300, 200], [50, 200]) == [150, 50, 250, 250]
+    assert same_pixel_box(resized_bounds([0, 0, 200, 200], [100.1, 100.1]), [0, 0, 200, 200])
+    assert not same_pixel_box(resized_bounds([0, 0, 200, 200], [101, 101]), [0, 0, 200, 200])
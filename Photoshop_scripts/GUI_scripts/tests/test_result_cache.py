@@ -0,0 +1,56 @@
+import os
+import threading
+
+import result_cache
+from result_cache import ResultCache
+
+
+def write_output(path, size=1000):
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def test_eviction_drops_the_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=3000)
+    output = str(tmp_path / "out.jpg")
+    for key in ("a", "b", "c"):
+        cache.store(key * 64, write_output(output))
+    assert cache.lookup("a" * 64, str(tmp_path / "copy.jpg"))  # "b" is now the oldest
+    cache.store("d" * 64, write_output(output))
+    assert list(cache.entries) == ["c" * 64, "a" * 64, "d" * 64]
+    assert cache.total_bytes() == 3000
+
+
+def test_total_survives_replacing_and_reloading(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    output = str(tmp_path / "out.jpg")
+    cache.store("a" * 64, write_output(output, 500))
+    cache.store("a" * 64, write_output(output, 800))
+    assert cache.total_bytes() == 800
+    cache.save()
+    assert ResultCache(str(tmp_path / "cache")).total_bytes() == 800
+
+
+def test_drop_contexts_while_another_thread_stores(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    output = write_output(str(tmp_path / "out.jpg"))
+    worker = threading.Thread(target=lambda: [cache.store(f"{i:064x}", output, "front") for i in range(300)])
+    worker.start()
+    for _ in range(100):
+        cache.drop_contexts(["front"])
+        cache.save()
+    worker.join()
+    assert cache.total_bytes() == sum(entry['size'] for entry in cache.entries.values())
+
+
+def test_file_hashes_keep_only_the_most_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "MAX_FILE_HASHES", 3)
+    cache = ResultCache(str(tmp_path / "cache"))
+    paths = []
+    for i in range(4):
+        paths.append(str(tmp_path / f"source-{i}.jpg"))
+        write_output(paths[-1], 10)
+        cache.file_hash(paths[-1])
+    cache.file_hash(paths[1])
+    assert list(cache.file_hashes) == [paths[2], paths[3], paths[1]]
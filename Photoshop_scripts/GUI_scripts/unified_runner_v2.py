@@ -15,6 +15,20 @@ from photoshop import Session
 import time
 from context_placement_handler import ContextPlacementHandler
 from image_processor import ImageProcessor
+from headless_backend import HeadlessBackend
+from result_cache import ResultCache
+from folder_scanner import FolderIndex
+from processing_worker import ProcessingWorker
+from log_sink import LEVELS, LogSink
+from jpeg_encoder import DEFAULT_PROFILE, PROFILES
+from ps_session import SessionPool
+from mask_cache import MaskCache
+from bg_removal import FlatBackgroundRemover
+from placement_preview import PlacementPreviewWindow
+from run_journal import RunJournal
+
+# Lines kept in the status box; older ones are trimmed (the log file keeps everything)
+MAX_STATUS_LINES = 1000
 
 class ProcessingOptions:
     """Stores the selected processing options"""
@@ -43,17 +57,29 @@ class UnifiedRunnerGUI(ctk.CTk):
         self.selected_folders = []
         self.processing_options = set()
         self.context_settings = {}  # Stores placement settings for each context
+        self.folder_index = None  # Index of the selected folder's images, built once per folder
+        self.worker = None  # Background processing run, if one is active
+        self.preview_window = None  # Open proxy placement window, if any
+        self.set_all_btn = None  # Created with the context settings
+        self.log_sink = LogSink()  # Buffers processing log lines for the status box and writes the log file
         
         # Initialize paths
         self.template_path = "C:/Users/balma/Documents/ecommerce/lady cosmica/background listing templates/base-template.png"  # TODO: Make configurable
         self.watermark_path = "C:/Users/balma/Documents/ecommerce/lady cosmica/graphics-watermarks-backgrounds/Lady-Cosmica-Watermark.png"  # TODO: Make configurable
         
-        # Initialize handlers
+        # Initialize handlers; they share one Photoshop session so the template is only opened once
+        self.session_pool = SessionPool()
+        self.mask_cache = MaskCache()  # Background removals are reused by later runs and calibrations
         self.placement_handler = ContextPlacementHandler(
             template_path=self.template_path,
-            watermark_path=self.watermark_path
+            watermark_path=self.watermark_path,
+            session_pool=self.session_pool,
+            mask_cache=self.mask_cache
         )
-        self.image_processor = ImageProcessor(self.template_path, self.watermark_path)
+        self.image_processor = ImageProcessor(self.template_path, self.watermark_path, session_pool=self.session_pool)
+        self.result_cache = ResultCache()  # Lets re-runs skip unchanged images
+        # Outputs made with a context's old placement can never be reused
+        self.placement_handler.settings.subscribe(self.result_cache.drop_contexts)
         
         self._create_gui()
     
@@ -176,6 +202,65 @@ class UnifiedRunnerGUI(ctk.CTk):
         
         # Store watermark settings
         self.watermark_settings = None
+        
+        # Compositing backend selection
+        backend_frame = ctk.CTkFrame(config_frame)
+        backend_frame.pack(fill="x", padx=5, pady=5)
+        
+        self.headless_var = ctk.BooleanVar(value=False)
+        
+        headless_checkbox = ctk.CTkCheckBox(
+            backend_frame,
+            text="Headless compositing (no Photoshop; backgrounds only from cached masks)",
+            variable=self.headless_var
+        )
+        headless_checkbox.pack(pady=2)
+        
+        # Flat-backdrop mockups can have their background removed without Photoshop;
+        # images it cannot handle are reported so they can be run through Photoshop
+        self.local_bg_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(
+            backend_frame,
+            text="Headless: remove flat backgrounds locally",
+            variable=self.local_bg_var
+        ).pack(pady=2)
+        
+        # Log verbosity (Debug adds per-step dimensions and timings)
+        log_level_frame = ctk.CTkFrame(backend_frame)
+        log_level_frame.pack(pady=2)
+        
+        ctk.CTkLabel(log_level_frame, text="Log level:").pack(side="left", padx=5)
+        self.log_level_var = ctk.StringVar(value="Info")
+        ctk.CTkOptionMenu(
+            log_level_frame,
+            values=list(LEVELS),
+            variable=self.log_level_var,
+            command=lambda name: setattr(self.log_sink, 'level', LEVELS[name]),
+            width=100
+        ).pack(side="left", padx=5)
+        
+        # Output JPEG profile (quality, progressive, chroma subsampling)
+        ctk.CTkLabel(log_level_frame, text="Output profile:").pack(side="left", padx=5)
+        self.jpeg_profile_var = ctk.StringVar(value=DEFAULT_PROFILE)
+        ctk.CTkOptionMenu(
+            log_level_frame,
+            values=list(PROFILES),
+            variable=self.jpeg_profile_var,
+            width=140
+        ).pack(side="left", padx=5)
+        
+        # Every run is journaled; an interrupted one can pick up where it stopped
+        run_mode_frame = ctk.CTkFrame(backend_frame)
+        run_mode_frame.pack(pady=2)
+        
+        ctk.CTkLabel(run_mode_frame, text="Run:").pack(side="left", padx=5)
+        self.run_mode_var = ctk.StringVar(value="New run")
+        ctk.CTkOptionMenu(
+            run_mode_frame,
+            values=["New run", "Resume", "Retry failed"],
+            variable=self.run_mode_var,
+            width=140
+        ).pack(side="left", padx=5)
     
     def _create_folder_section(self):
         """Create the folder selection section"""
@@ -254,6 +339,14 @@ class UnifiedRunnerGUI(ctk.CTk):
         )
         self.context_label.pack(pady=5)
         
+        # Place on a small proxy in this window instead of a full-size Photoshop document
+        self.proxy_preview_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(
+            self.context_frame,
+            text="Proxy preview (no Photoshop; needs a flat background or a cached mask)",
+            variable=self.proxy_preview_var
+        ).pack(pady=2)
+        
         # Create scrollable frame for contexts
         self.context_scroll = ctk.CTkScrollableFrame(
             self.context_frame,
@@ -283,6 +376,26 @@ class UnifiedRunnerGUI(ctk.CTk):
             state="disabled"
         )
         self.run_btn.pack(side="left", padx=5)
+        
+        self.pause_btn = ctk.CTkButton(
+            button_frame,
+            text="Pause",
+            command=self._toggle_pause,
+            state="disabled",
+            width=100
+        )
+        self.pause_btn.pack(side="left", padx=5)
+        
+        self.cancel_btn = ctk.CTkButton(
+            button_frame,
+            text="Cancel",
+            command=self._cancel_processing,
+            state="disabled",
+            width=100,
+            fg_color="#8B0000",  # Dark red
+            hover_color="#A52A2A"  # Brown
+        )
+        self.cancel_btn.pack(side="left", padx=5)
     
     def _create_status_section(self):
         """Create the status display section"""
@@ -299,6 +412,17 @@ class UnifiedRunnerGUI(ctk.CTk):
         )
         self.clear_btn.pack(side="bottom", pady=(5, 0))
         
+        # Progress bar and ETA for processing runs
+        progress_frame = ctk.CTkFrame(status_frame)
+        progress_frame.pack(side="bottom", fill="x", pady=(5, 0))
+        
+        self.progress_bar = ctk.CTkProgressBar(progress_frame)
+        self.progress_bar.pack(side="left", fill="x", expand=True, padx=5)
+        self.progress_bar.set(0)
+        
+        self.progress_label = ctk.CTkLabel(progress_frame, text="", width=220)
+        self.progress_label.pack(side="right", padx=5)
+        
         # Create scrollable text box
         self.status_text = ctk.CTkTextbox(
             status_frame,
@@ -354,6 +478,7 @@ class UnifiedRunnerGUI(ctk.CTk):
         self.status_text.insert('end', f"Analyzing folder: {folder}\n")
         
         # Find all unique contexts
+        self._get_folder_index(folder).refresh()
         contexts = set()
         if self.mode_var.get() == "single":
             contexts = self._analyze_single_folder(folder)
@@ -367,33 +492,19 @@ class UnifiedRunnerGUI(ctk.CTk):
         else:
             self.status_text.insert('end', "No image contexts found\n")
     
+    def _get_folder_index(self, folder: str) -> FolderIndex:
+        """Index for the selected folder, reused until a different folder is chosen"""
+        if self.folder_index is None or self.folder_index.root_folder != os.path.abspath(folder):
+            self.folder_index = FolderIndex(folder)
+        return self.folder_index
+    
     def _analyze_single_folder(self, folder: str) -> Set[str]:
         """Analyze a single folder for image contexts"""
-        contexts = set()
-        for file in os.listdir(folder):
-            if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                context = self._extract_context(file)
-                if context:
-                    contexts.add(context)
-        return contexts
+        return self._get_folder_index(folder).contexts(recursive=False)
     
     def _analyze_mass_folders(self, root_folder: str) -> Set[str]:
         """Analyze all folders under root for image contexts"""
-        contexts = set()
-        for root, _, files in os.walk(root_folder):
-            for file in files:
-                if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    context = self._extract_context(file)
-                    if context:
-                        contexts.add(context)
-        return contexts
-    
-    def _extract_context(self, filename: str) -> str:
-        """Extract context from filename"""
-        try:
-            return filename[filename.find('label=')+6:-4]
-        except:
-            return ""
+        return self._get_folder_index(root_folder).contexts(recursive=True)
     
     def _setup_context_settings(self, contexts: Set[str]):
         """Setup the context settings UI"""
@@ -433,13 +544,14 @@ class UnifiedRunnerGUI(ctk.CTk):
         action_frame.pack(fill="x", padx=5, pady=5)
         
         # Add Set All button
-        set_all_btn = ctk.CTkButton(
+        self.set_all_btn = ctk.CTkButton(
             action_frame,
             text="Set Placement For All",
             command=self._set_all_placements,
-            width=200
+            width=200,
+            state="disabled" if self._processing_active() else "normal"
         )
-        set_all_btn.pack(side="left", padx=5, pady=5)
+        self.set_all_btn.pack(side="left", padx=5, pady=5)
         
         # Add Reset All button
         reset_all_btn = ctk.CTkButton(
@@ -563,10 +675,38 @@ class UnifiedRunnerGUI(ctk.CTk):
             self.status_text.insert('end', f"❌ ERROR resetting all placements: {str(e)}\n")
             self.status_text.insert('end', "="*50 + "\n\n")
     
+    def _processing_active(self) -> bool:
+        """Whether a run is using Photoshop and the mask cache on the worker thread"""
+        return bool(self.worker and self.worker.is_alive())
+    
+    def _placement_active(self) -> bool:
+        """Whether a placement session or preview window is open"""
+        return bool(self.placement_handler.has_active_session() or self.preview_window)
+    
+    def _refuse_while_processing(self, action: str) -> bool:
+        """Report and return True if a run is active; it shares Photoshop's template document"""
+        if not self._processing_active():
+            return False
+        self.status_text.insert('end', "\n" + "="*50 + "\n")
+        self.status_text.insert('end', f"⚠️ Cannot {action} while processing is running. Wait for it to finish or cancel it.\n")
+        self.status_text.insert('end', "="*50 + "\n\n")
+        return True
+    
+    def _set_photoshop_controls(self, state: str):
+        """Enable or disable the buttons that start Photoshop work or change placements"""
+        self.watermark_position_btn.configure(state=state)
+        if self.set_all_btn:
+            self.set_all_btn.configure(state=state)
+        for widgets in self.context_widgets.values():
+            widgets['set_btn'].configure(state=state)
+            widgets['copy_btn'].configure(state=state)
+    
     def _set_context_placement(self, context: str):
         """Set placement settings for a context using a sample image"""
+        if self._refuse_while_processing("set a placement"):
+            return
         # Check if there's an active session
-        if self.placement_handler.has_active_session():
+        if self._placement_active():
             self.status_text.insert('end', "\n" + "="*50 + "\n")
             self.status_text.insert('end', "⚠️ Please complete the current placement before starting another!\n")
             self.status_text.insert('end', "="*50 + "\n\n")
@@ -580,20 +720,9 @@ class UnifiedRunnerGUI(ctk.CTk):
                 widgets['set_btn'].configure(state="disabled")
             
             # Find a sample image for this context
-            sample_image = None
-            if self.mode_var.get() == "single":
-                for file in os.listdir(folder):
-                    if context in file.lower() and file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                        sample_image = os.path.join(folder, file)
-                        break
-            else:
-                for root, _, files in os.walk(folder):
-                    for file in files:
-                        if context in file.lower() and file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                            sample_image = os.path.join(root, file)
-                            break
-                    if sample_image:
-                        break
+            sample_image = self._get_folder_index(folder).sample_for(
+                context, recursive=self.mode_var.get() == "mass"
+            )
             
             if not sample_image:
                 self.status_text.insert('end', "\n" + "="*50 + "\n")
@@ -604,6 +733,10 @@ class UnifiedRunnerGUI(ctk.CTk):
             # Convert to Windows path format
             sample_image = os.path.normpath(sample_image)
             
+            if self.proxy_preview_var.get():
+                self._open_placement_preview(context, sample_image)
+                return
+            
             # Reset confirmation state
             self.context_widgets[context]['confirmed'] = False
             confirm_btn = self.context_widgets[context]['confirm_btn']
@@ -670,7 +803,7 @@ class UnifiedRunnerGUI(ctk.CTk):
                 # Store settings
                 if 'watermark' in settings:
                     # This was the final confirmation with watermark settings
-                    self.context_settings[context] = settings
+                    self.context_settings[context] = self.placement_handler.save_placement_settings(context, settings)
                     
                     if 'output_path' in settings:
                         self.status_text.insert('end', f"Successfully completed placement and watermark settings for {context}\n")
@@ -717,7 +850,8 @@ class UnifiedRunnerGUI(ctk.CTk):
                         self.placement_handler.start_watermark_placement()
                     else:
                         # In default watermark mode, complete immediately
-                        self.context_settings[context] = settings
+                        self.context_settings[context] = self.placement_handler.save_placement_settings(
+                            context, settings)
                         if 'output_path' in settings:
                             self.status_text.insert('end', f"Successfully completed placement settings for {context}\n")
                             
@@ -749,8 +883,65 @@ class UnifiedRunnerGUI(ctk.CTk):
                 if not widgets['confirmed']:  # Don't re-enable confirmed buttons
                     widgets['confirm_btn'].configure(state="normal")
     
+    def _open_placement_preview(self, context: str, sample_image: str):
+        """Set a context's placement on a proxy of the template inside the GUI"""
+        try:
+            proxy = self.placement_handler.create_preview(
+                sample_image,
+                with_watermark=not self.watermark_mode_var.get(),  # Individual watermark mode
+                watermark_settings=self.watermark_settings
+            )
+        except Exception as e:
+            self.status_text.insert('end', "\n" + "="*50 + "\n")
+            self.status_text.insert('end', f"❌ ERROR opening preview for {context}: {str(e)}\n")
+            self.status_text.insert('end', "="*50 + "\n\n")
+            return
+        
+        self.status_text.insert('end', f"\nSetting up placement for {context} in the preview window:\n")
+        self.status_text.insert('end', "- Drag the image (or watermark) to move it\n")
+        self.status_text.insert('end', "- Use the sliders to scale and fade the selected layer\n")
+        self.status_text.insert('end', "- Click 'Confirm' to save the placement\n\n")
+        self.preview_window = PlacementPreviewWindow(
+            self,
+            proxy,
+            f"Placement for {context}",
+            on_confirm=lambda settings: self._confirm_preview_placement(context, sample_image, proxy),
+            on_cancel=lambda: setattr(self, 'preview_window', None)
+        )
+    
+    def _confirm_preview_placement(self, context: str, sample_image: str, proxy):
+        """Store a placement confirmed in the preview window"""
+        self.preview_window = None
+        try:
+            self.context_settings[context] = self.placement_handler.save_preview_placement(
+                context, sample_image, proxy
+            )
+        except Exception as e:
+            self.status_text.insert('end', "\n" + "="*50 + "\n")
+            self.status_text.insert('end', f"❌ ERROR saving placement for {context}: {str(e)}\n")
+            self.status_text.insert('end', "="*50 + "\n\n")
+            return
+        
+        self.status_text.insert('end', f"Successfully completed placement settings for {context}\n")
+        self.status_text.insert('end', "⚠️ Remember to click 'Run Processing' to create the output files\n")
+        widgets = self.context_widgets[context]
+        widgets['confirm_btn'].configure(
+            state="normal",  # Keep enabled to show completion
+            text="CONFIRMED",
+            fg_color="#2e8b57",  # Sea green color
+            hover_color="#2e8b57"  # Disable hover effect
+        )
+        widgets['confirmed'] = True
+        widgets['copy_btn'].pack(side="left", padx=2)
+        
+        # If this was part of Set All, move to next context
+        if hasattr(self, '_set_all_queue') and self._set_all_queue:
+            self._process_next_in_queue()
+    
     def _set_all_placements(self):
         """Start the process of setting placement for all contexts"""
+        if self._refuse_while_processing("set placements"):
+            return
         # Create queue of unconfirmed contexts
         self._set_all_queue = [
             context for context, widgets in self.context_widgets.items()
@@ -807,42 +998,145 @@ class UnifiedRunnerGUI(ctk.CTk):
                     self.status_text.insert('end', "="*50 + "\n\n")
                     return
         
+        # Only one run at a time
+        if self._processing_active():
+            self.status_text.insert('end', "Processing is already running\n")
+            return
+        
+        # Placement sessions use the same template document and mask cache as the run
+        if self._placement_active():
+            self.status_text.insert('end', "\n" + "="*50 + "\n")
+            self.status_text.insert('end', "⚠️ Please confirm or close the open placement before running\n")
+            self.status_text.insert('end', "="*50 + "\n\n")
+            return
+        
         # Clear status text
         self.status_text.delete('1.0', 'end')
         self.status_text.insert('end', "Starting processing...\n")
+        self.progress_bar.set(0)
+        self.progress_label.configure(text="")
         
         # Disable buttons during processing
         self.run_btn.configure(state="disabled")
         self.analyze_btn.configure(state="disabled")
+        self.pause_btn.configure(state="normal", text="Pause")
+        self.cancel_btn.configure(state="normal")
+        self._set_photoshop_controls("disabled")
         
-        try:
-            def update_status(msg: str):
-                self.status_text.insert('end', f"{msg}\n")
-                self.status_text.see('end')
-                self.update()  # Update GUI
-            
-            # Pass watermark settings to image processor
-            if self.watermark_settings:
-                self.image_processor.set_watermark_settings(self.watermark_settings)
-            
-            # Run processing
-            self.image_processor.process_images(
-                folder=folder,
-                is_mass_mode=self.mode_var.get() == "mass",
-                operations=self.processing_options,
-                context_settings=self.context_settings,
-                status_callback=update_status
+        # Pass watermark settings to image processor
+        if self.watermark_settings:
+            self.image_processor.set_watermark_settings(self.watermark_settings)
+        
+        # Pick the compositing backend (None means Photoshop)
+        backend = None
+        workers = 1
+        if self.headless_var.get():
+            backend = HeadlessBackend(
+                self.template_path, self.watermark_path,
+                bg_remover=FlatBackgroundRemover() if self.local_bg_var.get() else None
             )
-            
+            workers = os.cpu_count() or 1
+        
+        # Run processing on a background thread; results come back through its event queue
+        self.worker = ProcessingWorker(self.image_processor, dict(
+            folder=folder,
+            is_mass_mode=self.mode_var.get() == "mass",
+            operations=set(self.processing_options),
+            context_settings=dict(self.context_settings),
+            backend=backend,
+            workers=workers,
+            cache=self.result_cache,
+            file_index=self._get_folder_index(folder),
+            jpeg_profile=self.jpeg_profile_var.get(),
+            mask_cache=self.mask_cache,
+            journal=RunJournal.for_folder(folder),
+            resume=self.run_mode_var.get() == "Resume",
+            retry_failed=self.run_mode_var.get() == "Retry failed"
+        ), log=self.log_sink)
+        self.log_sink.drain()  # Drop anything left from an earlier run
+        self.worker.start()
+        self.after(100, self._poll_worker)
+    
+    def _poll_worker(self):
+        """Drain the worker's events on the Tk thread"""
+        if not self.worker:
+            return
+        
+        lines, dropped = self.log_sink.drain()
+        if dropped:
+            lines.insert(0, f"... {dropped} earlier lines not shown here (the log file has them)")
+        outcome = None
+        for event in self.worker.drain():
+            kind = event[0]
+            if kind == "log":
+                lines.append(event[1])
+            elif kind == "progress":
+                self._show_progress(*event[1:])
+            else:
+                outcome = event
+        
+        # One insert per poll instead of one per log line
+        if lines:
+            self.status_text.insert('end', "\n".join(lines) + "\n")
+            self._trim_status()
+            self.status_text.see('end')
+        
+        if outcome is None:
+            self.after(100, self._poll_worker)
+            return
+        
+        kind, detail = outcome
+        if kind == "finished":
             self.status_text.insert('end', "Processing complete!\n")
-            
-        except Exception as e:
-            self.status_text.insert('end', f"Error during processing: {str(e)}\n")
-            
-        finally:
-            # Re-enable buttons
-            self.run_btn.configure(state="normal")
-            self.analyze_btn.configure(state="normal")
+        elif kind == "cancelled":
+            self.status_text.insert('end', "Processing cancelled\n")
+        else:
+            self.status_text.insert('end', f"Error during processing: {detail}\n")
+        self.status_text.see('end')
+        
+        # Re-enable buttons
+        self.worker = None
+        self.run_btn.configure(state="normal")
+        self.analyze_btn.configure(state="normal")
+        self.pause_btn.configure(state="disabled", text="Pause")
+        self.cancel_btn.configure(state="disabled")
+        self._set_photoshop_controls("normal")
+    
+    def _trim_status(self):
+        """Keep only the last MAX_STATUS_LINES lines in the status box"""
+        line_count = int(self.status_text.index('end-1c').split('.')[0])
+        if line_count > MAX_STATUS_LINES:
+            self.status_text.delete('1.0', f"{line_count - MAX_STATUS_LINES + 1}.0")
+    
+    def _show_progress(self, done: int, total: int, eta):
+        """Update the progress bar and ETA label"""
+        self.progress_bar.set(done / total if total else 1)
+        text = f"{done}/{total}"
+        if eta is not None and done < total:
+            minutes, seconds = divmod(int(eta), 60)
+            text += f" - about {minutes}m {seconds:02d}s left"
+        self.progress_label.configure(text=text)
+    
+    def _toggle_pause(self):
+        """Pause or resume the active run (takes effect between images)"""
+        if not self.worker:
+            return
+        control = self.worker.control
+        if control.paused:
+            control.resume()
+            self.pause_btn.configure(text="Pause")
+            self.status_text.insert('end', "Resumed\n")
+        else:
+            control.pause()
+            self.pause_btn.configure(text="Resume")
+            self.status_text.insert('end', "Pausing after the current image...\n")
+    
+    def _cancel_processing(self):
+        """Cancel the active run after the current image"""
+        if self.worker:
+            self.worker.control.cancel()
+            self.cancel_btn.configure(state="disabled")
+            self.status_text.insert('end', "Cancelling after the current image...\n")
     
     def _clear_output(self):
         """Clear the status text output"""
@@ -881,6 +1175,8 @@ class UnifiedRunnerGUI(ctk.CTk):
 
     def _setup_watermark_position(self):
         """Set up the default watermark position that will be used for all images"""
+        if self._refuse_while_processing("set up the watermark"):
+            return
         if not os.path.exists(self.watermark_path):
             self.status_text.insert('end', "\n" + "="*50 + "\n")
             self.status_text.insert('end', "❌ ERROR: Please select a watermark file first\n")
@@ -927,6 +1223,8 @@ class UnifiedRunnerGUI(ctk.CTk):
             
     def _copy_settings_to_all(self, source_context: str):
         """Copy placement settings from one context to all others"""
+        if self._refuse_while_processing("copy settings"):
+            return
         try:
             if source_context not in self.context_settings:
                 self.status_text.insert('end', "\n" + "="*50 + "\n")
@@ -936,20 +1234,22 @@ class UnifiedRunnerGUI(ctk.CTk):
                 
             source_settings = self.context_settings[source_context]
             
-            # Apply to all unconfirmed contexts
-            for context, widgets in self.context_widgets.items():
-                if context != source_context and not widgets['confirmed']:
-                    # Copy settings but preserve context-specific info
-                    self.context_settings[context] = source_settings.copy()
-                    
-                    # Update button states
-                    widgets['confirmed'] = True
-                    widgets['confirm_btn'].configure(
-                        state="normal",
-                        text="CONFIRMED",
-                        fg_color="#2e8b57",  # Sea green color
-                        hover_color="#2e8b57"  # Disable hover effect
-                    )
+            # Apply to all unconfirmed contexts, saved to disk in one write
+            with self.placement_handler.settings.batch():
+                for context, widgets in self.context_widgets.items():
+                    if context != source_context and not widgets['confirmed']:
+                        # Each context gets its own copy, nested watermark included
+                        self.context_settings[context] = self.placement_handler.save_placement_settings(
+                            context, source_settings)
+                        
+                        # Update button states
+                        widgets['confirmed'] = True
+                        widgets['confirm_btn'].configure(
+                            state="normal",
+                            text="CONFIRMED",
+                            fg_color="#2e8b57",  # Sea green color
+                            hover_color="#2e8b57"  # Disable hover effect
+                        )
             
             self.status_text.insert('end', f"Successfully copied settings from {source_context} to all other contexts\n")
             self.status_text.insert('end', "⚠️ Remember to click 'Run Processing' to create the output files\n")
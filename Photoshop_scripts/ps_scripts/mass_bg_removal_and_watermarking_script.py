@@ -1,7 +1,16 @@
 from photoshop import Session
+import argparse
 import os
+import sys
 from datetime import date
-import time
+
+# Shared helpers live with the GUI scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GUI_scripts"))
+from ps_wait import PhotoshopWaiter
+from context_parser import extract_context
+from jpeg_encoder import get_profile
+from preset_registry import LEGACY_WATERMARK_PROPS, SCRIPT_REGISTRY, image_size, migrate_relative_watermark
+from run_journal import RunJournal, settings_hash
 # 
 
 
@@ -44,6 +53,9 @@ WATERMARK_FILE_PATH = "C:/Users/balma/Documents/ecommerce/lady cosmica/graphics-
 # TEMPLATE_PATH = "C:/Users/balma/Documents/ecommerce/lady cosmica/background listing templates/base-template.png"
 TEMPLATE_PATH = "C:/Users/balma/Documents/ecommerce/lady cosmica/background listing templates/base-template.png"
 
+# Output JPEG settings, see jpeg_encoder.PROFILES
+JPEG_PROFILE = "preview"
+
 #Create path for error log directory to store error logs
 ERROR_OUTPUT_LOG_DIR = os.path.join(os.getcwd(),"Photoshop_scripts/Error_Log_Dir")
 #Column headers for error log csv
@@ -117,35 +129,10 @@ def img_presets(context):
 
     
     """
-    context_1_front={
-        # RECORD TARGET POSITION AFTER RESIZE!!
-        'position':[612,34], #specify the target x and y, the arithmetic is handled in code later
-        'rotate':0, 
-        'size': [121.08,121.08], #size is percentage relative to 100%, where 100% is image at original full size
-        'opacity':100,
-    }
-    context_2_front={
-        'position':[574,77],
-        'rotate':0,
-        'size': [124.75,116.625],
-        'opacity':100,
-    }
-    front = {
-        'position':[404,-31],
-        'rotate':2.28,
-        'size': [124.875,125],
-        'opacity':100,
-    }
-    
-
-    if context =='context-1-front':
-        return context_1_front
-    elif context =='context-2-front':
-        return context_2_front
-    elif context =='front':
-        return front
-    # elif context =='back':
-    #     return back
+    # The presets live in preset_registry.SCRIPT_PRESETS, shared with the v2 script
+    placement = SCRIPT_REGISTRY.placement(context)
+    if placement:
+        return placement.as_settings()
     else:
         return "NONE" #if none returned, we dont have a defined preset match for this context
    
@@ -180,8 +167,8 @@ def img_type_eval(img_context):
 
 
     
-    # Find occurence of 'label' in img_context, create substring extracting only the filename
-    img_context_after_label = img_context[img_context.find('label')+6:-4]
+    # Extract the context after 'label=' (handles .jpeg/.png and names with no label)
+    img_context_after_label = extract_context(img_context)
     #Retrieve placement presets object for img context
     result_preset = img_presets(img_context_after_label)
     # print(result_preset.keys())
@@ -243,7 +230,8 @@ def get_watermark_props():
             N/a
 
         Returns:
-            watermark_props{} - hardcoded watermark placement props as object
+            WatermarkPlacement - absolute size (px) and position on the template, migrated from
+                                 the hand-recorded props in preset_registry.LEGACY_WATERMARK_PROPS
 
         Action:
             User must open a photoshop document and manually place the watermark at desired visual location
@@ -269,11 +257,10 @@ def get_watermark_props():
 
     """
 
-    watermark_props = {
-        'size':[373.875,373.875],
-        'opacity':22,
-        'position':[0,245] #MANUALLY CALCUALTE AND SPECIFY THE DELTA YOURSELF
-    }
+    # recorded as % of the placed watermark + a move from where it was placed (the document centre)
+    watermark_props = migrate_relative_watermark(
+        LEGACY_WATERMARK_PROPS, image_size(WATERMARK_FILE_PATH), image_size(TEMPLATE_PATH)
+    )
 
     return watermark_props
 
@@ -293,6 +280,41 @@ def get_watermark_props():
 # ::::::::::MAIN SECTION - SCRIPT FOR OPENING AND INTERACTING WITH PS  :::::::::: #
 
 
+#polls photoshop for the new layer instead of sleeping a fixed time after each place
+waiter = PhotoshopWaiter()
+
+#watermark placement is the same for every image - resolve it once
+watermark_props = get_watermark_props()
+
+parser = argparse.ArgumentParser(description="Remove backgrounds and watermark the product mockups under ROOT_PRODUCTS_DIR")
+parser.add_argument("--resume", action="store_true",
+                    help="Skip images an interrupted run with the same settings already finished")
+parser.add_argument("--retry-failed", action="store_true",
+                    help="Like --resume, but process the images that failed again")
+args = parser.parse_args()
+
+#same walk as the main section below: the first product folder only
+mockups = []
+for subdir,dirs,files in os.walk(ROOT_PRODUCTS_DIR):
+    if subdir == ROOT_PRODUCTS_DIR or subdir =='./ipynb_checkpoints':
+        continue
+    mockups = [(subdir, mockup_img) for mockup_img in files]
+    break
+
+#every finished image is journaled, so an interrupted run can be resumed
+journal = RunJournal.for_folder(ROOT_PRODUCTS_DIR)
+pending = set(journal.begin(
+    mockups,
+    settings_hash({
+        'template': TEMPLATE_PATH,
+        'watermark': WATERMARK_FILE_PATH,
+        'jpeg': JPEG_PROFILE,
+        'presets': SCRIPT_REGISTRY.as_settings()
+    }),
+    resume=args.resume,
+    retry_failed=args.retry_failed
+))
+
 with Session(TEMPLATE_PATH,action="open") as ps:
 
     # ps.app.preferences.rulerUnits = 1
@@ -333,6 +355,9 @@ with Session(TEMPLATE_PATH,action="open") as ps:
 
         # for each mockup image file in curr subdir
         for mockup_img in files:
+            #already finished by an earlier run (--resume / --retry-failed)
+            if (subdir, mockup_img) not in pending:
+                continue
             # print(mockup_img)
             product_img_path = os.path.join(subdir,mockup_img)
             product_img_path = product_img_path.replace("\\", "/")
@@ -348,15 +373,19 @@ with Session(TEMPLATE_PATH,action="open") as ps:
             if context_props == "NONE":
                 continue
 
+            #first failing block and the saved jpg, for the run journal
+            error = None
+            jpg = None
 
             # Import image section - WORKING 7/17
             try:# this section imports image as layer and places onto document
                 #  plc means to "place" an image
+                layers_before = len(ps.active_document.artLayers)
                 desc = ps.ActionDescriptor
                 desc.putPath(ps.app.charIDToTypeID("null"),product_img_path)
                 event_id = ps.app.charIDToTypeID("Plc ")  # `Plc` need one space in here.
                 ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
-                time.sleep(1.5)
+                waiter.for_layer_count(ps.active_document, layers_before + 1)
                 # TEMP TESTING - CHECKING ORIGINAL BOUNDS OF IMPORT
                 # removed_jpg_from_filename = mockup_img[:-4]
                 # img_layer = ps.active_document.artLayers.getByName(removed_jpg_from_filename)
@@ -371,6 +400,7 @@ with Session(TEMPLATE_PATH,action="open") as ps:
             except:
                 print(":::::Error in Import image Section:::::")
                 write_error_to_log(mockup_img,"-import img-","-Some problem")
+                error = error or "import img"
             
             
             # IMG CONTEXT EVAL - front,back,etc - WORKING 7/17
@@ -426,6 +456,7 @@ with Session(TEMPLATE_PATH,action="open") as ps:
                 pass
                 # print(":::::Error in Eval Img Context::::: ") 
                 write_error_to_log(mockup_img,"-IMG CONTEXT EVAL-","-Some problem \n")      
+                error = error or "img context eval"
             
             
             #BG REMOVAL OF IMG - WORKING 6/15
@@ -438,6 +469,7 @@ with Session(TEMPLATE_PATH,action="open") as ps:
 
                 print(e)
                 write_error_to_log(mockup_img,"-BG-REMOVAL-","-Some problem \n")
+                error = error or f"bg removal: {e}"
                 
             
             #WATERMARK LOAD IN AND PLACE - load,place,adjust opacity - WORKING 6/12
@@ -448,33 +480,39 @@ with Session(TEMPLATE_PATH,action="open") as ps:
                 event_id = ps.app.charIDToTypeID("Plc ")  # `Plc` need one space in here.
                 ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
 
-                watermark_props = get_watermark_props()
                 # #get watermark layer by name
                 watermark_layer = ps.active_document.artLayers.getByName("Lady-Cosmica-Watermark")
                 # print(watermark_layer.name)
 
-                # #resize watermark layer
-                w,h = watermark_props['size']
-                watermark_layer.resize(w,h)
+                # #resize watermark layer to its target size in px
+                bounds = watermark_layer.bounds
+                w,h = watermark_props.size
+                watermark_layer.resize(w / (bounds[2] - bounds[0]) * 100, h / (bounds[3] - bounds[1]) * 100)
                 
                 # # #adjust opacity
-                watermark_layer.opacity=watermark_props['opacity']
+                watermark_layer.opacity=watermark_props.opacity
                 
-                # #position watermark layer x,y from origin
-                #movements are relative to prev/origin position - so its origin + value =  new position
-                x_pos,y_pos = watermark_props['position']
-                watermark_layer.Translate(x_pos,y_pos)
+                # #move watermark layer so its top-left corner is at the target x,y
+                x_pos,y_pos = watermark_props.position
+                bounds = watermark_layer.bounds
+                watermark_layer.Translate(x_pos - bounds[0],y_pos - bounds[1])
                 
             except Exception as e:
                 write_error_to_log(mockup_img,"-WATERMARK-",e)    
+                error = error or f"watermark: {e}"
                 
 
             
             
             # # SAVE CURRENT DOCUMENT - WORKING 6/15
             try:
-                options = ps.JPEGSaveOptions(quality=5)
-                jpg = f"{watermarked_img_output_dir}/{mockup_img}-edit"
+                profile = get_profile(JPEG_PROFILE)
+                options = ps.JPEGSaveOptions(quality=profile.photoshop_quality)
+                options.formatOptions = profile.photoshop_format
+                if profile.progressive:
+                    options.scans = 3
+                #same naming as the GUI runner: <name>-processed.jpg
+                jpg = os.path.join(watermarked_img_output_dir, f"{os.path.splitext(mockup_img)[0]}-processed.jpg")
                 jpg_path = jpg.replace("\\", "/")
                 print("JPG NAME TO BE USED::" + jpg_path)
                 ps.active_document.saveAs(jpg, options, asCopy=True)
@@ -482,6 +520,8 @@ with Session(TEMPLATE_PATH,action="open") as ps:
                 print(f"Successfully saved to jpg: {jpg}")
             except:
                  write_error_to_log(mockup_img,"-SAVE-","-Some problem")
+                 error = error or "save"
+                 jpg = None
 
             # CLEAN UP AFTER SAVE SECTION - WORKING 6/15
             # remove watermark or resize watermark to original properties?
@@ -498,6 +538,8 @@ with Session(TEMPLATE_PATH,action="open") as ps:
 
             except:
                  write_error_to_log(mockup_img,"-CLEANUP-","-Some problem")
+
+            journal.record(subdir, mockup_img, jpg, error)
             
             
             # break For indiv img testing
@@ -505,6 +547,13 @@ with Session(TEMPLATE_PATH,action="open") as ps:
 
         break
 
+    journal.close()
+    print(journal.summary())
+
+    #per-step photoshop wait timings for this run
+    for line in waiter.profile.summary():
+        print(line)
+
 
 
 
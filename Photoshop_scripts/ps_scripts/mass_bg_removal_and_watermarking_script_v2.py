@@ -13,11 +13,19 @@ a 'watermarked_output' folder for each product's processed images.
 
 import os
 from datetime import date
-import time
 from photoshop import Session
 from typing import Dict, List, Tuple, Optional, Union
+import argparse
 import sys
 
+# Shared helpers live with the GUI scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GUI_scripts"))
+from ps_wait import PhotoshopWaiter
+from context_parser import extract_context
+from jpeg_encoder import get_profile
+from preset_registry import SCRIPT_REGISTRY
+from run_journal import RunJournal, settings_hash
+
 # Configuration
 class Config:
     """Central configuration for the script"""
@@ -26,6 +34,7 @@ class Config:
         self.ROOT_PRODUCTS_DIR = root_dir or "C:/Users/balma/Documents/ecommerce/lady cosmica/automation_testing_2"
         self.WATERMARK_FILE_PATH = "C:/Users/balma/Documents/ecommerce/lady cosmica/graphics-watermarks-backgrounds/Lady-Cosmica-Watermark.png"
         self.TEMPLATE_PATH = "C:/Users/balma/Documents/ecommerce/lady cosmica/background listing templates/base-template.png"
+        self.JPEG_PROFILE = get_profile("preview")  # See jpeg_encoder.PROFILES
         
         # Error logging setup
         self.ERROR_OUTPUT_LOG_DIR = os.path.join(os.getcwd(), "Photoshop_scripts/Error_Log_Dir")
@@ -36,42 +45,6 @@ class Config:
             f"{self.current_date}-Error Log.csv"
         )
 
-class ImagePresets:
-    """Manages image placement presets for different contexts"""
-    
-    @staticmethod
-    def get_preset(context: str) -> Optional[Dict]:
-        """
-        Get preset values for a specific image context.
-        
-        Args:
-            context: Image context (e.g., 'front', 'context-1-front')
-            
-        Returns:
-            Dictionary with preset values or None if context not found
-        """
-        presets = {
-            'context-1-front': {
-                'position': [612, 34],
-                'rotate': 0,
-                'size': [121.08, 121.08],
-                'opacity': 100,
-            },
-            'context-2-front': {
-                'position': [574, 77],
-                'rotate': 0,
-                'size': [124.75, 116.625],
-                'opacity': 100,
-            },
-            'front': {
-                'position': [404, -31],
-                'rotate': 2.28,
-                'size': [124.875, 125],
-                'opacity': 100,
-            }
-        }
-        return presets.get(context)
-
 class ErrorLogger:
     """Handles error logging functionality"""
     
@@ -100,6 +73,7 @@ class ImageProcessor:
     def __init__(self, config: Config, logger: ErrorLogger):
         self.config = config
         self.logger = logger
+        self.waiter = PhotoshopWaiter()
     
     @staticmethod
     def calculate_position_deltas(layer_bounds: List[float], target_x: float, target_y: float) -> Tuple[float, float]:
@@ -123,83 +97,118 @@ class ImageProcessor:
         return delta_x, delta_y
     
     @staticmethod
-    def extract_context(filename: str) -> str:
+    def extract_context(filename: str) -> Optional[str]:
         """Extract context from filename"""
-        try:
-            return filename[filename.find('label=')+6:-4]
-        except:
-            return ""
+        return extract_context(filename)
     
-    def process_image(self, ps: Session, image_path: str, output_dir: str):
-        """Process a single image"""
+    def process_image(self, ps: Session, image_path: str, output_dir: str) -> Tuple[Optional[str], Optional[str]]:
+        """Process a single image; returns (output path, error)"""
         try:
-            # Import image
-            desc = ps.ActionDescriptor
-            desc.putPath(ps.app.charIDToTypeID("null"), image_path)
-            ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
-            time.sleep(1.5)
-            
-            # Get image context and presets
+            # Get image context and presets before importing, so unmatched images cost nothing
             context = self.extract_context(os.path.basename(image_path))
-            preset = ImagePresets.get_preset(context)
+            preset = SCRIPT_REGISTRY.placement(context)
             
             if not preset:
                 self.logger.log_error(image_path, "PRESET", "No matching preset found")
-                return
+                return None, "No matching preset found"
+            
+            # Import image
+            layers_before = len(ps.active_document.artLayers)
+            desc = ps.ActionDescriptor
+            desc.putPath(ps.app.charIDToTypeID("null"), image_path)
+            ps.app.executeAction(ps.app.charIDToTypeID("Plc "), desc)
+            self.waiter.for_layer_count(ps.active_document, layers_before + 1)
                 
             # Apply presets
             img_layer = ps.active_document.activeLayer
             
             # Resize
-            img_layer.resize(preset['size'][0], preset['size'][1])
+            img_layer.resize(preset.size[0], preset.size[1])
             
             # Position
             bounds = img_layer.bounds
-            dx, dy = self.calculate_position_deltas(bounds, *preset['position'])
+            dx, dy = self.calculate_position_deltas(bounds, *preset.position)
             img_layer.translate(dx, dy)
             
             # Rotate
-            if preset['rotate']:
-                img_layer.rotate(preset['rotate'])
+            if preset.rotate:
+                img_layer.rotate(preset.rotate)
                 
             # Set opacity
-            img_layer.opacity = preset['opacity']
+            img_layer.opacity = preset.opacity
             
             # Save
-            output_path = os.path.join(output_dir, f"{os.path.basename(image_path)}-edit")
-            options = ps.JPEGSaveOptions(quality=5)
+            output_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(image_path))[0]}-processed.jpg")
+            profile = self.config.JPEG_PROFILE
+            options = ps.JPEGSaveOptions(quality=profile.photoshop_quality)
+            options.formatOptions = profile.photoshop_format
+            if profile.progressive:
+                options.scans = 3
             ps.active_document.saveAs(output_path, options, asCopy=True)
             
             # Cleanup
             img_layer.remove()
+            return output_path, None
             
         except Exception as e:
             self.logger.log_error(image_path, "PROCESSING", str(e))
+            return None, str(e)
 
 def main():
-    # Get root directory from command line if provided
-    root_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    parser = argparse.ArgumentParser(description="Place product mockups on the template and watermark them")
+    parser.add_argument("root_dir", nargs="?", help="Folder of product folders (defaults to Config.ROOT_PRODUCTS_DIR)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip images an interrupted run with the same settings already finished")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Like --resume, but process the images that failed again")
+    args = parser.parse_args()
     
     # Initialize
-    config = Config(root_dir)
+    config = Config(args.root_dir)
     logger = ErrorLogger(config)
     processor = ImageProcessor(config, logger)
     
+    files_to_process = []
+    for root, dirs, files in os.walk(config.ROOT_PRODUCTS_DIR):
+        # Earlier outputs are not inputs
+        dirs[:] = [d for d in dirs if d != "watermarked_output"]
+        for file in files:
+            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
+                files_to_process.append((root, file))
+    
+    # Every finished image is journaled, so an interrupted run can be resumed
+    journal = RunJournal.for_folder(config.ROOT_PRODUCTS_DIR)
+    files_to_process = journal.begin(
+        files_to_process,
+        settings_hash({
+            'template': config.TEMPLATE_PATH,
+            'jpeg': config.JPEG_PROFILE.name,
+            'presets': SCRIPT_REGISTRY.as_settings()
+        }),
+        resume=args.resume,
+        retry_failed=args.retry_failed
+    )
+    
     # Process images
-    with Session(config.TEMPLATE_PATH, action="open") as ps:
-        ps.app.displayDialogs = ps.DialogModes.DisplayNoDialogs
-        
-        for root, dirs, files in os.walk(config.ROOT_PRODUCTS_DIR):
-            # Create output directory
-            output_dir = os.path.join(root, "watermarked_output")
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+    try:
+        with Session(config.TEMPLATE_PATH, action="open") as ps:
+            ps.app.displayDialogs = ps.DialogModes.DisplayNoDialogs
             
-            # Process each image
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    image_path = os.path.join(root, file)
-                    processor.process_image(ps, image_path, output_dir)
+            for root, file in files_to_process:
+                # Create output directory
+                output_dir = os.path.join(root, "watermarked_output")
+                if not os.path.exists(output_dir):
+                    os.makedirs(output_dir)
+                
+                output_path, error = processor.process_image(ps, os.path.join(root, file), output_dir)
+                journal.record(root, file, output_path, error)
+    finally:
+        journal.close()
+        print(journal.summary())
+    
+    # Per-step Photoshop wait timings for this run
+    for line in processor.waiter.profile.summary():
+        print(line)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file